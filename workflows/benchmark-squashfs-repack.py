@@ -0,0 +1,195 @@
+#!/usr/bin/python3
+#
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Benchmark for tools/squashfs_repack. Applies the changes done in CI, a new
+# manifest and changelog and a removed file, to a snap with Repack and with
+# unsquashfs followed by 'snap pack', and reports the time of each and the
+# size of the results, after checking that both have the same files. Without
+# a snap in the command line, one with random files is generated. The
+# unsquashfs and 'snap pack' path is skipped if the tools are not installed,
+# mksquashfs can be used instead of 'snap pack' with --mksquashfs.
+
+import argparse
+import hashlib
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from tools import squashfs
+from tools import squashfs_repack
+
+# Options used by 'snap pack' to call mksquashfs
+SNAP_PACK_OPTIONS = ['-noappend', '-comp', 'xz', '-no-fragments',
+                     '-no-progress', '-all-root', '-no-xattrs']
+WORDS = [''.join(random.Random(i).choices('abcdefghijklmnop', k=1 + i % 9))
+         for i in range(2000)]
+
+
+def eprint(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+
+# Write a tree like the one of a snap with about size_mib MiB of files
+def make_tree(root_d, size_mib, seed):
+    rand = random.Random(seed)
+    os.makedirs(os.path.join(root_d, 'meta'))
+    with open(os.path.join(root_d, 'meta', 'snap.yaml'), 'w') as yaml_f:
+        yaml_f.write('name: benchmark\nversion: "1.0"\nsummary: Benchmark\n'
+                     'description: Benchmark snap\n')
+    os.makedirs(os.path.join(root_d, 'snap'))
+    with open(os.path.join(root_d, 'snap', 'manifest.yaml'), 'w') as man_f:
+        man_f.write(''.join('  - pkg{}=1.{}\n'.format(i, i)
+                            for i in range(20000)))
+    with open(os.path.join(root_d, 'snap', 'unstage.txt'), 'w') as txt_f:
+        txt_f.write('pkg1\npkg2\n')
+    written = 0
+    i = 0
+    while written < size_mib * 1024 * 1024:
+        dir_d = os.path.join(root_d, 'usr', 'lib', 'lib{}'.format(i // 200))
+        os.makedirs(dir_d, exist_ok=True)
+        size = rand.randint(0, 60000)
+        # Part text, part binary, so it compresses like libraries
+        text = ' '.join(rand.choices(WORDS, k=size // 6)).encode()
+        with open(os.path.join(dir_d, 'f{}'.format(i)), 'wb') as file_f:
+            file_f.write(text[:size] + rand.randbytes(size // 4))
+        written += size + size // 4
+        i += 1
+
+
+def make_changes(tmp_d):
+    """ Return the changes as (source, path in snap) pairs """
+    manifest_p = os.path.join(tmp_d, 'manifest.yaml')
+    with open(manifest_p, 'w') as man_f:
+        man_f.write(''.join('  - pkg{}=2.{}\n'.format(i, i)
+                            for i in range(20000)))
+    changelog_p = os.path.join(tmp_d, 'ChangeLog')
+    with open(changelog_p, 'w') as changelog_f:
+        changelog_f.write('  * New changelog entry\n' * 1000)
+    return [(manifest_p, 'snap/manifest.yaml'),
+            (changelog_p, 'usr/share/doc/benchmark/ChangeLog'),
+            (None, 'snap/unstage.txt')]
+
+
+def repack(snap_p, out_p, changes):
+    squashfs_repack.repack_file(snap_p, out_p, changes)
+
+
+def unsquashfs_and_pack(snap_p, out_p, changes, tmp_d, use_mksquashfs):
+    root_d = os.path.join(tmp_d, 'squashfs-root')
+    subprocess.run(['unsquashfs', '-q', '-n', '-d', root_d, snap_p],
+                   stdout=subprocess.DEVNULL, check=True)
+    for source, path in changes:
+        dest = os.path.join(root_d, path)
+        if source is None:
+            os.remove(dest)
+        else:
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            shutil.copyfile(source, dest)
+    if use_mksquashfs:
+        subprocess.run(['mksquashfs', root_d, out_p] + SNAP_PACK_OPTIONS,
+                       stdout=subprocess.DEVNULL, check=True)
+    else:
+        subprocess.run(['snap', 'pack', root_d, '--filename=' + out_p],
+                       stdout=subprocess.DEVNULL, check=True)
+    shutil.rmtree(root_d)
+
+
+# Returns the digests of the regular files in an image, by path
+def digests(image_p):
+    result = {}
+    with squashfs.SquashFS.open(image_p) as image:
+        def walk(inode, path):
+            for entry in image.iter_dir(inode):
+                child = image.read_inode(entry.inode_ref)
+                child_path = path + os.fsdecode(entry.name)
+                if child.type == squashfs.DIR:
+                    walk(child, child_path + '/')
+                elif child.type == squashfs.FILE:
+                    digest = hashlib.sha256()
+                    for data in image.iter_inode_data(child):
+                        digest.update(data)
+                    result[child_path] = digest.hexdigest()
+        walk(image.root_inode(), '')
+    return result
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare Repack with unsquashfs and snap pack')
+    parser.add_argument('snap', nargs='?',
+                        help='snap to change, by default one is generated')
+    parser.add_argument('--size', type=int, default=200,
+                        help='MiB of files in the generated snap')
+    parser.add_argument('--mksquashfs', action='store_true',
+                        help='use mksquashfs with the options of snap pack '
+                        'instead of snap pack')
+    args = parser.parse_args()
+
+    pack_tool = 'mksquashfs' if args.mksquashfs else 'snap'
+    with tempfile.TemporaryDirectory() as tmp_d:
+        snap_p = args.snap
+        if snap_p is None:
+            if shutil.which('mksquashfs') is None:
+                eprint('mksquashfs is needed to generate a snap')
+                return 1
+            root_d = os.path.join(tmp_d, 'generated')
+            make_tree(root_d, args.size, 0)
+            snap_p = os.path.join(tmp_d, 'generated.snap')
+            subprocess.run(['mksquashfs', root_d, snap_p] +
+                           SNAP_PACK_OPTIONS,
+                           stdout=subprocess.DEVNULL, check=True)
+            shutil.rmtree(root_d)
+        changes = make_changes(tmp_d)
+        print('snap: {} ({:.1f} MiB)'.format(
+            snap_p, os.path.getsize(snap_p) / (1024 * 1024)))
+
+        repack_p = os.path.join(tmp_d, 'repack.snap')
+        seconds = timed(repack, snap_p, repack_p, changes)
+        print('{:<28} {:>8.2f}s {:>10.1f} MiB'.format(
+            'Repack', seconds, os.path.getsize(repack_p) / (1024 * 1024)))
+
+        if shutil.which('unsquashfs') is None or \
+                shutil.which(pack_tool) is None:
+            eprint('unsquashfs or {} not found, skipping them'.format(
+                pack_tool))
+            return 0
+        pack_p = os.path.join(tmp_d, 'pack.snap')
+        seconds = timed(unsquashfs_and_pack, snap_p, pack_p, changes, tmp_d,
+                        args.mksquashfs)
+        print('{:<28} {:>8.2f}s {:>10.1f} MiB'.format(
+            'unsquashfs + ' + ('mksquashfs' if args.mksquashfs
+                               else 'snap pack'),
+            seconds, os.path.getsize(pack_p) / (1024 * 1024)))
+
+        if digests(repack_p) != digests(pack_p):
+            eprint('Repack and {} produced different files'.format(
+                pack_tool))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,296 @@
+#!/usr/bin/python3
+#
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Benchmark for tools/yaml_utils. Loads and dumps small, medium and huge
+# generated snapcraft manifests, plus any manifest given in the command
+# line, with the ordered and the fast modes. For each case it reports the
+# best load and dump times and the peak memory, and it checks that both
+# modes produce the same output. Results can be saved as JSON and compared
+# with a previous run to catch regressions.
+#
+# With --manifest, it benchmarks instead reading the package versions with
+# tools/manifest, from the generated manifests and dpkg.yaml files of bases
+# with as many packages as primed-stage-packages. The modes are the pure
+# Python yaml.safe_load used before tools/manifest, tools/manifest without
+# a cache and with a warm MANIFEST_CACHE_DIR. Manifests given in the command
+# line named dpkg.yaml are read as those of bases.
+
+import argparse
+import gc
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import yaml
+
+from tools import manifest
+from tools import yaml_utils
+
+# name: (number of parts, stage-packages per part, primed-stage-packages)
+SIZES = {
+    'small': (1, 20, 20),
+    'medium': (20, 100, 1500),
+    'huge': (200, 300, 20000),
+}
+
+MODES = ('ordered', 'fast')
+MANIFEST_MODES = ('safe_load', 'libyaml', 'cached')
+
+
+def eprint(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+
+# Build a manifest similar to the ones created by snapcraft
+def make_manifest(n_parts, n_staged, n_primed):
+    parts = {}
+    for i in range(n_parts):
+        parts['part{}'.format(i)] = {
+            'build-packages': ['build-dep{}=1.{}'.format(j, j)
+                               for j in range(10)],
+            'installed-snaps': ['core22=1234'],
+            'plugin': 'nil',
+            'source': 'https://git.launchpad.net/part{}'.format(i),
+            'source-commit': '{:040x}'.format(i),
+            'stage-packages': ['lib{}-{}=2:1.{}-1ubuntu{}'.format(i, j, j, i)
+                               for j in range(n_staged)],
+            'uname': 'Linux lcy02 5.15.0-91-generic\n#101-Ubuntu SMP x86_64',
+        }
+    return {
+        'name': 'benchmark',
+        'version': '1.0',
+        'summary': 'Benchmark snap',
+        'description': 'A snap for benchmarks.\n\nIt has many packages.\n',
+        'grade': 'stable',
+        'confinement': 'strict',
+        'build-snaps': [],
+        'parts': parts,
+        'primed-stage-packages': ['pkg{}=1.{}'.format(i, i)
+                                  for i in range(n_primed)],
+    }
+
+
+# Build a dpkg.yaml like the ones of bases
+def make_dpkg(n_packages):
+    return {'packages': ['pkg{}:amd64=1.{}'.format(i, i)
+                         for i in range(n_packages)]}
+
+
+def load(path, fast):
+    return yaml_utils.load_yaml_file(path, fast=fast)
+
+
+def dump(data, fast):
+    out = io.StringIO()
+    yaml_utils.dump(data, stream=out, fast=fast)
+    return out.getvalue()
+
+
+def best_time(func, repeat):
+    best = None
+    for _ in range(repeat):
+        # Do not count garbage from previous runs
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def peak_memory(func):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+# Returns the results for one manifest, as
+# {mode: {'load_s': float, 'dump_s': float, 'peak_bytes': int}}
+def bench_manifest(path, repeat):
+    results = {}
+    outputs = {}
+    for mode in MODES:
+        fast = mode == 'fast'
+        data = load(path, fast)
+        outputs[mode] = dump(data, fast)
+        results[mode] = {
+            'load_s': best_time(lambda: load(path, fast), repeat),
+            'dump_s': best_time(lambda: dump(data, fast), repeat),
+            'peak_bytes': peak_memory(lambda: dump(load(path, fast), fast)),
+        }
+    if outputs['ordered'] != outputs['fast']:
+        raise RuntimeError('different output for ordered and fast modes')
+    return results
+
+
+# Returns the package versions of a manifest, kind is 'manifest' or 'dpkg'
+def read_versions(path, kind, mode, cache_d):
+    if mode == 'safe_load':
+        with open(path) as in_f:
+            doc = yaml.safe_load(in_f)
+        if kind == 'dpkg':
+            return manifest.package_versions(doc['packages'])
+        parts = {part: manifest.package_versions(part_y['stage-packages'])
+                 for part, part_y in doc['parts'].items()}
+        primed = doc.get('primed-stage-packages')
+        return manifest.Manifest(
+            parts, None if primed is None else
+            manifest.package_versions(primed)).primed_versions()
+    if mode != 'cached':
+        cache_d = None
+    if kind == 'dpkg':
+        return manifest.load_dpkg_packages(path, cache_d)
+    return manifest.load_manifest(path, cache_d).primed_versions()
+
+
+# Returns the results for reading the versions of one manifest, as
+# {mode: {'load_s': float, 'peak_bytes': int}}
+def bench_versions(path, kind, repeat, cache_d):
+    results = {}
+    outputs = {}
+    for mode in MANIFEST_MODES:
+        # Also fills the cache for the cached mode
+        outputs[mode] = read_versions(path, kind, mode, cache_d)
+        results[mode] = {
+            'load_s': best_time(
+                lambda: read_versions(path, kind, mode, cache_d), repeat),
+            'peak_bytes': peak_memory(
+                lambda: read_versions(path, kind, mode, cache_d)),
+        }
+    for mode in MANIFEST_MODES[1:]:
+        if outputs[mode] != outputs['safe_load']:
+            raise RuntimeError('different versions with ' + mode)
+    return results
+
+
+# Returns a list of regression descriptions
+def compare(results, baseline, tolerance):
+    regressions = []
+    for case, modes in results.items():
+        for mode, metrics in modes.items():
+            base = baseline.get(case, {}).get(mode)
+            if base is None:
+                continue
+            for metric, value in metrics.items():
+                old = base.get(metric)
+                if old and value > old * (1 + tolerance):
+                    regressions.append('{} {} {}: {:.4g} -> {:.4g}'.format(
+                        case, mode, metric, old, value))
+    return regressions
+
+
+def print_results(results):
+    print('{:<20} {:<9} {:>10} {:>10} {:>12}'.format(
+        'case', 'mode', 'load (s)', 'dump (s)', 'peak (MiB)'))
+    for case, modes in results.items():
+        for mode, m in modes.items():
+            # There is no dump in --manifest mode
+            dump_s = '-' if 'dump_s' not in m else \
+                '{:.4f}'.format(m['dump_s'])
+            print('{:<20} {:<9} {:>10.4f} {:>10} {:>12.2f}'.format(
+                case, mode, m['load_s'], dump_s,
+                m['peak_bytes'] / (1024 * 1024)))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark load and dump of manifests with yaml_utils')
+    parser.add_argument('manifests', nargs='*',
+                        help='additional manifests to benchmark')
+    parser.add_argument('--sizes', default=','.join(SIZES),
+                        help='comma separated generated manifest sizes, ' +
+                        'from ' + ', '.join(SIZES) + ' (default: all)')
+    parser.add_argument('--manifest', action='store_true',
+                        help='benchmark reading package versions with '
+                        'tools/manifest instead')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='runs per measure, the best one is reported')
+    parser.add_argument('--save', metavar='PATH',
+                        help='write the results as JSON to PATH')
+    parser.add_argument('--baseline', metavar='PATH',
+                        help='JSON results of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed relative increase over the baseline')
+    args = parser.parse_args()
+
+    sizes = [s for s in args.sizes.split(',') if s != '']
+    for size in sizes:
+        if size not in SIZES:
+            eprint('Unknown size', size)
+            return 1
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_d:
+        cases = []
+        for size in sizes:
+            path = os.path.join(tmp_d, size + '.yaml')
+            with open(path, 'w') as manifest_f:
+                yaml_utils.dump(make_manifest(*SIZES[size]),
+                                stream=manifest_f)
+            cases.append((size, path, 'manifest'))
+            if args.manifest:
+                path = os.path.join(tmp_d, size + '-dpkg.yaml')
+                with open(path, 'w') as dpkg_f:
+                    yaml_utils.dump(make_dpkg(SIZES[size][2]), stream=dpkg_f)
+                cases.append((size + '-dpkg', path, 'dpkg'))
+        cases += [(os.path.basename(p), p,
+                   'dpkg' if os.path.basename(p) == 'dpkg.yaml'
+                   else 'manifest') for p in args.manifests]
+
+        cache_d = os.path.join(tmp_d, 'cache')
+        # Without a cache directory tools/manifest would use this one
+        os.environ.pop('MANIFEST_CACHE_DIR', None)
+        for case, path, kind in cases:
+            try:
+                if args.manifest:
+                    results[case] = bench_versions(path, kind, args.repeat,
+                                                   cache_d)
+                else:
+                    results[case] = bench_manifest(path, args.repeat)
+            except RuntimeError as ex:
+                eprint(case + ':', ex)
+                return 1
+
+    print_results(results)
+
+    if args.save:
+        with open(args.save, 'w') as save_f:
+            json.dump(results, save_f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_f:
+            baseline = json.load(baseline_f)
+        regressions = compare(results, baseline, args.tolerance)
+        if len(regressions) > 0:
+            eprint('Regressions over', args.baseline + ':')
+            for r in regressions:
+                eprint('  ' + r)
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,25 +1,27 @@
 #!/usr/bin/python3
 
 import apt_pkg
+import asyncio
 import gzip
 import json
 import logging
 import os
 import re
-import socket
 import subprocess
 import sys
 import tempfile
-import time
-import urllib.request
-import yaml
 
 from argparse import ArgumentParser
 from datetime import datetime
 from debian import deb822
-from launchpadlib.launchpad import Launchpad
 
 import se_utils
+from se_utils import artifact_store
+from se_utils import lp_client
+from se_utils import transport
+from tools import manifest
+from tools import manifest_diff
+from tools import squashfs
 
 
 SNAP_API = \
@@ -38,6 +40,8 @@ SNAP_FIPS_API = \
 SNAP_API_CORE26_RISCV = 'https://api.launchpad.net/devel/~ubuntu-core-service/+snap/core26-riscv64'
 SNAP_CLOUD_INIT_API_CORE26_RISCV = \
     'https://api.launchpad.net/devel/~ubuntu-core-service/+snap/core26-riscv64-cloud-init'
+# Timeout in seconds for archive downloads
+ARCHIVE_TIMEOUT = 60
 
 
 _logger = logging.getLogger('ubuntu-image')
@@ -91,32 +95,41 @@ def check_packages_changed(core_series, build_variant):
     # differences in packages primed in bases depending on arches.
     changed = False
     with tempfile.TemporaryDirectory() as base_tmpd:
-        # Download edge snap, extract manifest
+        # Extract manifest from edge snap
         base = 'core{}'.format(core_series)
         channel = 'latest/edge'
         if build_variant == "cloud-init":
             channel = 'cloud-init/edge'
         elif build_variant == "fips":
             channel = 'fips-updates/edge'
-        subprocess.run(['snap', 'download', '--channel=' + channel, '--basename', base,
-                        '--target-directory', base_tmpd, base], check=True)
-        sq_d = os.path.join(base_tmpd, base)
-        base_p = os.path.join(base_tmpd, base + '.snap')
-
         if core_version >= 26:
             dpkg_sq_p = 'var/lib/chisel/manifest.wall'
         else:
             dpkg_sq_p = 'usr/share/snappy/dpkg.yaml'
-
-        dpkg_p = os.path.join(sq_d, dpkg_sq_p)
-        subprocess.run(['unsquashfs', '-d', sq_d, base_p, dpkg_sq_p],
-                       check=True, stdout=subprocess.DEVNULL)
+        dpkg_p = os.path.join(base_tmpd, os.path.basename(dpkg_sq_p))
+
+        # Only the blocks of the file are fetched, if the store allows it
+        store = artifact_store.ArtifactStore.from_env()
+        url_pool = transport.get_transport()
+        try:
+            base_snap = artifact_store.open_store_snap(
+                store, url_pool, base, channel, 'amd64')
+        except squashfs.SquashFSError as ex:
+            print('Cannot read {} remotely ({}), downloading it'.format(
+                base, ex))
+            base_p = artifact_store.fetch_store_snap(
+                store, url_pool, base, channel, 'amd64', base_tmpd)
+            base_snap = squashfs.SquashFS.open(base_p) if base_p else None
+        if base_snap is None:
+            raise Exception('{} is not published in {}'.format(base, channel))
+        with base_snap:
+            base_snap.extract(dpkg_sq_p, dpkg_p)
 
         # Load manifest
         if core_version >= 26:
-            # For wall, recreate a list of "package=version" as in dpkg.yaml.
+            # For wall, recreate a map of package to version as in dpkg.yaml.
             # We can ignore the architecture as in the end we do not use it.
-            dpkg = {'packages': []}
+            dpkg_v = {}
             p = subprocess.run(['zstdcat', dpkg_p], stdout=subprocess.PIPE, check=True)
             for line in p.stdout.decode('utf-8').splitlines():
                 if not line.strip():
@@ -125,10 +138,9 @@ def check_packages_changed(core_series, build_variant):
                 if record.get('kind') == 'package':
                     pkg_name = record.get('name')
                     if 'version' in record:
-                        dpkg['packages'].append(pkg_name + '=' + record['version'])
+                        dpkg_v[pkg_name] = record['version']
         else:
-            with open(dpkg_p, 'r') as dpkg_f:
-                dpkg = yaml.safe_load(dpkg_f)
+            dpkg_v = manifest.load_dpkg_packages(dpkg_p)
 
         # Download archive/esm packages files
         series = series_map.get(core_series)
@@ -178,45 +190,48 @@ def check_packages_changed(core_series, build_variant):
         snap2version = {}
         for i, url in enumerate(urls):
             pkg_file = os.path.join(base_tmpd, pkg_files[i])
-            tries = 3
-            for i in range(tries):
-                try:
-                    print('downloading {}'.format(url))
-                    urllib.request.urlretrieve(url, pkg_file)
-                    break
-                except Exception as e:
-                    if i == tries - 1:
-                        raise e
-                    print('while downloading: ' + str(e) + ' - retrying')
+            print('downloading {}'.format(url))
+            # Archive downloads can be a bit flaky, use a short timeout so
+            # we do not need to wait too much to do a retry.
+            response = url_pool.download(url, pkg_file,
+                                         timeout=ARCHIVE_TIMEOUT)
+            if response.status != 200:
+                raise Exception('downloading {} failed with status {}'.format(
+                    url, response.status))
             package_versions_from_file(pkg_file, snap2version)
 
         # On 20 and 22 these packages are built by the snap and not pulled from
         # the archive.
         built_by_snap = ['console-conf', 'probert-common',
                          'probert-network', 'subiquitycore']
-        # Look out for changes. We could return on first change, but we'll
-        # print all changes for the moment for debugging purposes.
-        for pkg in dpkg['packages']:
-            [pkgName, pkgVersion] = pkg.split('=')
-            # pkgName can have a :<arch> suffix, like :amd64 or :i386. The few
-            # i386 packages that are in the manifest are also present as amd64
-            # packages, so we do not worry with filtering.
+        # pkgName can have a :<arch> suffix, like :amd64 or :i386. The few
+        # i386 packages that are in the manifest are also present as amd64
+        # packages, so we do not worry with filtering.
+        base_v = []
+        for pkgName, pkgVersion in dpkg_v.items():
             pkgName = pkgName.split(':')[0]
             if pkgName in built_by_snap and (
                     core_version == 20 or core_version == 22):
                 continue
-            if pkgName not in snap2version:
+            base_v.append((pkgName, pkgVersion))
+        base_v.sort()
+
+        # Look out for changes. We could return on first change, but we'll
+        # print all changes for the moment for debugging purposes.
+        for record in manifest_diff.diff_versions(
+                base_v, snap2version, compare=apt_pkg.version_compare):
+            if record.kind == manifest_diff.REMOVED:
                 print('unexpected error, package {} from {} '
-                      'not found in the archive'.format(pkgName, base))
+                      'not found in the archive'.format(record.name, base))
                 # sys.exit(1)
                 # unfortunately for FIPS builds some packages are missing from the
                 # archive (as they are in private PPAs), so we cannot error out
                 # TODO: remove this exception when we have added support for retrieving
                 # the FIPS PPA package list
-                continue
-            if apt_pkg.version_compare(pkgVersion, snap2version[pkgName]) < 0:
+            elif record.kind == manifest_diff.UPGRADED:
                 print('change in {}: {} package version updated ({} -> {})'.
-                      format(base, pkgName, pkgVersion, snap2version[pkgName]))
+                      format(base, record.name, record.old_version,
+                             record.new_version))
                 changed = True
 
     return changed
@@ -271,27 +286,30 @@ def get_build_tag(branch, build_variant):
     return today + '_' + branch + '+' + build_variant
 
 
-def is_build_running(snap):
-    if len(snap.pending_build_requests) > 0:
+async def is_build_running(lp, snap):
+    pending_requests, pending_builds = await asyncio.gather(
+        lp.collection(snap['pending_build_requests_collection_link']),
+        lp.collection(snap['pending_builds_collection_link']))
+    if len(pending_requests) > 0:
         print('A {} snap build request is pending, skipping.'.format(
-            snap.name))
+            snap['name']))
         return True
-    for build in snap.pending_builds:
-        if build.buildstate in ('Needs building', 'Currently building'):
+    for build in pending_builds:
+        if build['buildstate'] in ('Needs building', 'Currently building'):
             print('A {} snap build is in progress.'.format(
-                snap.name))
+                snap['name']))
             return True
     print('No {} snap build pending or currently running.'.format(
-        snap.name))
+        snap['name']))
     return False
 
 
-# builds is a collection of snap_build objects
-def download_snaps(lp, builds, output_dir):
-    for b in builds.entries:
-        if not se_utils.download_snap_build(lp, b['self_link'], output_dir):
-            return False
-    return True
+# builds is a list of snap_build entries
+async def download_snaps(lp, builds, output_dir):
+    downloaded = await asyncio.gather(
+        *[se_utils.download_snap_build(lp, b['self_link'], output_dir)
+          for b in builds])
+    return all(downloaded)
 
 
 def remove_tag(tag):
@@ -303,7 +321,7 @@ def remove_tag(tag):
 # Builds the riscv64 variant for core26, that has an extra assumes in
 # snapcraft.yaml. This is a workaround for LP#2150052 and should be removed
 # after snapd 2.75 is SRUed.
-def handle_riscv_build(lp, build_variant, output_dir):
+async def handle_riscv_build(lp, build_variant, output_dir):
     # core26 will include cloud-init only if the LP recipe name finishes with
     # "-cloud-init". We also use different branches in the recipes, but that is
     # only to avoid a possible race condition if both regular and cloud-init
@@ -340,35 +358,36 @@ def handle_riscv_build(lp, build_variant, output_dir):
     subprocess.run(['git', 'commit', '-m', 'Enable riscv64 specific assumes'], check=True)
     subprocess.run(['git', 'push', '--force', 'origin', riscv_branch], check=True)
 
-    return build_and_download(lp, recipe, output_dir)
+    return await build_and_download(lp, recipe, output_dir)
 
 
 # Builds in lp the snap recipe and downloads the built snaps to output_dir.
 # Returns success of the operation.
-def build_and_download(lp, recipe, output_dir):
+async def build_and_download(lp, recipe, output_dir):
     print('building snap recipe', recipe)
-    snap = lp.load(recipe)
+    snap = await lp.load(recipe)
     # Move on only if the snap is not building already
-    if is_build_running(snap):
+    if await is_build_running(lp, snap):
         print('previous build is still running!!')
         return False
 
     # We use all the defaults of the snap recipe
-    request = snap.requestBuilds(
-        archive=snap.auto_build_archive_link,
-        pocket=snap.auto_build_pocket,
-        channels=snap.auto_build_channels)
+    request = await lp.request_builds(
+        snap,
+        archive=snap['auto_build_archive_link'],
+        pocket=snap['auto_build_pocket'],
+        channels=snap['auto_build_channels'])
 
     # Wait for the builds to be launched
-    print('builds requested:', request.builds_collection_link)
+    print('builds requested:', request['builds_collection_link'])
     while True:
         # We always want a first reload as initial status is always Pending
-        request = lp.load(request.self_link)
-        if request.status == 'Pending':
-            time.sleep(10)
+        request = await lp.load(request['self_link'])
+        if request['status'] == 'Pending':
+            await asyncio.sleep(10)
             continue
 
-        if request.status == 'Failed':
+        if request['status'] == 'Failed':
             print('Cannot start builds, request failed')
             return False
         # Must be 'Completed'
@@ -377,9 +396,9 @@ def build_and_download(lp, recipe, output_dir):
 
     # Waiting for the builds to finish
     while True:
-        builds = lp.load(request.builds_collection_link)
+        builds = await lp.collection(request['builds_collection_link'])
         wait = False
-        for b in builds.entries:
+        for b in builds:
             if b['buildstate'] in ['Needs building',
                                    'Dependency wait',
                                    'Currently building',
@@ -391,20 +410,29 @@ def build_and_download(lp, recipe, output_dir):
 
         # Poll once per minute
         if wait:
-            time.sleep(60)
+            await asyncio.sleep(60)
             continue
 
         # No build pending
         break
 
     # Check state
-    for b in builds.entries:
+    for b in builds:
         if b['buildstate'] != 'Successfully built':
             print('Error for {}: {} ({})'.format(
                 b['title'], b['buildstate'], b['web_link']))
             return False
 
-    return download_snaps(lp, builds, output_dir)
+    return await download_snaps(lp, builds, output_dir)
+
+
+async def build_snaps(lp, recipe, core_series, build_variant, output_dir):
+    if not await build_and_download(lp, recipe, output_dir):
+        return False
+    if core_series == '26':
+        if not await handle_riscv_build(lp, build_variant, output_dir):
+            return False
+    return True
 
 
 def main():
@@ -436,26 +464,19 @@ def main():
         args.lp_credentials = os.path.expanduser(args.lp_credentials)
 
     if args.dry_run:
-        lp = Launchpad.login_anonymously(
-            'core-builder', 'production', version='devel')
+        lp = lp_client.AsyncLaunchpad.login_anonymously('core-builder')
     else:
-        def login_f(creds_f):
-            return Launchpad.login_with(
-                'core-builder', 'production', version='devel',
-                credentials_file=creds_f)
         creds_env = os.environ.get("LP_CREDENTIALS")
         if creds_env and creds_env != '':
             _logger.debug("using credentials from LP_CREDENTIALS env var")
-            with tempfile.NamedTemporaryFile() as credential_store_path:
-                credential_store_path.write(creds_env.encode("utf-8"))
-                credential_store_path.flush()
-                lp = login_f(credential_store_path.name)
+            lp = lp_client.AsyncLaunchpad(
+                lp_client.Credentials.from_string(creds_env))
         else:
             _logger.debug("no LP_CREDENTIALS environment variable")
             if not os.path.exists(args.lp_credentials):
                 print('Credentials not found, no LP_CREDENTIALS var or file')
                 sys.exit(1)
-            lp = login_f(args.lp_credentials)
+            lp = lp_client.AsyncLaunchpad.login(args.lp_credentials)
 
     print('Checking core{}'.format(args.core_series))
 
@@ -477,10 +498,6 @@ def main():
 
     recipe = recipe_tmpl.format(args.core_series)
 
-    # Archive downloads can be a bit flaky, use a timeout so we do not need to
-    # wait too much to do a retry. See check_packages_changed retry code.
-    socket.setdefaulttimeout(60)
-
     branch_proc = subprocess.run(['git', 'rev-parse', '--abbrev-ref', 'HEAD'],
                                  check=True, stdout=subprocess.PIPE)
     branch = branch_proc.stdout.decode("utf-8").rstrip()
@@ -507,11 +524,9 @@ def main():
         subprocess.run(['git', 'tag', tag], check=True)
         subprocess.run(['git', 'push', 'origin', tag], check=True)
 
-        if not build_and_download(lp, recipe, args.output_dir):
+        if not asyncio.run(build_snaps(lp, recipe, args.core_series,
+                                       args.build_variant, args.output_dir)):
             ret = 1
-        if ret == 0 and args.core_series == '26':
-            if not handle_riscv_build(lp, args.build_variant, args.output_dir):
-                ret = 1
         if ret == 1:
             remove_tag(tag)
         break
@@ -0,0 +1,123 @@
+#!/usr/bin/python3
+#
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Script that creates the header and the paragraphs for the merge commits of
+# a changelog entry, from the descriptions of the merge commits since the
+# previous version. All commits are read with a single 'git log' command.
+#
+# For each merge commit, the author is taken from the 'Author:' lines of the
+# description (launchpad merges) and the links from the 'Merge-Proposal:'
+# lines. For github merges, the author of the commit and the 'Merge pull
+# request' line are used instead. Commits are grouped by author, and authors
+# are listed in the order of their first merge. The text of each paragraph
+# is the same, byte by byte, that the shell implementation we had in
+# snap-release.sh produced, which listed authors in the order of the hash
+# table of a bash associative array instead.
+
+import argparse
+import datetime
+import re
+import subprocess
+import sys
+
+NO_DESCRIPTION = 'See more information in merge proposal'
+
+# Bodies that 'echo' took as options, printing no text
+ECHO_OPTIONS_RE = re.compile(r'-[neE]+')
+
+
+# Yields (author, body) for the merge commits in range, oldest first. The
+# author is 'name <email>' from git metadata. Text is decoded so that any
+# byte can be written back unchanged.
+def iter_merge_commits(rev_range):
+    out = subprocess.run(['git', 'log', '--merges', '--reverse', '-z',
+                          '--format=%an <%ae>%x00%B', rev_range, '--'],
+                         check=True, stdout=subprocess.PIPE).stdout
+    fields = out.decode('utf-8', 'surrogateescape').split('\0')
+    for i in range(0, len(fields) - 1, 2):
+        yield fields[i], fields[i + 1]
+
+
+# Returns author, description and merge proposal for a merge commit
+def parse_merge_commit(git_author, body):
+    # Trailing newlines are not part of the body
+    body = body.rstrip('\n')
+    if ECHO_OPTIONS_RE.fullmatch(body):
+        body = ''
+    lines = body.split('\n')
+    merge_proposal = '\n'.join(
+        line for line in lines if line.startswith('Merge-Proposal:'))
+    author = '\n'.join(
+        line for line in lines if line.startswith('Author:'))
+    if author.startswith('Author: '):
+        author = author[len('Author: '):]
+    if author == '':
+        # Probably github instead of launchpad
+        author = git_author
+        merge_proposal = '\n'.join(
+            line for line in lines if 'Merge pull request' in line)
+
+    # Remove leading blank lines, then indent from the third line
+    desc_lines = [line for line in lines
+                  if not line.startswith(('Author:', 'Merge'))]
+    while len(desc_lines) > 0 and desc_lines[0] == '':
+        desc_lines.pop(0)
+    description = '\n'.join(desc_lines[:2] +
+                            ['    ' + line for line in desc_lines[2:]])
+    description = description.rstrip('\n')
+    if description == '':
+        description = NO_DESCRIPTION
+    return author, description, merge_proposal
+
+
+# Returns the text for the changelog entry, without the changes in packages
+def get_changelog_text(snap, version, rev_range):
+    changes = {}
+    for git_author, body in iter_merge_commits(rev_range):
+        author, description, merge_proposal = \
+            parse_merge_commit(git_author, body)
+        changes[author] = changes.get(author, '') + \
+            '\n  * {}\n    {}'.format(description, merge_proposal)
+
+    date = datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d')
+    text = '{} {} {}\n'.format(date, snap, version)
+    # Dictionaries keep the order of the first merge of each author
+    for author, author_changes in changes.items():
+        text += '\n  [ {} ]{}\n'.format(author, author_changes)
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Create changelog entry from the merge commits')
+    parser.add_argument('snap')
+    parser.add_argument('version')
+    parser.add_argument('previous_version', nargs='?', default='',
+                        help='take merges since this git revision, ' +
+                        'all of them if empty')
+    args = parser.parse_args()
+
+    if args.previous_version != '':
+        rev_range = args.previous_version + '..HEAD'
+    else:
+        rev_range = 'HEAD'
+    text = get_changelog_text(args.snap, args.version, rev_range)
+    sys.stdout.buffer.write(text.encode('utf-8', 'surrogateescape'))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
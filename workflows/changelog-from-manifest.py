@@ -18,13 +18,29 @@
 # that includes the changes for all deb files. These changes are
 # obtained from the debian changelog for the different packages.
 
+import argparse
+import codecs
+import concurrent.futures
 import debian.changelog
+import debian.deb822
 import debian.debian_support
 import gzip
-import requests
+import json
+import os
 import sys
-import yaml
+import zlib
 from collections import namedtuple
+from se_utils import transport
+from tools import changelog_cache
+from tools import manifest
+from tools import manifest_diff
+
+# Number of changelogs fetched at the same time, can be overridden with the
+# CHANGELOG_FETCH_WORKERS environment variable.
+DEFAULT_FETCH_WORKERS = 8
+FETCH_TIMEOUT = 60
+CHANGELOGS_URL = 'https://changelogs.ubuntu.com/changelogs/binary/'
+READ_CHUNK_SIZE = 64 * 1024
 
 
 def eprint(*args, **kwargs):
@@ -32,156 +48,461 @@ def eprint(*args, **kwargs):
 
 
 # Returns a dictionary from package name to version, using
-# stage-packages section.
-# manifest_y: yaml document with manifest
-def get_staged_version_from_yaml(manifest_y):
-    staged_v = {}
-    for part, part_y in manifest_y['parts'].items():
-        for pkg in part_y['stage-packages']:
-            # package_name=version
-            pkg_data = pkg.split('=')
-            staged_v[pkg_data[0]] = pkg_data[1]
-
-    return staged_v
+# primed-stage-packages section if available, otherwise the
+# stage-packages of all parts.
+# manifest_p: path to manifest to load
+def get_primed_version(manifest_p):
+    return manifest.load_manifest(manifest_p).primed_versions()
 
 
-# Returns a dictionary from package name to version, using
-# primed-stage-packages section.
-# manifest_y: yaml document with manifest
-def get_primed_version_from_yaml(manifest_y):
-    primed_v = {}
-    for pkg in manifest_y['primed-stage-packages']:
-        # package_name=version
-        pkg_data = pkg.split('=')
-        primed_v[pkg_data[0]] = pkg_data[1]
+# Yields the decoded text of a gzipped changelog in the docs directory, in
+# chunks so we can stop reading once we have the changes we need.
+def iter_changelog_file(docs_d, pkg):
+    chl_path = docs_d + '/' + pkg + '/changelog.Debian.gz'
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    with gzip.open(chl_path) as chl_fh:
+        for chunk in iter(lambda: chl_fh.read(READ_CHUNK_SIZE), b''):
+            yield decoder.decode(chunk)
+    yield decoder.decode(b'', final=True)
 
-    return primed_v
 
+# Returns the source package from the header of the changelog in the docs
+# directory, or None if there is no changelog there. Only the first line is
+# decompressed.
+def get_source_from_file(docs_d, pkg):
+    chl_path = docs_d + '/' + pkg + '/changelog.Debian.gz'
+    try:
+        with gzip.open(chl_path) as chl_fh:
+            header = chl_fh.readline().decode('utf-8')
+    except Exception:
+        return None
+    if ' ' not in header:
+        return None
+    return header[0:header.find(' ')]
+
+
+# Returns a dictionary from binary to source package, loaded from Packages
+# or Sources index files (optionally gzipped).
+# index_paths: list of paths to index files
+def load_source_index(index_paths):
+    bin2src = {}
+    for index_p in index_paths:
+        if index_p.endswith('.gz'):
+            index_f = gzip.open(index_p, 'rt', encoding='utf-8')
+        else:
+            index_f = open(index_p, encoding='utf-8')
+        with index_f:
+            for para in debian.deb822.Deb822.iter_paragraphs(index_f):
+                if 'Binary' in para:
+                    # Sources stanza
+                    for binary in para['Binary'].split(','):
+                        bin2src[binary.strip()] = para['Package']
+                elif 'Package' in para:
+                    # Source can include the version: "src (1.0-1)"
+                    src = para.get('Source', para['Package'])
+                    bin2src[para['Package']] = src.split(' ')[0]
+    return bin2src
+
+
+# Groups the changed binaries by source package, before fetching anything.
+# Source is taken from the header of the changelog in the docs directory or
+# else from the index. Returns a dictionary from binary to the binary whose
+# changelog will be used for it: the first binary of its source in sorted
+# order, which is the one whose changes are reported. Binaries with unknown
+# source are mapped to themselves.
+# The header of a changelog in docs_d is the real source of the binary, so
+# only sources from the index can be wrong. After fetching, the source of
+# each representative is checked, but not the one of the other binaries of
+# the group, as that would need a changelog for each of them. So a binary
+# without changelog in docs_d and with a wrong index entry is reported with
+# the source the index says, unless it is the representative.
+def group_by_source(changed, docs_d, bin2src):
+    representative = {}
+    predicted = {}
+    first_of_src = {}
+    for pkg, _, _ in changed:
+        src = get_source_from_file(docs_d, pkg)
+        if src is None:
+            src = bin2src.get(pkg)
+        predicted[pkg] = src
+        if src is None:
+            representative[pkg] = pkg
+        else:
+            representative[pkg] = first_of_src.setdefault(src, pkg)
+    return representative, predicted
 
-# Returns a dictionary from package name to version, using
-# primed-stage-packages section if available, otherwise calling
-# get_staged_version.
-# manifest_p: path to manifest to load
-def get_primed_version(manifest_p):
-    with open(manifest_p) as manifest:
-        manifest_y = yaml.safe_load(manifest)
 
-    if 'primed-stage-packages' in manifest_y:
-        return get_primed_version_from_yaml(manifest_y)
-    else:
-        return get_staged_version_from_yaml(manifest_y)
+def get_fetch_workers():
+    return int(os.environ.get('CHANGELOG_FETCH_WORKERS',
+                              DEFAULT_FETCH_WORKERS))
 
 
-def get_changelog_from_file(docs_d, pkg):
-    chl_path = docs_d + '/' + pkg + '/changelog.Debian.gz'
-    with gzip.open(chl_path) as chl_fh:
-        return chl_fh.read().decode('utf-8')
+# Returns a transport that keeps connections to changelogs.ubuntu.com open
+# for all threads. It retries on transient errors.
+def make_session(workers):
+    return transport.Transport(max_connections=workers)
 
 
-def get_changelog_from_url(pkg, new_v):
-    url = 'https://changelogs.ubuntu.com/changelogs/binary/'
+def get_changelog_url(pkg, new_v):
+    url = CHANGELOGS_URL
     if pkg.startswith('lib'):
         url += pkg[0:4]
     else:
         url += pkg[0]
     url += '/' + pkg + '/' + new_v + '/changelog'
-    changelog_r = requests.get(url)
-    if changelog_r.status_code != requests.codes.ok:
-        raise Exception('No changelog found in ' + url + ' - status:' +
-                        str(changelog_r.status_code))
+    return url
 
-    return changelog_r.text
 
+# Yields the decoded text of a changelog downloaded from
+# changelogs.ubuntu.com, in chunks so we can stop reading once we have the
+# changes we need. Changelogs are UTF-8 if the server does not say otherwise.
+def iter_changelog_response(response):
+    encoding = transport.get_text_encoding(response)
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    for chunk in response.stream(READ_CHUNK_SIZE):
+        yield decoder.decode(chunk)
+    yield decoder.decode(b'', final=True)
 
-# Gets difference in changelog between old and new versions
+
+# Gets difference in changelog between old and new versions from
+# changelogs.ubuntu.com, or from the cache if there.
 # Returns source package and the differences
-def get_changes_for_version(docs_d, pkg, old_v, new_v, indent):
-    # Try to get changelog from file (only option that will work for
-    # ESM packages), otherwise go to changelogs.ubuntu.com.
+def get_changes_from_url(pkg, old_v, new_v, indent, session=None, cache=None):
+    if cache is not None:
+        changelog = cache.get(pkg, new_v)
+        if changelog is not None:
+            return read_changes([changelog], old_v, indent)
+
+    url = get_changelog_url(pkg, new_v)
+    if session is None:
+        session = transport.get_transport()
+    changelog_r = session.request('GET', url, preload_content=False,
+                                  accept_gzip=True, timeout=FETCH_TIMEOUT)
     try:
-        changelog = get_changelog_from_file(docs_d, pkg)
-    except Exception:
-        changelog = get_changelog_from_url(pkg, new_v)
+        if changelog_r.status != 200:
+            raise Exception('No changelog found in ' + url + ' - status:' +
+                            str(changelog_r.status))
+        chunks = iter_changelog_response(changelog_r)
+        if cache is None:
+            return read_changes(chunks, old_v, indent)
+
+        # The cache needs the full changelog, so read the rest of it after
+        # parsing what we need.
+        received = []
+
+        def tee():
+            for chunk in chunks:
+                received.append(chunk)
+                yield chunk
+
+        chunks_tee = tee()
+        changes = read_changes(chunks_tee, old_v, indent)
+        for _ in chunks_tee:
+            pass
+    finally:
+        if not changelog_r.isclosed():
+            # Do not reuse the connection with the body unread
+            changelog_r.close()
+        changelog_r.release_conn()
+
+    try:
+        cache.put(pkg, new_v, ''.join(received))
+    except OSError as ex:
+        eprint('WARNING: cannot cache changelog for', pkg, new_v, ex)
+    return changes
 
-    source_pkg = changelog[0:changelog.find(' ')]
 
-    chl = debian.changelog.Changelog(changelog)
+# Splits text chunks in lines, as str.splitlines() would do on the full text
+def iter_lines(chunks):
+    pending = ''
+    for chunk in chunks:
+        pieces = (pending + chunk).split('\n')
+        pending = pieces.pop()
+        for piece in pieces:
+            yield from (piece + '\n').splitlines()
+    yield from pending.splitlines()
+
+
+# Headers are recognized only where debian.changelog expects them: at the
+# start and after the trailer line of the previous entry. Lines that make
+# debian.changelog ignore the rest of the file are handled too.
+_CHANGELOG_END_RES = [debian.changelog.emacs_variables,
+                      debian.changelog.vim_variables] + \
+    [getattr(debian.changelog, 'old_format_re' + str(i)) for i in range(1, 9)]
+
+
+# Reads a changelog until the entry for the first version older or equal to
+# old_v, without parsing or storing the older entries.
+# chunks: iterable with the text of the changelog
+# Returns source package and the changes since old_v
+def read_changes(chunks, old_v, indent):
+    # The source package is what comes before the first space
+    head = []
+
+    def track_head(chunks):
+        has_space = False
+        for chunk in chunks:
+            if not has_space:
+                head.append(chunk)
+                has_space = ' ' in chunk
+            yield chunk
+
+    lines_it = iter_lines(track_head(chunks))
+    lines = []
     old_deb_v = debian.debian_support.Version(old_v)
-    for version in chl.get_versions():
-        vc = debian.debian_support.version_compare(old_deb_v, version)
-        if vc >= 0:
+    version = None
+    first_heading = True
+    in_entry = False
+    for line in lines_it:
+        lines.append(line)
+        if in_entry:
+            if debian.changelog.endline.match(line):
+                in_entry = False
+            continue
+        top_match = debian.changelog.topline.match(line)
+        if top_match is not None:
+            version = debian.debian_support.Version(top_match.group(2))
+            first_heading = False
+            in_entry = True
+            vc = debian.debian_support.version_compare(old_deb_v, version)
+            if vc >= 0:
+                break
+        elif not first_heading and \
+                any(r.match(line) for r in _CHANGELOG_END_RES):
+            # No more entries after this
             break
 
+    if version is None:
+        raise Exception('No entries found in changelog')
+    text_head = ''.join(head)
+    source_pkg = text_head[0:text_head.find(' ')]
+
     # Get the changelog chunk since the version older or equal to old_v
-    change_chunk = ''
     old_change_start = source_pkg + ' (' + version.__str__() + ')'
-    for line in changelog.splitlines():
+    end = None
+    for i, line in enumerate(lines):
         if line.startswith(old_change_start):
+            end = i
             break
+    if end is None:
+        # The header was for another package name, keep looking as the
+        # lines that follow are part of the changes.
+        for line in lines_it:
+            if line.startswith(old_change_start):
+                break
+            lines.append(line)
+        end = len(lines)
+
+    change_chunk = []
+    for line in lines[:end]:
         if line == '':
-            change_chunk += '\n'
+            change_chunk.append('\n')
         else:
-            change_chunk += indent + line + '\n'
+            change_chunk.append(indent + line + '\n')
+
+    return source_pkg, ''.join(change_chunk)
 
-    return source_pkg, change_chunk
+
+# Gets difference in changelog between old and new versions
+# Returns source package and the differences
+def get_changes_for_version(docs_d, pkg, old_v, new_v, indent, session=None,
+                            cache=None):
+    # Try to get changelog from file (only option that will work for
+    # ESM packages), otherwise go to changelogs.ubuntu.com.
+    try:
+        return read_changes(iter_changelog_file(docs_d, pkg), old_v, indent)
+    except (OSError, EOFError, zlib.error, UnicodeDecodeError):
+        return get_changes_from_url(pkg, old_v, new_v, indent, session, cache)
 
 
 # Returns the changes related to primed packages between two manifests
 # old_manifest_p: path to old manifest
 # new_manifest_p: path to newer manifest
 # docs_d: directory with docs from debian packages
-def compare_manifests(old_manifest_p, new_manifest_p, docs_d):
-    old_primed_v = get_primed_version(old_manifest_p)
-    new_primed_v = get_primed_version(new_manifest_p)
-    changes = ''
+def compare_manifests(old_manifest_p, new_manifest_p, docs_d, bin2src=None,
+                      cache=None):
+    changes, _, _ = compare_manifest_pairs(
+        [(None, old_manifest_p, new_manifest_p, docs_d)], bin2src, cache)
+    return changes
+
+
+# Returns the changes related to primed packages between pairs of manifests,
+# usually one pair per architecture. Each changelog is fetched and parsed
+# only once for all pairs. Entries that are not the same for all pairs are
+# prefixed with the architectures they apply to.
+# pairs: list of (arch, old_manifest_p, new_manifest_p, docs_d)
+# Returns the changes, whether there were differences between pairs, and
+# the list of manifest_diff records for each arch
+def compare_manifest_pairs(pairs, bin2src=None, cache=None):
+    if bin2src is None:
+        bin2src = {}
+    ArchData = namedtuple('ArchData', 'arch docs_d records entries changed_v '
+                          'changed representative predicted')
+    archs_data = []
+    for arch, old_manifest_p, new_manifest_p, docs_d in pairs:
+        old_primed_v = get_primed_version(old_manifest_p)
+        new_primed_v = get_primed_version(new_manifest_p)
+        records = list(manifest_diff.diff_versions(old_primed_v,
+                                                   new_primed_v))
+        # Entries of the report, sorted by (section, package)
+        entries = []
+
+        # Find first all the packages that have changed, so their
+        # changelogs can be fetched concurrently.
+        changed = []
+        for record in records:
+            if record.kind == manifest_diff.ADDED:
+                section = 0
+            elif record.kind == manifest_diff.REMOVED:
+                section = 2
+            else:
+                changed.append((record.name, record.old_version,
+                                record.new_version))
+                continue
+            entries.append(((section, record.name),
+                            manifest_diff.render_record_text(record)))
+
+        # Fetch and parse only one changelog per source package
+        representative, predicted = group_by_source(changed, docs_d, bin2src)
+        changed_v = {pkg: (old_v, new_v) for pkg, old_v, new_v in changed}
+        archs_data.append(ArchData(arch, docs_d, records, entries, changed_v,
+                                   changed, representative, predicted))
+
+    # Changelogs are identified by (package, old version, new version)
+    results = {}
+
+    def fetch(keys):
+        docs = {}
+        for data in archs_data:
+            for pkg in keys.get(data.arch, []):
+                docs.setdefault((pkg,) + data.changed_v[pkg], data.docs_d)
+        to_fetch = sorted(k for k in docs if k not in results)
+        # map() returns results in the order of to_fetch, so output does not
+        # depend on which download finishes first.
+        fetched = executor.map(
+            lambda k: get_changes_for_version(docs[k], *k, '  ', session,
+                                              cache),
+            to_fetch)
+        results.update(zip(to_fetch, fetched))
+
+    def result(data, pkg):
+        return results[(pkg,) + data.changed_v[pkg]]
+
+    workers = get_fetch_workers()
+    with make_session(workers) as session, \
+            concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        fetch({data.arch: set(data.representative.values())
+               for data in archs_data})
+        # Index data can be wrong, in that case fetch all the binaries that
+        # were grouped under the wrong source.
+        wrong = {}
+        for data in archs_data:
+            wrong[data.arch] = [
+                pkg for pkg, rep in data.representative.items()
+                if pkg != rep and result(data, rep)[0] != data.predicted[rep]]
+            for pkg in wrong[data.arch]:
+                data.representative[pkg] = pkg
+        fetch(wrong)
 
-    src_pkgs = {}
     SrcPkgData = namedtuple('SrcPkgData', 'old_v new_v changes debs')
-    for pkg, new_v in sorted(new_primed_v.items()):
-        try:
-            old_v = old_primed_v[pkg]
-            if old_v != new_v:
-                (src, pkg_change) = get_changes_for_version(docs_d, pkg, old_v,
-                                                            new_v, '  ')
-                if src not in src_pkgs:
-                    src_pkgs[src] = SrcPkgData(old_v, new_v, pkg_change, [pkg])
-                else:
-                    src_pkgs[src].debs.append(pkg)
-        except KeyError:
-            changes += pkg + ' (' + new_v + '): new primed package\n\n'
-
-    for src_pkg, pkg_data in sorted(src_pkgs.items()):
-        changes += ', '.join(pkg_data.debs)
-        changes += ' (built from ' + src_pkg + ') updated from '
-        changes += pkg_data.old_v + ' to ' + pkg_data.new_v + ':\n\n'
-        changes += pkg_data.changes
-
-    for pkg, old_v in sorted(old_primed_v.items()):
-        if pkg not in new_primed_v:
-            changes += pkg + ': not primed anymore\n\n'
+    merged = {}
+    for data in archs_data:
+        src_pkgs = {}
+        for pkg, old_v, new_v in data.changed:
+            (src, pkg_change) = result(data, data.representative[pkg])
+            if src not in src_pkgs:
+                src_pkgs[src] = SrcPkgData(old_v, new_v, pkg_change, [pkg])
+            else:
+                src_pkgs[src].debs.append(pkg)
+
+        for src_pkg, pkg_data in sorted(src_pkgs.items()):
+            text = ', '.join(pkg_data.debs)
+            text += ' (built from ' + src_pkg + ') updated from '
+            text += pkg_data.old_v + ' to ' + pkg_data.new_v + ':\n\n'
+            text += pkg_data.changes
+            data.entries.append(((1, src_pkg), text))
+
+        for entry in data.entries:
+            merged.setdefault(entry, []).append(data.arch)
 
-    return changes
+    changes = ''
+    differ = False
+    # Sort is stable, so different entries for the same package follow the
+    # order of pairs.
+    for (_, text), archs in sorted(merged.items(), key=lambda e: e[0][0]):
+        if len(archs) != len(archs_data):
+            changes += '[' + ', '.join(archs) + '] '
+            differ = True
+        changes += text
+
+    return changes, differ, [(d.arch, d.records) for d in archs_data]
 
 
 def main(argv=None):
     if argv is None:
         argv = sys.argv[1:]
 
-    if len(argv) != 3:
-        eprint('Usage:', sys.argv[0],
-               '<old_manifest> <new_manifest> <docs_dir>')
-        return 1
-    old_manifest = argv[0]
-    new_manifest = argv[1]
-    docs_dir = argv[2]
+    parser = argparse.ArgumentParser(
+        description='Create a paragraph with the changes in the debian '
+        'packages primed in a snap')
+    parser.add_argument('old_manifest', nargs='?')
+    parser.add_argument('new_manifest', nargs='?')
+    parser.add_argument('docs_dir', nargs='?')
+    parser.add_argument('--pair', action='append', nargs=4, default=[],
+                        metavar=('ARCH', 'OLD_MANIFEST', 'NEW_MANIFEST',
+                                 'DOCS_DIR'),
+                        help='Compare manifests for an architecture. Can be '
+                        'used more than once to get a single report for all '
+                        'architectures.')
+    parser.add_argument('--strict', action='store_true',
+                        help='Fail if the changes are not the same for all '
+                        'the pairs')
+    parser.add_argument('--json', metavar='PATH',
+                        help='Write also the package version changes for '
+                        'each pair as JSON to PATH')
+    parser.add_argument('--source-index', action='append', default=[],
+                        help='Packages or Sources index (can be gzipped) '
+                        'used to find the source of binaries without '
+                        'changelog in docs_dir. Can be used more than once.')
+    args = parser.parse_args(argv)
+    pairs = [tuple(p) for p in args.pair]
+    if args.docs_dir is not None:
+        # Pairs are identified by their architecture
+        if len(pairs) > 0:
+            parser.error('manifests and docs_dir cannot be used with --pair')
+        pairs = [(None, args.old_manifest, args.new_manifest, args.docs_dir)]
+    elif args.old_manifest is not None:
+        parser.error('old_manifest, new_manifest and docs_dir go together')
+    archs = [p[0] for p in pairs]
+    for arch in sorted(set(archs)):
+        if archs.count(arch) > 1:
+            parser.error('--pair used more than once for ' + arch)
+    if len(pairs) == 0:
+        parser.error('either manifests and docs_dir or --pair are required')
+    bin2src = load_source_index(args.source_index)
+    cache = changelog_cache.ChangelogCache.from_env()
 
     changes = '[ Changes in primed packages ]\n\n'
-    pkg_changes = compare_manifests(old_manifest, new_manifest, docs_dir)
+    pkg_changes, differ, records = compare_manifest_pairs(pairs, bin2src,
+                                                          cache)
+    if args.json is not None:
+        with open(args.json, 'w') as json_f:
+            json.dump([{'arch': arch,
+                        'changes': [manifest_diff.record_to_dict(r)
+                                    for r in arch_records]}
+                       for arch, arch_records in records], json_f, indent=2)
+    if cache is not None:
+        cache.evict()
+        eprint(cache.stats())
     if pkg_changes != '':
         changes += pkg_changes
     else:
         changes += 'No changes for primed packages\n\n'
     print(changes, end='')
+    if differ and args.strict:
+        eprint('ERROR: changes are different for',
+               ', '.join(p[0] for p in pairs))
+        return 1
     return 0
 
 
@@ -66,9 +66,14 @@ build_and_download_snaps()
 modify_files_in_snap()
 {
     local snap_p=$1
-    shift 1
     local fs_d dest_d i
 
+    # Rewrite only what changes, reusing the compressed data of the rest
+    if "$CICD_SCRIPTS"/repack-snap.py "$@"; then
+        return
+    fi
+    shift 1
+
     fs_d=squashfs
     unsquashfs -d "$fs_d" "$snap_p"
 
@@ -123,16 +128,12 @@ push_and_release_snap()
     shift 2
     local channels=$*
     channels=${channels// /,}
-    local snap_file
 
-    cd "$snaps_d"
-    for snap_file in "$snap_n"_*.snap; do
-        # We go on even if there are failures, as these happen usually because
-        # of review-tools and we want to still upload all arches as we will
-        # most probably ask for store approval anyway.
-        # TODO maybe make the workflow fail right after finishing to note this?
-        snapcraft upload "$snap_file" --release "$channels" || true
-    done
+    # All arches are uploaded at once. The script goes on if some fail, as
+    # that happens usually because of review-tools and we will most probably
+    # ask for store approval anyway, but then it fails to note it.
+    "$CICD_SCRIPTS"/upload-snaps.py --release "$channels" \
+                   "$snaps_d/$snap_n"_*.snap
 )
 
 # Return path to snapcraft.yaml. Run inside repo.
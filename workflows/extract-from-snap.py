@@ -0,0 +1,58 @@
+#!/usr/bin/python3
+#
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Script that extracts some paths from a snap, like 'unsquashfs -d <dest>
+# <snap> <path>...', but reading only the blocks of the image needed for
+# them. Paths not found in the snap are skipped, as unsquashfs does. Returns
+# 1 if the snap cannot be read, for instance because it uses a compression
+# for which the Python module is missing, so callers can fall back to
+# unsquashfs.
+
+import argparse
+import os
+import sys
+
+from tools import squashfs
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Extract paths from a snap without unsquashfs')
+    parser.add_argument('-d', '--dest', default='squashfs-root',
+                        help='destination directory')
+    parser.add_argument('snap')
+    parser.add_argument('paths', nargs='+')
+    args = parser.parse_args()
+
+    try:
+        with squashfs.SquashFS.open(args.snap) as snap:
+            os.makedirs(args.dest, exist_ok=True)
+            for path in args.paths:
+                dest = os.path.join(args.dest, path.strip('/'))
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                try:
+                    snap.extract(path, dest)
+                except (FileNotFoundError, NotADirectoryError):
+                    print(path, 'not found in', args.snap, file=sys.stderr)
+    except (OSError, squashfs.SquashFSError) as ex:
+        print('ERROR: cannot extract from {}: {}'.format(args.snap, ex),
+              file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+#!/usr/bin/python3
+#
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Script that gets the manifests of the published revisions of a snap for
+# some architectures, to compare with the ones being released. For each
+# architecture, the first of these that has a revision is used:
+#
+#   1. The channel, for the architecture
+#   2. The same risk in the previous track, if this is the first release in
+#      the track
+#   3. The channel, for amd64
+#   4. The same risk in the previous track, for amd64
+#
+# In each of them, a closed channel follows the next more stable risk of the
+# track, as with 'snap download', so for instance the stable revision is
+# used after beta is closed by a promotion.
+#
+# The channel map for all architectures is requested once to find the
+# revisions, and then the manifests are fetched at the same time, reading
+# only the needed blocks of the snaps when possible. They are written to
+# <output_dir>/manifest-<arch>.yaml. Returns 1 if there is no revision for
+# some architecture or if a manifest cannot be fetched.
+
+import concurrent.futures
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import urllib3
+
+from se_utils import artifact_store
+from se_utils import transport
+
+MANIFEST_PATH = 'snap/manifest.yaml'
+
+
+def previous_track(snap_n, track):
+    # Tracks of bases and some other snaps follow the Ubuntu LTS releases
+    if track.isdigit() and int(track) > 20:
+        return str(int(track) - 2)
+    if snap_n in ('network-manager', 'modem-manager'):
+        return '1.10'
+    return 'latest'
+
+
+# Returns the channels and architectures to try, in order
+def get_candidates(snap_n, channel, arch):
+    track = channel.split('/')[0]
+    rest = channel.split('/', 1)[-1]
+    previous = previous_track(snap_n, track) + '/' + rest
+    return [(channel, arch), (previous, arch),
+            (channel, 'amd64'), (previous, 'amd64')]
+
+
+def find_revision(channel_map, snap_n, channel, arch):
+    """ Return the information of the revision with the manifest to compare
+    with for arch, see artifact_store.find_store_snap_info(), or None
+    """
+    for cand_channel, cand_arch in get_candidates(snap_n, channel, arch):
+        info = artifact_store.find_store_snap_info(
+            channel_map, cand_channel, cand_arch)
+        if info is not None:
+            return info
+    return None
+
+
+def main():
+    if len(sys.argv) < 5:
+        print('Usage: {} <snap> <channel> <output_dir> <arch>...'.format(
+            sys.argv[0]), file=sys.stderr)
+        return 1
+
+    snap_n, channel, out_d = sys.argv[1:4]
+    archs = sys.argv[4:]
+    store = artifact_store.ArtifactStore.from_env()
+    url_pool = transport.Transport(max_connections=len(archs))
+
+    try:
+        channel_map = artifact_store.get_store_channel_map(url_pool, snap_n)
+    except urllib3.exceptions.HTTPError as ex:
+        print('ERROR: cannot get channel map of {}: {}'.format(snap_n, ex))
+        return 1
+    if channel_map is None:
+        print('ERROR: {} is not in the store'.format(snap_n))
+        return 1
+
+    # Revision to use for each arch
+    arch_info = {}
+    for arch in archs:
+        info = find_revision(channel_map, snap_n, channel, arch)
+        if info is None:
+            print('ERROR: no published {} revision for {}'.format(
+                snap_n, arch))
+            return 1
+        print('Old manifest for {}: revision {} ({}) for {}'.format(
+            arch, info['revision'], info['channel'], info['arch']))
+        arch_info[arch] = info
+
+    os.makedirs(out_d, exist_ok=True)
+    with tempfile.TemporaryDirectory() as tmp_d:
+        # Each revision is fetched once, even if used for several arches
+        revisions = {info['revision']: info for info in arch_info.values()}
+
+        def fetch(info):
+            rev_d = os.path.join(tmp_d, str(info['revision']))
+            artifact_store.extract_store_snap_paths(
+                store, url_pool, snap_n, info, [MANIFEST_PATH], rev_d)
+            return os.path.join(rev_d, MANIFEST_PATH)
+
+        try:
+            with concurrent.futures.ThreadPoolExecutor(
+                    len(revisions)) as executor:
+                manifests = dict(zip(revisions,
+                                     executor.map(fetch, revisions.values())))
+        except (urllib3.exceptions.HTTPError, OSError,
+                subprocess.CalledProcessError) as ex:
+            print('ERROR: cannot fetch old manifests: {}'.format(ex))
+            return 1
+
+        for arch, info in arch_info.items():
+            manifest_p = manifests[info['revision']]
+            if not os.path.exists(manifest_p):
+                print('ERROR: no manifest in {} revision {}'.format(
+                    snap_n, info['revision']))
+                return 1
+            shutil.copyfile(manifest_p, os.path.join(
+                out_d, 'manifest-{}.yaml'.format(arch)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
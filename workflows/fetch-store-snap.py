@@ -0,0 +1,85 @@
+#!/usr/bin/python3
+#
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Script that gets a snap published in the store, like 'snap download', but
+# using the local artifact store, if enabled, so each revision is downloaded
+# only once. The path to the snap is printed to stdout. Returns 2 if the snap
+# is not published in the channel for the architecture.
+#
+# With --path, only the given paths are extracted from the snap into the
+# output directory, like 'unsquashfs -d <output_dir> <snap> <path>...', and
+# the snap is not downloaded: only the blocks needed for them are fetched
+# with HTTP range requests. If that is not possible, the snap is downloaded
+# and the paths extracted from it.
+
+import argparse
+import os
+import subprocess
+import sys
+
+import urllib3
+
+from se_utils import artifact_store
+from se_utils import transport
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Get a snap published in the store')
+    parser.add_argument('-p', '--path', dest='paths', action='append',
+                        help='extract only this path from the snap, ' +
+                        'can be repeated')
+    parser.add_argument('snap')
+    parser.add_argument('channel')
+    parser.add_argument('arch')
+    parser.add_argument('output_dir')
+    args = parser.parse_args()
+
+    store = artifact_store.ArtifactStore.from_env()
+    url_pool = transport.get_transport()
+    # Progress messages go to stderr, stdout is for the path
+    sys.stdout = sys.stderr
+    try:
+        if args.paths:
+            os.makedirs(args.output_dir, exist_ok=True)
+            info = artifact_store.get_store_snap_info(
+                url_pool, args.snap, args.channel, args.arch)
+            out_p = None
+            if info is not None:
+                artifact_store.extract_store_snap_paths(
+                    store, url_pool, args.snap, info, args.paths,
+                    args.output_dir)
+                out_p = args.output_dir
+        else:
+            out_p = artifact_store.fetch_store_snap(
+                store, url_pool, args.snap, args.channel, args.arch,
+                args.output_dir)
+    except (urllib3.exceptions.HTTPError, OSError,
+            subprocess.CalledProcessError) as ex:
+        print('ERROR: cannot get {} from {}: {}'.format(
+            args.snap, args.channel, ex))
+        sys.exit(1)
+    finally:
+        sys.stdout = sys.__stdout__
+    if out_p is None:
+        print('{} is not published in {} for {}'.format(
+            args.snap, args.channel, args.arch), file=sys.stderr)
+        sys.exit(2)
+    print(out_p)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/python3
+#
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Script that injects or removes files in a snap, rewriting it in place.
+# Arguments after the snap are pairs of a file to inject, or an empty string
+# to remove instead, and the path inside the snap. Unlike unsquashing the
+# snap and packing it again, the compressed data of the files that do not
+# change is reused. Returns 1 if the snap cannot be rewritten this way, for
+# instance because it has extended attributes, so callers can fall back to
+# unsquashfs and 'snap pack'.
+
+import os
+import sys
+
+from tools import squashfs
+from tools import squashfs_repack
+
+
+def main():
+    if len(sys.argv) < 2 or len(sys.argv) % 2 != 0:
+        print('Usage: {} <snap> [<file> <path in snap>]...'.format(
+            sys.argv[0]), file=sys.stderr)
+        return 1
+
+    snap_p = sys.argv[1]
+    changes = []
+    for i in range(2, len(sys.argv), 2):
+        changes.append((sys.argv[i] or None, sys.argv[i + 1]))
+
+    tmp_p = snap_p + '.repack'
+    try:
+        squashfs_repack.repack_file(snap_p, tmp_p, changes)
+        os.replace(tmp_p, snap_p)
+    except (OSError, squashfs.SquashFSError) as ex:
+        print('ERROR: cannot repack {}: {}'.format(snap_p, ex),
+              file=sys.stderr)
+        if os.path.exists(tmp_p):
+            os.unlink(tmp_p)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -15,10 +15,12 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import asyncio
 import atexit
 import sys
 import time
 import os
+import urllib3
 import yaml
 from shutil import rmtree
 from launchpadlib.credentials import RequestTokenAuthorizationEngine
@@ -26,6 +28,10 @@ from lazr.restfulclient.errors import HTTPError
 from launchpadlib.launchpad import Launchpad
 from launchpadlib.credentials import UnencryptedFileCredentialStore
 
+from se_utils import artifact_store
+from se_utils import lp_client
+
+
 class LaunchpadVote():
     APPROVE = 'Approve'
     DISAPPROVE = 'Disapprove'
@@ -154,32 +160,49 @@ def get_branch_handle_from_url(lp_handle, url):
         return lp_handle.branches.getByUrl(url=name)
 
 
-def download_snap_build(lp_handle, buildUrl, destination):
+async def download_snap_build(lp, buildUrl, destination, store=None):
     """ Download a snap build from a url to a destination.
+    Files already in the artifact store are placed in destination instead
+    of downloaded, and downloaded files are added to it.
     If the download fails, do not raise an exception, just return False.
+    :param lp: lp_client.AsyncLaunchpad instance
     :param buildUrl: url of the snap build to download
     :param destination: path to save the downloaded file
+    :param store: artifact_store.ArtifactStore, by default the one
+                  configured by the environment
     :return: True if the download was successful, False otherwise
     """
+    if store is None:
+        store = artifact_store.ArtifactStore.from_env()
+    build_key = artifact_store.build_key(buildUrl)
+    if store is not None and store.place_build(build_key, destination):
+        return True
+
     try:
-        snap_build = lp_handle.load(buildUrl)
-        urls = snap_build.getFileUrls()
+        urls = await lp.get_file_urls(buildUrl)
         if len(urls) == 0:
             raise Exception("No files found for snap build: %s" % buildUrl)
-        
+
+        downloads = []
+        paths = []
         for u in urls:
             if not u.endswith('.snap'):
                 continue
             print("Downloading snap from %s ..." % u)
-            if not os.path.exists(destination):
-                os.makedirs(destination)
+            os.makedirs(destination, exist_ok=True)
             path = os.path.join(destination, os.path.basename(u))
-            # reuse credentials from launchpadlib to download the snap
-            contents = lp_handle._browser.get(u.replace("https://launchpad.net/", str(lp_handle._root_uri)))
-            with open(path, "wb") as out_file:
-                out_file.write(contents)
-    except HTTPError as ex:
+            downloads.append(lp.download(u, path))
+            paths.append(path)
+        await asyncio.gather(*downloads)
+    except (lp_client.LaunchpadError, urllib3.exceptions.HTTPError) as ex:
         print("Could not retrieve snap for {}"
-                " (was there an LP timeout?): {}".format(buildUrl, ex))
+              " (was there an LP timeout?): {}".format(buildUrl, ex))
         return False
+
+    if store is not None:
+        try:
+            await asyncio.to_thread(store.add_build, build_key, paths)
+        except OSError as ex:
+            print("WARNING: could not add build {} to artifact store: {}".
+                  format(buildUrl, ex))
     return True
@@ -0,0 +1,502 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Local content-addressed store for snap artifacts, shared by the workflow
+# scripts so the same Launchpad build or store revision is downloaded only
+# once per machine. Layout under the root directory:
+#
+#   objects/<xx>/<sha3-384>   file contents, xx are the first hex digits
+#   builds/<build id>.json    files of a Launchpad build and their digests
+#   tmp/                      partial files, renamed into objects/ when done
+#
+# Files are added to the store and placed in their destination with a
+# reflink when possible, and otherwise with a copy. They are never
+# hardlinked, so writing a placed file, or the file that was added, cannot
+# modify the store, and objects are read-only. The modification time
+# of objects is updated when they are used, and the least recently used ones
+# are removed when the store grows over its size limit.
+#
+# Files inside published snaps can also be read without downloading them,
+# with HTTP range requests for only the parts of the image that are needed.
+#
+# The store is used only when enabled by the environment, as without
+# reflinks every file added costs an extra copy, which pays off only on
+# machines that keep the store between jobs.
+#
+# Environment:
+#   SNAP_ARTIFACT_STORE           root directory of the store, which enables
+#                                 it
+#   SNAP_ARTIFACT_STORE_MAX_SIZE  size limit in MiB, 0 disables the store
+
+import errno
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import uuid
+
+import urllib3
+
+from tools import squashfs
+
+DEFAULT_MAX_SIZE_MIB = 20 * 1024
+CHUNK_SIZE = 1024 * 1024
+# ioctl to clone a file, from linux/fs.h
+FICLONE = 0x40049409
+
+STORE_API_URL = 'https://api.snapcraft.io/v2/snaps/info/'
+STORE_RISKS = ['stable', 'candidate', 'beta', 'edge']
+
+
+def default_root():
+    cache_d = os.environ.get('XDG_CACHE_HOME',
+                             os.path.expanduser('~/.cache'))
+    return os.path.join(cache_d, 'system-snaps-cicd', 'artifacts')
+
+
+def sha3_384_file(path):
+    """ Return the hex SHA3-384 digest of a file """
+    digest = hashlib.sha3_384()
+    with open(path, 'rb') as in_f:
+        for chunk in iter(lambda: in_f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def build_key(build_link):
+    """ Return the store key for a Launchpad build link """
+    # Links end in +build/<id>, ids are unique for each build type
+    parts = build_link.rstrip('/').split('/')
+    return '{}-{}'.format(parts[-2].lstrip('+'), parts[-1])
+
+
+def _reflink(src, dest):
+    with open(src, 'rb') as src_f, open(dest, 'wb') as dest_f:
+        fcntl.ioctl(dest_f.fileno(), FICLONE, src_f.fileno())
+
+
+def _copy_file(src, dest):
+    """ Copy src to dest, with a reflink if the filesystem supports it
+    :return: method used, 'reflink' or 'copy'
+    """
+    try:
+        _reflink(src, dest)
+        return 'reflink'
+    except OSError as ex:
+        if ex.errno not in (errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP,
+                            errno.EINVAL, errno.ENOTTY, errno.EBADF):
+            raise
+    shutil.copyfile(src, dest)
+    return 'copy'
+
+
+def _remove_partial(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def place_file(src, dest):
+    """ Make dest have the contents of src, sharing storage with a reflink
+    if possible. dest is replaced only when complete.
+    :return: method used, 'reflink' or 'copy'
+    """
+    tmp_dest = '{}.{}.partial'.format(dest, uuid.uuid4().hex)
+    try:
+        method = _copy_file(src, tmp_dest)
+        os.replace(tmp_dest, dest)
+    except BaseException:
+        _remove_partial(tmp_dest)
+        raise
+    return method
+
+
+class ArtifactStore():
+    """ Content-addressed store of snap artifacts """
+
+    def __init__(self, root=None, max_size=DEFAULT_MAX_SIZE_MIB * 1024 * 1024):
+        if root is None:
+            root = default_root()
+        self.root = root
+        self.max_size = max_size
+        self.objects_d = os.path.join(root, 'objects')
+        self.builds_d = os.path.join(root, 'builds')
+        self.tmp_d = os.path.join(root, 'tmp')
+        for d in (self.objects_d, self.builds_d, self.tmp_d):
+            os.makedirs(d, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        """ Return the store configured by the environment, or None if the
+        store is not enabled or cannot be created.
+        """
+        root = os.environ.get('SNAP_ARTIFACT_STORE')
+        max_size = int(os.environ.get('SNAP_ARTIFACT_STORE_MAX_SIZE',
+                                      DEFAULT_MAX_SIZE_MIB))
+        if not root or max_size <= 0:
+            return None
+        try:
+            return cls(root, max_size * 1024 * 1024)
+        except OSError as ex:
+            print('WARNING: not using artifact store {}: {}'.format(root, ex))
+            return None
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_d, digest[:2], digest)
+
+    def has(self, digest):
+        return os.path.exists(self.object_path(digest))
+
+    def _touch(self, path):
+        try:
+            os.utime(path)
+        except OSError:
+            # We might not own the file, LRU order is best effort
+            pass
+
+    def add_file(self, path, digest=None):
+        """ Add a copy of a file to the store, sharing storage with it if
+        possible. The file itself is not modified.
+        :param path: file to add
+        :param digest: SHA3-384 of the file, calculated if not provided
+        :return: digest of the file
+        """
+        if digest is None:
+            digest = sha3_384_file(path)
+        obj_p = self.object_path(digest)
+        if os.path.exists(obj_p):
+            self._touch(obj_p)
+            return digest
+        os.makedirs(os.path.dirname(obj_p), exist_ok=True)
+        fd, tmp_p = tempfile.mkstemp(dir=self.tmp_d, prefix=digest + '.')
+        os.close(fd)
+        try:
+            _copy_file(path, tmp_p)
+            # Only the copy in the store is read-only
+            os.chmod(tmp_p, 0o444)
+            os.replace(tmp_p, obj_p)
+        except BaseException:
+            _remove_partial(tmp_p)
+            raise
+        self._touch(obj_p)
+        self.evict()
+        return digest
+
+    def place(self, digest, dest):
+        """ Place the object with the given digest in dest.
+        :return: True if the object is in the store, False otherwise
+        """
+        obj_p = self.object_path(digest)
+        try:
+            method = place_file(obj_p, dest)
+        except FileNotFoundError:
+            return False
+        self._touch(obj_p)
+        print('Placed {} from artifact store ({})'.format(dest, method))
+        return True
+
+    def _build_index(self, key):
+        return os.path.join(self.builds_d, key + '.json')
+
+    def add_build(self, key, paths):
+        """ Add the files of a Launchpad build to the store.
+        :param key: build key, see build_key()
+        :param paths: paths to the downloaded files
+        """
+        files = {}
+        for p in paths:
+            files[os.path.basename(p)] = self.add_file(p)
+        index_p = self._build_index(key)
+        with tempfile.NamedTemporaryFile('w', dir=self.tmp_d,
+                                         delete=False) as index_f:
+            json.dump({'files': files, 'added': int(time.time())}, index_f)
+        os.replace(index_f.name, index_p)
+
+    def place_build(self, key, destination):
+        """ Place all files of a build in the destination directory.
+        :return: True if all the files were in the store, False otherwise
+        """
+        try:
+            with open(self._build_index(key)) as index_f:
+                files = json.load(index_f)['files']
+        except (OSError, ValueError, KeyError):
+            return False
+        if len(files) == 0 or not all(self.has(d) for d in files.values()):
+            return False
+        os.makedirs(destination, exist_ok=True)
+        for name, digest in sorted(files.items()):
+            if not self.place(digest, os.path.join(destination, name)):
+                return False
+        return True
+
+    def evict(self):
+        """ Remove least recently used objects until we fit in max_size """
+        objects = []
+        total = 0
+        for dirpath, _, filenames in os.walk(self.objects_d):
+            for f in filenames:
+                p = os.path.join(dirpath, f)
+                try:
+                    st = os.stat(p)
+                except FileNotFoundError:
+                    continue
+                objects.append((st.st_mtime, st.st_size, p))
+                total += st.st_size
+        objects.sort()
+        for _, size, p in objects:
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(p)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def parse_channel(channel):
+    """ Split a channel in the usual [<track>/]<risk>[/<branch>] format
+    :return: tuple with the track and the name of the channel, which is
+             <risk>[/<branch>]
+    """
+    parts = channel.split('/')
+    if len(parts) == 1:
+        if parts[0] in STORE_RISKS:
+            parts.insert(0, 'latest')
+        else:
+            parts.append('stable')
+    elif parts[0] in STORE_RISKS:
+        parts.insert(0, 'latest')
+    return parts[0], '/'.join(parts[1:])
+
+
+def get_store_channel_map(url_pool, snap_n, arch=None):
+    """ Return the channel map of a snap, with the revisions published in
+    each channel.
+    :param url_pool: transport.Transport, or a urllib3 pool
+    :param arch: architecture to get revisions for, all if None
+    :return: list of channel map entries, or None if the snap is not in the
+             store
+    """
+    fields = {'fields': 'download,revision,version'}
+    if arch is not None:
+        fields['architecture'] = arch
+    response = url_pool.request(
+        'GET', STORE_API_URL + snap_n, fields=fields,
+        headers={'Snap-Device-Series': '16'})
+    if response.status == 404:
+        return None
+    if response.status != 200:
+        raise urllib3.exceptions.HTTPError(
+            'store info request for {} failed with status {}'.format(
+                snap_n, response.status))
+    return json.loads(response.data)['channel-map']
+
+
+def _fallback_names(name):
+    """ Return the names of the channels to look at, in order, for a channel
+    name in a track. As with 'snap download', closed channels follow the
+    next more stable one: a branch its risk, edge beta, and so on.
+    """
+    risk = name.split('/')[0]
+    names = [name]
+    if risk != name:
+        names.append(risk)
+    if risk in STORE_RISKS:
+        names += reversed(STORE_RISKS[:STORE_RISKS.index(risk)])
+    return names
+
+
+def find_store_snap_info(channel_map, channel, arch):
+    """ Return the download information for a channel and architecture
+    from a channel map, see get_store_channel_map(). If the channel is
+    closed, the more stable risks in the same track are used.
+    :return: dictionary with revision, version, url, sha3-384, the channel
+             where the revision was found and arch, or None if there is
+             nothing published in the track
+    """
+    track, name = parse_channel(channel)
+    entries = {}
+    for entry in channel_map:
+        chan = entry['channel']
+        if chan['architecture'] == arch and chan['track'] == track:
+            entries[chan['name']] = entry
+    for name in _fallback_names(name):
+        entry = entries.get(name)
+        if entry is not None:
+            return {'revision': entry['revision'],
+                    'version': entry['version'],
+                    'url': entry['download']['url'],
+                    'sha3-384': entry['download']['sha3-384'],
+                    'channel': track + '/' + name,
+                    'arch': arch}
+    return None
+
+
+def get_store_snap_info(url_pool, snap_n, channel, arch):
+    """ Return the store download information for a snap in a channel.
+    :param url_pool: transport.Transport, or a urllib3 pool
+    :param channel: channel in the usual [<track>/]<risk>[/<branch>] format
+    :return: see find_store_snap_info(), None if the snap is not published
+             in that channel, or a more stable one of its track, for arch
+    """
+    channel_map = get_store_channel_map(url_pool, snap_n, arch)
+    if channel_map is None:
+        return None
+    return find_store_snap_info(channel_map, channel, arch)
+
+
+def fetch_store_snap(store, url_pool, snap_n, channel, arch, dest):
+    """ Get a snap published in the store, using the artifact store when
+    possible.
+    :param store: ArtifactStore, or None to always download
+    :param dest: directory where the snap is placed
+    :return: path to the snap file, or None if it is not published
+    """
+    info = get_store_snap_info(url_pool, snap_n, channel, arch)
+    if info is None:
+        return None
+    return fetch_store_snap_revision(store, url_pool, snap_n, info, dest)
+
+
+def fetch_store_snap_revision(store, url_pool, snap_n, info, dest):
+    """ Like fetch_store_snap(), for a revision found with
+    get_store_snap_info() or find_store_snap_info().
+    :return: path to the snap file
+    """
+    digest = info['sha3-384']
+    os.makedirs(dest, exist_ok=True)
+    snap_p = os.path.join(dest, '{}_{}.snap'.format(snap_n, info['revision']))
+    if store is not None and store.place(digest, snap_p):
+        return snap_p
+
+    print('Downloading {} revision {} ({}) for {}'.format(
+        snap_n, info['revision'], info['channel'], info['arch']))
+    # Unique name, so concurrent downloads to dest do not clash
+    tmp_p = '{}.{}.partial'.format(snap_p, uuid.uuid4().hex)
+    sha3 = hashlib.sha3_384()
+    try:
+        response = url_pool.request('GET', info['url'],
+                                    preload_content=False)
+        try:
+            if response.status != 200:
+                raise urllib3.exceptions.HTTPError(
+                    'downloading {} failed with status {}'.format(
+                        info['url'], response.status))
+            with open(tmp_p, 'xb') as out_f:
+                for chunk in response.stream(CHUNK_SIZE):
+                    sha3.update(chunk)
+                    out_f.write(chunk)
+        finally:
+            response.release_conn()
+        if sha3.hexdigest() != digest:
+            raise urllib3.exceptions.HTTPError(
+                'SHA3-384 mismatch for {}'.format(info['url']))
+        os.replace(tmp_p, snap_p)
+    except BaseException:
+        _remove_partial(tmp_p)
+        raise
+    if store is not None:
+        try:
+            store.add_file(snap_p, digest)
+        except OSError as ex:
+            print('WARNING: could not add {} to artifact store: {}'.format(
+                snap_p, ex))
+    return snap_p
+
+
+def open_store_snap(store, url_pool, snap_n, channel, arch):
+    """ Open a snap published in the store to read files from it, without
+    downloading it. The snap is read from the artifact store if it is there,
+    and otherwise with HTTP range requests. In the latter case the SHA3-384
+    of the snap cannot be checked, as only some blocks are fetched.
+    :param store: ArtifactStore, or None to always read remotely
+    :return: squashfs.SquashFS, or None if the snap is not published
+    :raises squashfs.SquashFSError: if the snap cannot be read remotely, use
+                                    fetch_store_snap() in that case
+    """
+    info = get_store_snap_info(url_pool, snap_n, channel, arch)
+    if info is None:
+        return None
+    return open_store_snap_revision(store, url_pool, snap_n, info)
+
+
+def open_store_snap_revision(store, url_pool, snap_n, info):
+    """ Like open_store_snap(), for a revision found with
+    get_store_snap_info() or find_store_snap_info().
+    :return: squashfs.SquashFS
+    """
+    if store is not None:
+        obj_p = store.object_path(info['sha3-384'])
+        try:
+            snap = squashfs.SquashFS.open(obj_p)
+        except FileNotFoundError:
+            pass
+        else:
+            store._touch(obj_p)
+            print('Reading {} revision {} from artifact store'.format(
+                snap_n, info['revision']))
+            return snap
+
+    print('Reading {} revision {} ({}) for {} remotely'.format(
+        snap_n, info['revision'], info['channel'], info['arch']))
+    return squashfs.SquashFS(squashfs.HTTPSource(info['url'], url_pool))
+
+
+def _extract_paths(snap, snap_n, paths, out_d):
+    for path in paths:
+        dest = os.path.join(out_d, path.strip('/'))
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        try:
+            snap.extract(path, dest)
+        except (FileNotFoundError, NotADirectoryError):
+            print(path, 'not found in', snap_n)
+
+
+def extract_store_snap_paths(store, url_pool, snap_n, info, paths, out_d):
+    """ Extract paths from a published snap revision into out_d, like
+    'unsquashfs -d <out_d> <snap> <paths>...'. Paths not found in the snap
+    are skipped. Only the needed blocks are fetched if possible, see
+    open_store_snap(). Otherwise the snap is downloaded, and unsquashfs is
+    used as last resort if the snap cannot be read in-process.
+    :param info: revision found with get_store_snap_info() or
+                 find_store_snap_info()
+    """
+    try:
+        with open_store_snap_revision(store, url_pool, snap_n, info) as snap:
+            _extract_paths(snap, snap_n, paths, out_d)
+            if isinstance(snap.source, squashfs.HTTPSource):
+                print('Fetched {} KiB in {} requests'.format(
+                    snap.source.bytes_fetched // 1024, snap.source.requests))
+        return
+    except squashfs.SquashFSError as ex:
+        print('Cannot read {} remotely ({}), downloading it'.format(
+            snap_n, ex))
+
+    with tempfile.TemporaryDirectory() as tmp_d:
+        snap_p = fetch_store_snap_revision(store, url_pool, snap_n, info,
+                                           tmp_d)
+        try:
+            with squashfs.SquashFS.open(snap_p) as snap:
+                _extract_paths(snap, snap_n, paths, out_d)
+        except squashfs.SquashFSError as ex:
+            print('Cannot read {} ({}), using unsquashfs'.format(snap_p, ex))
+            subprocess.run(['unsquashfs', '-f', '-d', out_d, snap_p] + paths,
+                           stdout=subprocess.DEVNULL, check=True)
@@ -0,0 +1,160 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Helpers to show Launchpad build logs without holding them in memory.
+# Logs are served gzipped and can be hundreds of MB once decompressed, so
+# they are decompressed while downloading and only the interesting lines
+# are kept around.
+
+import collections
+import os
+import re
+import sys
+import zlib
+
+# Modes for showing a build log:
+#   errors: context windows around failure markers, plus the log tail
+#   tail: the last lines of the log
+#   full: the complete log is written to a file, the tail is printed
+LOG_MODES = ['errors', 'tail', 'full']
+DEFAULT_LOG_MODE = 'errors'
+DEFAULT_LOG_LINES = 100
+
+# Lines printed around each failure marker
+ERROR_CONTEXT = 10
+# Only the last windows are kept, earlier matches tend to be noise from
+# configure checks and the like.
+MAX_ERROR_WINDOWS = 5
+# Tail printed after the error windows in 'errors' mode
+ERROR_TAIL = 30
+
+CHUNK_SIZE = 64 * 1024
+
+# Markers of failures in snapcraft, apt and build tools output
+ERROR_MARKERS = re.compile(
+    r'^(E: |Err:|ERROR|Error|error:|Failed|FAILED|Traceback)|'
+    r'(Failed to |failed with exit code|returned exit code|'
+    r'Unable to locate package|Build failed)')
+
+
+def iter_gzip_lines(chunks):
+    """ Decompress a gzip stream incrementally and yield its lines.
+    :param chunks: iterable with the compressed data
+    :return: generator of decoded lines, without line terminator
+    """
+    decomp = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    pending = b''
+    for chunk in chunks:
+        lines = (pending + decomp.decompress(chunk)).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line.decode('utf-8', errors='replace')
+    lines = (pending + decomp.flush()).split(b'\n')
+    if lines[-1] == b'':
+        lines.pop()
+    for line in lines:
+        yield line.decode('utf-8', errors='replace')
+
+
+def error_excerpt(lines, context=ERROR_CONTEXT, windows=MAX_ERROR_WINDOWS,
+                  tail=ERROR_TAIL):
+    """ Select context windows around failure markers and the log tail.
+    :param lines: iterable with the log lines
+    :return: sorted list of (line number, line) tuples
+    """
+    before = collections.deque(maxlen=context)
+    last_lines = collections.deque(maxlen=tail)
+    kept = collections.deque(maxlen=windows)
+    window = None
+    after = 0
+    for num, line in enumerate(lines, 1):
+        if ERROR_MARKERS.search(line):
+            if window is None:
+                window = list(before)
+                kept.append(window)
+            window.append((num, line))
+            after = context
+        elif window is not None:
+            window.append((num, line))
+            after -= 1
+            if after == 0:
+                window = None
+        before.append((num, line))
+        last_lines.append((num, line))
+
+    selected = dict(last_lines)
+    for w in kept:
+        selected.update(w)
+    return sorted(selected.items())
+
+
+def tail_excerpt(lines, count):
+    """ Return the last lines of the log as (line number, line) tuples. """
+    return list(collections.deque(enumerate(lines, 1), maxlen=count))
+
+
+def _print_excerpt(excerpt, out):
+    prev = 0
+    for num, line in excerpt:
+        if num != prev + 1:
+            print('[...]', file=out)
+        print(line, file=out)
+        prev = num
+
+
+def _save_lines(lines, path):
+    with open(path, 'w') as log_f:
+        for line in lines:
+            log_f.write(line + '\n')
+            yield line
+
+
+def show_build_log(url_pool, buildlog, mode=DEFAULT_LOG_MODE,
+                   count=DEFAULT_LOG_LINES, results_dir=None,
+                   out=sys.stdout):
+    """ Stream a gzipped build log and print the part selected by mode.
+    :param url_pool: transport.Transport, or a urllib3 pool, used for the
+                     download
+    :param buildlog: url of the build log
+    :param mode: one of LOG_MODES
+    :param count: number of lines printed in 'tail' and 'full' modes
+    :param results_dir: where the log is saved in 'full' mode
+    """
+    response = url_pool.request('GET', buildlog, preload_content=False)
+    try:
+        lines = iter_gzip_lines(response.stream(CHUNK_SIZE))
+        log_path = None
+        if mode == 'full':
+            if results_dir is None:
+                results_dir = os.getcwd()
+            os.makedirs(results_dir, exist_ok=True)
+            log_name = os.path.basename(buildlog)
+            if log_name.endswith('.gz'):
+                log_name = log_name[:-len('.gz')]
+            log_path = os.path.join(results_dir, log_name)
+            lines = _save_lines(lines, log_path)
+
+        if mode == 'errors':
+            excerpt = error_excerpt(lines)
+        else:
+            excerpt = tail_excerpt(lines, count)
+    finally:
+        response.release_conn()
+
+    _print_excerpt(excerpt, out)
+    if log_path is not None:
+        print('Full build log saved to {}'.format(log_path), file=out)
+    out.flush()
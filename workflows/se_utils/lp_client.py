@@ -0,0 +1,285 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# asyncio client for the Launchpad web service. It covers only the few
+# operations used by the workflow scripts, but unlike launchpadlib it lets
+# many of them run at the same time. Requests are done by the transport in
+# worker threads, with a limit on the number of concurrent requests and
+# retries with jittered exponential backoff on transient errors. Retries are
+# done here and not by the transport, as each attempt needs a new nonce.
+#
+# Entries and collections are returned as the JSON dictionaries sent by
+# Launchpad, so attributes are accessed with entry['self_link'] and similar.
+
+import asyncio
+import configparser
+import json
+import time
+import urllib.parse
+import uuid
+
+import urllib3
+
+from se_utils import transport
+
+LP_SERVICE_ROOT = 'https://api.launchpad.net/'
+LP_WEB_ROOT = 'https://launchpad.net/'
+LP_API_VERSION = 'devel'
+
+DEFAULT_MAX_CONCURRENCY = 8
+
+
+class LaunchpadError(Exception):
+    """ Error response from the Launchpad web service """
+
+    def __init__(self, method, url, status, content):
+        super().__init__('{} {} failed with status {}: {}'.format(
+            method, url, status, content[:500]))
+        self.method = method
+        self.url = url
+        self.status = status
+        self.content = content
+
+
+class Credentials():
+    """ OAuth credentials for Launchpad, signed with PLAINTEXT """
+
+    def __init__(self, consumer_key, consumer_secret='', access_token='',
+                 access_secret=''):
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
+        self.access_token = access_token
+        self.access_secret = access_secret
+
+    @classmethod
+    def from_file(cls, path):
+        """ Load credentials stored by launchpadlib """
+        with open(path) as creds_f:
+            return cls.from_string(creds_f.read())
+
+    @classmethod
+    def from_string(cls, contents):
+        """ Load credentials in the format used by launchpadlib """
+        parser = configparser.ConfigParser()
+        parser.read_string(contents)
+        section = parser.sections()[0]
+        return cls(parser.get(section, 'consumer_key'),
+                   parser.get(section, 'consumer_secret', fallback=''),
+                   parser.get(section, 'access_token'),
+                   parser.get(section, 'access_secret'))
+
+    def authorization(self, realm):
+        """ Return the Authorization header for a request """
+        signature = '{}&{}'.format(
+            urllib.parse.quote(self.consumer_secret, safe=''),
+            urllib.parse.quote(self.access_secret, safe=''))
+        params = [
+            ('oauth_consumer_key', self.consumer_key),
+            ('oauth_token', self.access_token),
+            ('oauth_signature_method', 'PLAINTEXT'),
+            ('oauth_signature', signature),
+            ('oauth_timestamp', str(int(time.time()))),
+            ('oauth_nonce', uuid.uuid4().hex),
+            ('oauth_version', '1.0'),
+        ]
+        return 'OAuth realm="{}", '.format(realm) + ', '.join(
+            '{}="{}"'.format(k, urllib.parse.quote(v, safe=''))
+            for k, v in params)
+
+
+def _encode_param(value):
+    # Same encoding as lazr.restfulclient: strings as they are and everything
+    # else as JSON.
+    if isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+class AsyncLaunchpad():
+    """ asyncio Launchpad web service client """
+
+    def __init__(self, credentials, service_root=LP_SERVICE_ROOT,
+                 version=LP_API_VERSION,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 retries=transport.DEFAULT_RETRIES, http_transport=None):
+        """
+        :param http_transport: transport.Transport for the requests, the one
+                               shared by the process if None
+        """
+        self.credentials = credentials
+        self.service_root = service_root
+        self.root = service_root + version + '/'
+        self.retries = retries
+        self.max_concurrency = max_concurrency
+        if http_transport is None:
+            http_transport = transport.get_transport()
+        self._transport = http_transport
+        self._semaphore = None
+        self._loop = None
+
+    @classmethod
+    def login(cls, credentials_path, **kwargs):
+        return cls(Credentials.from_file(credentials_path), **kwargs)
+
+    @classmethod
+    def login_anonymously(cls, consumer_name, **kwargs):
+        return cls(Credentials(consumer_name), **kwargs)
+
+    def url(self, link):
+        """ Return absolute url for a link relative to the API root """
+        if link.startswith('http://') or link.startswith('https://'):
+            return link
+        return self.root + link.lstrip('/')
+
+    def _limit(self):
+        # Semaphores must be created in the loop where they are used
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def _headers(self, headers=None):
+        all_headers = {
+            'Authorization': self.credentials.authorization(
+                self.service_root),
+            'Accept': 'application/json',
+        }
+        if headers is not None:
+            all_headers.update(headers)
+        return all_headers
+
+    async def _retry(self, method, url, func):
+        """ Run func in a worker thread, retrying on transient errors.
+        func does the request and returns a urllib3 response.
+        """
+        retry_statuses = transport.retry_statuses(method)
+        attempt = 0
+        while True:
+            async with self._limit():
+                try:
+                    response = await asyncio.to_thread(func)
+                    error = None
+                except urllib3.exceptions.HTTPError as ex:
+                    if not transport.is_transient(ex, method):
+                        raise
+                    error = ex
+            if error is None:
+                if response.status < 400:
+                    return response
+                error = LaunchpadError(
+                    method, url, response.status,
+                    response.data.decode('utf-8', errors='replace'))
+                if response.status not in retry_statuses:
+                    raise error
+            if attempt == self.retries:
+                raise error
+            delay = transport.backoff_delay(attempt)
+            print('{} {} failed ({}), retrying in {:.1f}s'.format(
+                method, url, error, delay))
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _request(self, method, link, fields=None, body=None,
+                       headers=None):
+        url = self.url(link)
+
+        def do_request():
+            kwargs = {'headers': self._headers(headers)}
+            if fields is not None:
+                kwargs['fields'] = fields
+                if method == 'POST':
+                    kwargs['encode_multipart'] = False
+            if body is not None:
+                kwargs['body'] = body
+            return self._transport.request(method, url, retries=0, **kwargs)
+
+        response = await self._retry(method, url, do_request)
+        if response.status == 201 and 'Location' in response.headers:
+            # Factory operations return the link to the new object
+            return await self.load(response.headers['Location'])
+        if len(response.data) == 0:
+            return None
+        return json.loads(response.data)
+
+    async def load(self, link):
+        """ Load an entry or a page of a collection """
+        return await self._request('GET', link)
+
+    async def collection(self, link):
+        """ Return all the entries of a collection """
+        page = await self.load(link)
+        entries = page['entries']
+        while 'next_collection_link' in page:
+            page = await self.load(page['next_collection_link'])
+            entries.extend(page['entries'])
+        return entries
+
+    async def named_get(self, link, operation, **params):
+        fields = {k: _encode_param(v) for k, v in params.items()}
+        fields['ws.op'] = operation
+        return await self._request('GET', link, fields=fields)
+
+    async def named_post(self, link, operation, **params):
+        fields = {k: _encode_param(v) for k, v in params.items()}
+        fields['ws.op'] = operation
+        return await self._request('POST', link, fields=fields)
+
+    async def patch(self, link, attributes):
+        """ Modify attributes of an entry, like launchpadlib's lp_save """
+        return await self._request(
+            'PATCH', link, body=json.dumps(attributes),
+            headers={'Content-Type': 'application/json'})
+
+    async def delete(self, link):
+        return await self._request('DELETE', link)
+
+    async def download(self, url, path):
+        """ Download a file served by Launchpad to path """
+        # Files of private builds are served only to authenticated
+        # requests, which must go through the API host.
+        url = url.replace(LP_WEB_ROOT, self.root)
+
+        def do_download():
+            headers = {'Authorization': self.credentials.authorization(
+                self.service_root)}
+            return self._transport.download(url, path, headers=headers,
+                                            retries=0)
+
+        await self._retry('GET', url, do_download)
+
+    # Helpers for the operations used by the workflows
+
+    async def request_build(self, snap, **params):
+        return await self.named_post(snap['self_link'], 'requestBuild',
+                                     **params)
+
+    async def request_builds(self, snap, **params):
+        return await self.named_post(snap['self_link'], 'requestBuilds',
+                                     **params)
+
+    async def get_build_summaries(self, snap, build_ids):
+        return await self.named_get(snap['self_link'], 'getBuildSummaries',
+                                    build_ids=build_ids)
+
+    async def get_file_urls(self, build_link):
+        return await self.named_get(build_link, 'getFileUrls')
+
+    async def create_snap(self, **params):
+        return await self.named_post('+snaps', 'new', **params)
+
+    async def delete_snap(self, snap):
+        return await self.delete(snap['self_link'])
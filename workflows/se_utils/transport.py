@@ -0,0 +1,308 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# HTTP transport used by the workflow scripts, so timeouts, retries and
+# connection reuse are the same everywhere and tuned only here. It keeps a
+# pool of connections per host, and requests have connect and read timeouts.
+# Transient errors and statuses are retried with jittered exponential
+# backoff. Bodies can be streamed, and small responses are requested
+# compressed with gzip. The status, attempts, time and size of each request
+# are recorded, and a summary per host is printed to stderr at exit when the
+# SE_HTTP_METRICS environment variable is set.
+#
+# Transport.request() has the same signature as request() in urllib3 pools,
+# and errors are the urllib3 exceptions, so a Transport can be passed where
+# a pool is expected.
+
+import atexit
+import os
+import random
+import shutil
+import sys
+import threading
+import time
+import urllib.parse
+import uuid
+from collections import namedtuple
+
+import urllib3
+
+DEFAULT_MAX_CONNECTIONS = 10
+DEFAULT_RETRIES = 5
+# Base and maximum delay in seconds between retries
+RETRY_BACKOFF = 2
+RETRY_BACKOFF_MAX = 60
+CONNECT_TIMEOUT = 30
+READ_TIMEOUT = 300
+MAX_REDIRECTS = 5
+# Statuses worth retrying for. Requests that are not idempotent are retried
+# only when the error comes from front-ends or proxies, so for instance we
+# do not request builds twice.
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+RETRY_STATUSES_POST = [502, 503]
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+METRICS_ENV = 'SE_HTTP_METRICS'
+
+# Metrics of a request. status is the name of the exception if there was no
+# response, and size is None when the body was streamed to the caller.
+RequestMetrics = namedtuple('RequestMetrics', ['method', 'host', 'status',
+                                               'attempts', 'seconds', 'size'])
+
+# Transports with metrics to print at exit
+_transports = []
+
+
+def is_transient(ex, method):
+    """ Whether a urllib3 exception is worth retrying the request """
+    if isinstance(ex, urllib3.exceptions.MaxRetryError):
+        ex = ex.reason
+    # The request did not reach the server
+    if isinstance(ex, (urllib3.exceptions.NewConnectionError,
+                       urllib3.exceptions.ConnectTimeoutError)):
+        return True
+    if method == 'POST':
+        return False
+    return isinstance(ex, (urllib3.exceptions.ProtocolError,
+                           urllib3.exceptions.ReadTimeoutError,
+                           urllib3.exceptions.SSLError))
+
+
+def retry_statuses(method):
+    """ Statuses for which a request with this method is retried """
+    if method == 'POST':
+        return RETRY_STATUSES_POST
+    return RETRY_STATUSES
+
+
+def backoff_delay(attempt):
+    """ Seconds to wait before retrying after the given attempt, from 0 """
+    delay = min(RETRY_BACKOFF * 2 ** attempt, RETRY_BACKOFF_MAX)
+    return random.uniform(delay / 2, delay)
+
+
+def get_text_encoding(response, default='utf-8'):
+    """ Encoding of a text response, from the charset in its Content-Type
+    header. Without charset, it is ISO-8859-1 for text types, as HTTP/1.1
+    says, and the default for others.
+    """
+    mime, _, params = response.headers.get('Content-Type', '').partition(';')
+    for param in params.split(';'):
+        key, _, value = param.strip().partition('=')
+        if key.strip().lower() == 'charset':
+            return value.strip('\'" ')
+    mime = mime.strip().lower()
+    if mime.startswith('text/'):
+        return 'ISO-8859-1'
+    return default
+
+
+class Transport():
+    """ Pooled HTTP client with retries and metrics, thread safe """
+
+    def __init__(self, max_connections=DEFAULT_MAX_CONNECTIONS,
+                 connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 retries=DEFAULT_RETRIES):
+        """
+        :param max_connections: connections kept open for each host
+        :param retries: default number of retries of a request
+        """
+        self.retries = retries
+        self.timeout = urllib3.Timeout(connect=connect_timeout,
+                                       read=read_timeout)
+        # Retries are handled by us, urllib3 only follows redirects, as
+        # needed by file downloads.
+        self._pool = urllib3.PoolManager(
+            maxsize=max_connections,
+            retries=urllib3.Retry(total=None, connect=0, read=0, status=0,
+                                  other=0, redirect=MAX_REDIRECTS),
+            timeout=self.timeout)
+        self._lock = threading.Lock()
+        self.metrics = []
+        # Only kept alive until exit when the metrics are printed
+        if os.environ.get(METRICS_ENV):
+            _transports.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """ Close the connections, the transport can still be used """
+        self._pool.clear()
+
+    def _record(self, method, url, status, attempts, start, size):
+        metrics = RequestMetrics(method, urllib.parse.urlsplit(url).netloc,
+                                 status, attempts, time.monotonic() - start,
+                                 size)
+        with self._lock:
+            self.metrics.append(metrics)
+
+    def _with_retries(self, method, url, retries, func):
+        """ Call func until it returns a response with a status that is not
+        retried, or it raises an error that is not transient, at most
+        retries + 1 times. func returns the response and the size of the
+        body, or None if it is not known.
+        """
+        if retries is None:
+            retries = self.retries
+        statuses = retry_statuses(method)
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                response, size = func()
+            except urllib3.exceptions.HTTPError as ex:
+                if attempt == retries or not is_transient(ex, method):
+                    reason = getattr(ex, 'reason', None) or ex
+                    self._record(method, url, type(reason).__name__,
+                                 attempt + 1, start, None)
+                    raise
+                error = ex
+            else:
+                if attempt == retries or response.status not in statuses:
+                    self._record(method, url, response.status, attempt + 1,
+                                 start, size)
+                    return response
+                error = 'status {}'.format(response.status)
+                # Reuse the connection for the next attempt
+                response.drain_conn()
+                response.release_conn()
+            delay = backoff_delay(attempt)
+            print('{} {} failed ({}), retrying in {:.1f}s'.format(
+                method, url, error, delay), file=sys.stderr)
+            time.sleep(delay)
+            attempt += 1
+
+    def request(self, method, url, fields=None, headers=None,
+                preload_content=True, accept_gzip=None, timeout=None,
+                retries=None, **kwargs):
+        """ Do a request, retrying on transient errors and statuses. As with
+        urllib3, the response is returned whatever its status, and with
+        preload_content=False the caller reads the body and then calls
+        release_conn().
+        :param accept_gzip: ask for a gzip compressed body, which is
+                            decompressed while read. By default, only for
+                            preloaded bodies of requests without ranges.
+        :param timeout: urllib3.Timeout or seconds, the default of the
+                        transport if None
+        :param retries: number of retries, the default of the transport if
+                        None
+        """
+        headers = dict(headers or {})
+        if accept_gzip is None:
+            accept_gzip = preload_content and 'Range' not in headers
+        if accept_gzip:
+            headers.setdefault('Accept-Encoding', 'gzip')
+        if timeout is None:
+            timeout = self.timeout
+
+        def do_request():
+            response = self._pool.request(method, url, fields=fields,
+                                          headers=headers,
+                                          preload_content=preload_content,
+                                          timeout=timeout, **kwargs)
+            size = len(response.data) if preload_content else None
+            return response, size
+
+        return self._with_retries(method, url, retries, do_request)
+
+    def download(self, url, path, headers=None, timeout=None, retries=None):
+        """ Download url to path, which is written only if the status is
+        200. The body is written to a temporary file next to path, which is
+        renamed when complete and removed on errors. The whole download is
+        retried on transient errors.
+        :return: the response, with the body already read
+        """
+        if timeout is None:
+            timeout = self.timeout
+
+        def do_download():
+            response = self._pool.request('GET', url, headers=headers,
+                                          preload_content=False,
+                                          timeout=timeout)
+            if response.status != 200:
+                # Keep the body in response.data for error messages
+                try:
+                    response.read(cache_content=True)
+                finally:
+                    response.release_conn()
+                return response, None
+            # Unique, so concurrent downloads to the same path do not mix
+            partial_path = '{}.{}.partial'.format(path, uuid.uuid4().hex)
+            try:
+                with open(partial_path, 'xb') as out_file:
+                    shutil.copyfileobj(response, out_file,
+                                       DOWNLOAD_CHUNK_SIZE)
+                    size = out_file.tell()
+                os.replace(partial_path, path)
+            except BaseException:
+                try:
+                    os.remove(partial_path)
+                except FileNotFoundError:
+                    pass
+                raise
+            finally:
+                response.release_conn()
+            return response, size
+
+        return self._with_retries('GET', url, retries, do_download)
+
+    def summary(self):
+        """ Return a line with the totals of the requests for each host """
+        hosts = {}
+        with self._lock:
+            metrics = list(self.metrics)
+        for req in metrics:
+            totals = hosts.setdefault(req.host, {
+                'requests': 0, 'retries': 0, 'failed': 0, 'size': 0,
+                'seconds': 0.0})
+            totals['requests'] += 1
+            totals['retries'] += req.attempts - 1
+            if isinstance(req.status, str) or req.status >= 400:
+                totals['failed'] += 1
+            totals['size'] += req.size or 0
+            totals['seconds'] += req.seconds
+        return ['{}: {} requests, {} retries, {} failed, {} KiB, {:.1f}s'
+                .format(host, totals['requests'], totals['retries'],
+                        totals['failed'], totals['size'] // 1024,
+                        totals['seconds'])
+                for host, totals in sorted(hosts.items())]
+
+
+_default_lock = threading.Lock()
+_default = None
+
+
+def get_transport():
+    """ Return the transport shared by all the code in the process """
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = Transport()
+        return _default
+
+
+def _print_metrics():
+    if not os.environ.get(METRICS_ENV):
+        return
+    for transport in _transports:
+        for line in transport.summary():
+            print('HTTP ' + line, file=sys.stderr)
+
+
+atexit.register(_print_metrics)
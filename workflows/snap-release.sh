@@ -51,53 +51,18 @@ set_git_identity()
 # $5 Chunk of changes coming from staged packages
 update_changelog()
 {
-    local commits i text range
     local snap=$1
     local ver=$2
     local prev_ver=$3
     local changelog_file=$4
     local pkg_changes=$5
-    local changes author full_text
+    local merges_text full_text
 
-    if [ -n "$prev_ver" ]; then
-        range=$prev_ver..HEAD
-    else
-        range=HEAD
-    fi
-
-    commits=$(git rev-list --merges --reverse "$range")
-    declare -A changes
-
-    for i in $commits; do
-        local body merge_proposal description text
-
-        body=$(git log --format=%B -n1 "$i")
-        merge_proposal=$(echo "$body" | grep "^Merge-Proposal:") || true
-        author=$(echo "$body" | grep "^Author:") || true
-        author="${author#Author: *}"
-        if [ -z "$author" ]; then
-            # Probably github instead of launchpad
-            author=$(git log --format='%an <%ae>' "$i"^!)
-            merge_proposal=$(echo "$body" | grep "Merge pull request") || true
-        fi
-        # 'sed' removes leading blank lines first, then adds indentation
-        description=$(echo "$body" | grep -v "^Author:\|^Merge" | \
-                        sed '/./,$!d' | sed '3,$s/^/    /') || true
-        if [ -z "$description" ]; then
-            description="See more information in merge proposal"
-        fi
-        text=${changes[$author]}
-        printf -v text "%s\n  * %s\n    %s" \
-               "$text" "$description" "$merge_proposal"
-        changes[$author]=$text
-    done
-
-    printf -v full_text "%s\n" "$(date --rfc-3339=date --utc) $snap $ver"
-    for author in "${!changes[@]}"; do
-        printf -v full_text "%s\n  [ %s ]%s\n" \
-               "$full_text" "$author" "${changes[$author]}"
-    done
-    printf -v full_text "%s\n%s" "$full_text" "$pkg_changes"
+    # The text for the merges always ends with a single new line, which is
+    # removed by the command substitution.
+    merges_text=$("$CICD_SCRIPTS"/changelog-from-git.py \
+                      "$snap" "$ver" "$prev_ver")
+    printf -v full_text "%s\n\n%s" "$merges_text" "$pkg_changes"
 
     if [ ! -f "$changelog_file" ]; then
         touch "$changelog_file"
@@ -109,56 +74,6 @@ update_changelog()
     git commit -m "Update $changelog_file for $ver"
 }
 
-# Gets manifest from a published snap
-# $1: snap name
-# $2: channel to download from
-# $3: architecture
-# $4: output folder
-get_old_manifest()
-{
-    local snap_n=$1
-    local channel=$2
-    local arch=$3
-    local out_d=$4
-    local dir track
-
-    dir=$(mktemp -d)
-    (
-        cd "$dir"
-        # We set proxy for snapd as in the future 'snap download' will
-        # use snapd instead of downloading on its own. See
-        # https://forum.snapcraft.io/t/downloading-snaps-via-snapd/11449
-        #sudo snap set system proxy.http="$HTTP_PROXY"
-        #sudo snap set system proxy.https="$HTTPS_PROXY"
-        if ! UBUNTU_STORE_ARCH="$arch" \
-             snap download --channel="$channel" "$snap_n"; then
-            # First time we release for this track?
-            # Try with "previous" track to get good history
-            track=${channel%%/*}
-            if [ "$track" -gt 20 ]
-            then track=$((track - 2))
-            else
-                if [ "$snap_n" = network-manager ] || [ "$snap_n" = modem-manager ]
-                then track=1.10
-                else track=latest
-                fi
-            fi
-            if ! UBUNTU_STORE_ARCH="$arch" \
-                 snap download --channel="$track/${channel#*/}" "$snap_n"; then
-                # Now try with amd64
-                if ! UBUNTU_STORE_ARCH=amd64 \
-                     snap download --channel="$channel" "$snap_n"; then
-                    # Final try with amd64 from previous release
-                    UBUNTU_STORE_ARCH=amd64 snap download --channel="$track/${channel#*/}" "$snap_n"
-                fi
-            fi
-        fi
-        unsquashfs "$snap_n"_*.snap snap/manifest.yaml
-    )
-    mv "$dir/squashfs-root/snap/manifest.yaml" "$out_d"/manifest-"$arch".yaml
-    rm -rf "$dir"
-}
-
 # Bumps version in snapcraft
 # $1 Version to be set in the snapcraft.yaml file
 # $2 Path to the snapcraft.yaml file
@@ -186,54 +101,21 @@ open_next_version_development()
     git push origin "$_release_branch"
 }
 
-# Return changes in the debian packages of which at least a file has been
-# included in the snap, for a given snap file.
+# Prepare the manifests needed to get the changes in the debian packages of
+# which at least a file has been included in the snap, for a given snap file.
+# The new manifest still needs to go through unstage-from-manifest.py.
 # $1: path to snap
-# $2: channel to get old manifest from (used only if not locally present)
-# $3: directory where to store new manifest
-# $4: name of variable to store the text output
-get_pkg_changes_for_snap()
+# $2: directory where to store new manifest and docs
+prepare_manifests_for_snap()
 {
     local snap_p=$1
-    local chan=$2
-    local unsquash_d=$3
-    local out_var=$4
-    local manifest_d=manifests
-    local manifest_p arch unstage_f snap_n
-
-    arch=${snap_p##*_}
-    arch=${arch%.snap}
-    # We want this manifest to be stored in the git repo
-    manifest_p=$manifest_d/manifest-"$arch".yaml
-
-    if ! [ -f "$manifest_p" ]; then
-        mkdir -p $manifest_d
-        snap_n=${snap_p##*/}
-        snap_n=${snap_n%%_*}
-        get_old_manifest "$snap_n" "$chan" "$arch" $manifest_d
-    fi
+    local unsquash_d=$2
 
     rm -rf "$unsquash_d"
-    unsquashfs -d "$unsquash_d" "$snap_p" snap/manifest.yaml snap/unstage.txt \
-               usr/share/doc/
-
-    if [ -f "$unsquash_d"/snap/unstage.txt ]; then
-        unstage_f="$unsquash_d"/snap/unstage.txt
-    else
-        unstage_f=unstage.txt
-    fi
-    "$CICD_SCRIPTS"/unstage-from-manifest.py "$unstage_f" \
-                    "$unsquash_d"/snap/manifest.yaml "$unsquash_d"/manifest.yaml
-
-    # Get changes from deb packages - add a 2 space indentation
-    pkg_changes=$("$CICD_SCRIPTS"/changelog-from-manifest.py \
-                                 "$manifest_p" \
-                                 "$unsquash_d"/manifest.yaml \
-                                 "$unsquash_d"/usr/share/doc/ | sed 's/^/  /')
-    # Update now the manifest in the repo
-    cp "$unsquash_d"/manifest.yaml "$manifest_p"
-
-    eval "$out_var"='$pkg_changes'
+    "$CICD_SCRIPTS"/extract-from-snap.py -d "$unsquash_d" "$snap_p" \
+        snap/manifest.yaml snap/unstage.txt usr/share/doc/ ||
+        unsquashfs -f -d "$unsquash_d" "$snap_p" snap/manifest.yaml \
+                   snap/unstage.txt usr/share/doc/
 }
 
 # Return changes in the debian packages of which at least a file has been
@@ -241,7 +123,7 @@ get_pkg_changes_for_snap()
 # $1: snap name
 # $2: channel to get old manifest from (used only if not locally present)
 # $3: build directory
-# $4: directory where to store new manifest
+# $4: directory where to store new manifests
 # $5: name of variable to store the text output
 get_pkg_changes()
 {
@@ -250,30 +132,68 @@ get_pkg_changes()
     local build_d=$3
     local out_d=$4
     local out_text_var=$5
-    local first=true prev_changes="" snap_p changes
-
-    # We actually expect the changelog to be the same for all archs, at least
-    # the staged packages are the same for all archs in all system snaps. So,
-    # just compare the output and exit with an error if changelogs differ in the
-    # end. That may happen if a package has been updated in the archive for some
-    # archs, but we hit a race and for others the package has not been uploaded
-    # yet.  Rebuilding should fix things in that case. Or, we might have hit a
-    # real difference and we need to investigate why.
+    local snap_p arch unstage_f changes_f pkg_changes
+    local unstage_args=() pairs=() missing_archs=()
+
+    mkdir -p "$out_d"
+    # Get the old manifests that are not in the repo yet from the published
+    # snaps, for all archs at once.
+    for snap_p in "$build_d"/"$snap_n"_*.snap; do
+        arch=${snap_p##*_}
+        arch=${arch%.snap}
+        if ! [ -f manifests/manifest-"$arch".yaml ]; then
+            missing_archs+=("$arch")
+        fi
+    done
+    if [ ${#missing_archs[@]} -gt 0 ]; then
+        "$CICD_SCRIPTS"/fetch-old-manifests.py "$snap_n" "$chan" manifests \
+                       "${missing_archs[@]}"
+    fi
+
     for snap_p in "$build_d"/"$snap_n"_*.snap; do
-        get_pkg_changes_for_snap "$snap_p" "$chan" "$out_d" changes
-
-        if [ "$first" = false ]; then
-            if [ "$changes" != "$prev_changes" ]; then
-                printf "ERROR: different changelogs:%s\nversus\n%s\n" \
-                       "$prev_changes" "$changes"
-                exit 1
-            fi
+        arch=${snap_p##*_}
+        arch=${arch%.snap}
+        prepare_manifests_for_snap "$snap_p" "$out_d/$arch"
+        if [ -f "$out_d/$arch"/snap/unstage.txt ]; then
+            unstage_f="$out_d/$arch"/snap/unstage.txt
+        else
+            unstage_f=unstage.txt
         fi
-        prev_changes=$changes
-        first=false
+        unstage_args+=("$unstage_f" "$out_d/$arch"/snap/manifest.yaml
+                       "$out_d/$arch"/manifest.yaml)
+        pairs+=(--pair "$arch" manifests/manifest-"$arch".yaml
+                "$out_d/$arch"/manifest.yaml "$out_d/$arch"/usr/share/doc/)
+    done
+    # Unstage packages for all archs in one go
+    "$CICD_SCRIPTS"/unstage-from-manifest.py "${unstage_args[@]}"
+
+    # Changes for all archs are obtained in a single run, so each changelog
+    # is fetched only once. We actually expect the changelog to be the same
+    # for all archs, at least the staged packages are the same for all archs
+    # in all system snaps. So, --strict makes the script fail if changelogs
+    # differ, showing the differences between archs. That may happen if a
+    # package has been updated in the archive for some archs, but we hit a
+    # race and for others the package has not been uploaded yet. Rebuilding
+    # should fix things in that case. Or, we might have hit a real
+    # difference and we need to investigate why.
+    changes_f="$out_d"/changes.txt
+    if ! "$CICD_SCRIPTS"/changelog-from-manifest.py --strict "${pairs[@]}" \
+         > "$changes_f"; then
+        printf "ERROR: different changelogs:\n"
+        cat "$changes_f"
+        exit 1
+    fi
+    # Add a 2 space indentation
+    pkg_changes=$(sed 's/^/  /' "$changes_f")
+
+    # Update now the manifests in the repo
+    for snap_p in "$build_d"/"$snap_n"_*.snap; do
+        arch=${snap_p##*_}
+        arch=${arch%.snap}
+        cp "$out_d/$arch"/manifest.yaml manifests/manifest-"$arch".yaml
     done
 
-    eval "$out_text_var"='$prev_changes'
+    eval "$out_text_var"='$pkg_changes'
 }
 
 # $1: release branch
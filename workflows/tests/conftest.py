@@ -0,0 +1,27 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Tests of the workflow scripts and their modules, run with:
+#
+#   python3 -m pytest workflows/tests
+
+import os
+import sys
+
+WORKFLOWS_D = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The scripts import se_utils and tools from their own directory
+sys.path.insert(0, WORKFLOWS_D)
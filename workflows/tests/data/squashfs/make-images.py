@@ -0,0 +1,631 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Writes the squashfs images used by the tests, tree-<compression>.sqfs, one
+# per compression and all with the tree of make_tree(), together with:
+#
+#   tree.lln     listing of the images, as 'unsquashfs -lln' prints it
+#   tree.sha256  digests of the regular files, as sha256sum prints them
+#
+# The images are written here instead of with mksquashfs so they are small
+# and reproducible, and have every structure the reader has to handle, some
+# of which mksquashfs only uses for large trees: sparse blocks, file tails
+# in blocks and in fragments, uncompressed blocks, hard links, extended
+# file, directory and symlink inodes, directory indexes and directories with
+# more than one header, devices and fifos, and the export table. The
+# writer follows the layout of mksquashfs, and is independent from
+# tools/squashfs_repack.py so the tests do not check the reader against
+# itself.
+#
+# With --verify, which needs root, each image is mounted with the kernel
+# and compared with tree.lln and tree.sha256, and also listed with
+# unsquashfs if installed. The kernel does not support lzma images.
+#
+# gzip, lzma and xz need only the standard library, lz4 the lz4 module,
+# lzo the lzallright module and zstd the zstandard module.
+
+import argparse
+import datetime
+import hashlib
+import lzma
+import os
+import random
+import stat
+import struct
+import subprocess
+import sys
+import tempfile
+import zlib
+
+DATA_D = os.path.dirname(os.path.abspath(__file__))
+
+BLOCK_LOG = 12
+BLOCK_SIZE = 1 << BLOCK_LOG
+METADATA_SIZE = 8192
+MTIME = 1704067200  # 2024-01-01 00:00 UTC
+INVALID_TABLE = 0xffffffffffffffff
+NO_FRAGMENT = 0xffffffff
+NO_XATTR = 0xffffffff
+UNCOMPRESSED = 1 << 24
+# Superblock flags of mksquashfs without options
+FLAGS = 0x00c0
+COMPRESSOR_OPTIONS = 0x0400
+
+COMPRESSIONS = {'gzip': 1, 'lzma': 2, 'lzo': 3, 'xz': 4, 'lz4': 5,
+                'zstd': 6}
+
+# Inode types, extended ones are basic + 7
+DIR = 1
+FILE = 2
+SYMLINK = 3
+BLKDEV = 4
+CHRDEV = 5
+FIFO = 6
+EXTENDED = 7
+
+IDS = [0, 1000]
+
+
+class Node():
+    """ Inode of the tree. Hard links are the same node in two places. """
+
+    def __init__(self, kind, mode, uid=0, gid=0, mtime=MTIME, data=b'',
+                 target=b'', rdev=0, extended=False, fragment=True):
+        self.kind = kind
+        self.mode = mode
+        self.uid = uid
+        self.gid = gid
+        self.mtime = mtime
+        self.data = data
+        self.target = target
+        self.rdev = rdev
+        # Use the extended inode even if not needed
+        self.extended = extended
+        # Put the tail of the file in a fragment
+        self.fragment = fragment
+        self.children = {}
+        self.number = 0
+        self.nlink = 0
+        self.ref = None
+
+
+def text(name, size):
+    """ Compressible content of a file """
+    line = 'This is line {:04d} of ' + name + '\n'
+    lines = (line.format(i) for i in range(size // len(line.format(0)) + 1))
+    return ''.join(lines).encode()[:size]
+
+
+def noise(seed, size):
+    """ Incompressible content of a file """
+    return random.Random(seed).randbytes(size)
+
+
+def make_tree():
+    """ Return the root node of the tree in the images """
+    def d(mode=0o755, **kwargs):
+        return Node(DIR, mode, **kwargs)
+
+    def f(data, mode=0o644, **kwargs):
+        return Node(FILE, mode, data=data, **kwargs)
+
+    def ln(target, **kwargs):
+        return Node(SYMLINK, 0o777, target=target, **kwargs)
+
+    hardlink = f(text('hardlink', 6000))
+    paths = {
+        'bin': d(),
+        # Full blocks and the tail in a block, as mksquashfs does for files
+        # larger than the block size
+        'bin/tool': f(text('tool', 3 * BLOCK_SIZE + 1000), 0o755,
+                      fragment=False),
+        'bin/tool-link': ln(b'tool'),
+        'bin/setuid-tool': f(text('setuid-tool', 300), 0o4755),
+        'data': d(),
+        # Stored uncompressed, blocks and fragment
+        'data/random.bin': f(noise(1, 2 * BLOCK_SIZE + 4090)),
+        'data/sparse.img': f(text('sparse', BLOCK_SIZE) + bytes(BLOCK_SIZE) +
+                             bytes(BLOCK_SIZE) + text('sparse', BLOCK_SIZE) +
+                             bytes(BLOCK_SIZE)),
+        'data/sparse-tail.img': f(bytes(BLOCK_SIZE) + text('tail', 100)),
+        'data/empty': f(b''),
+        'data/hardlink-1': hardlink,
+        'data/hardlink-2': hardlink,
+        'data/extended.bin': f(text('extended', BLOCK_SIZE + 10),
+                               uid=1000, gid=1000, extended=True),
+        'data/dangling': ln(b'missing-file'),
+        'data/loop-a': ln(b'loop-b'),
+        'data/loop-b': ln(b'loop-a'),
+        'data/null': Node(CHRDEV, 0o666, rdev=0x103),
+        'data/loop0': Node(BLKDEV, 0o660, rdev=0x700),
+        'data/fifo': Node(FIFO, 0o644),
+        'etc': d(),
+        'etc/hostname': f(b'ubuntu\n'),
+        'etc/os-release': f(text('os-release', 400)),
+        'etc/alternatives': d(),
+        'etc/alternatives/editor': ln(b'/bin/tool'),
+        'many': d(mtime=MTIME + 3600),
+        'meta': d(),
+        'meta/snap.yaml': f(b'name: test\nversion: "1.0"\n'
+                            b'summary: Test snap\n'),
+        'meta/ext-link': ln(b'../etc/hostname', extended=True),
+        'usr': d(0o700, uid=1000, gid=1000),
+        'usr/lib': d(),
+        'usr/lib/libfoo.so.1': f(text('libfoo', 2 * BLOCK_SIZE + 3000),
+                                 uid=1000, mtime=MTIME - 86400),
+        'usr/lib/libfoo.so': ln(b'libfoo.so.1'),
+        'usr/lib/libfoo-chain.so': ln(b'libfoo.so'),
+        'usr/lib/parent-link': ln(b'../../etc/os-release'),
+        'usr/lib/dir-link': ln(b'../../meta'),
+    }
+    # More than 256 entries, so more than one header, and a listing larger
+    # than a metadata block, so mksquashfs would write an index
+    for i in range(300):
+        name = 'many/entry-{:03d}-with-a-long-name-for-a-large-listing'
+        paths[name.format(i)] = f('entry {}\n'.format(i).encode())
+
+    root = d()
+    for path, node in paths.items():
+        parent = root
+        *dirs, name = path.split('/')
+        for dir_name in dirs:
+            parent = parent.children[dir_name.encode()]
+        parent.children[name.encode()] = node
+    return root
+
+
+def compressor(compression):
+    """ Return the function that compresses blocks, and the compressor
+    options to store after the superblock, if any
+    """
+    if compression == 'gzip':
+        return lambda data: zlib.compress(data, 9), None
+    if compression == 'xz':
+        filters = [{'id': lzma.FILTER_LZMA2, 'preset': 6,
+                    'dict_size': max(BLOCK_SIZE, METADATA_SIZE)}]
+        return lambda data: lzma.compress(data, format=lzma.FORMAT_XZ,
+                                          check=lzma.CHECK_CRC32,
+                                          filters=filters), None
+    if compression == 'lzma':
+        # .lzma header with the uncompressed size, like mksquashfs
+        dict_size = max(BLOCK_SIZE, METADATA_SIZE)
+        filters = [{'id': lzma.FILTER_LZMA1, 'dict_size': dict_size,
+                    'lc': 3, 'lp': 0, 'pb': 2}]
+
+        def compress_lzma(data):
+            raw = lzma.compress(data, format=lzma.FORMAT_RAW, filters=filters)
+            return struct.pack('<BIQ', 0x5d, dict_size, len(data)) + raw
+        return compress_lzma, None
+    if compression == 'lzo':
+        import lzallright
+        return lzallright.LZOCompressor().compress, None
+    if compression == 'lz4':
+        import lz4.block
+        # mksquashfs always stores the lz4 version and flags
+        return (lambda data: lz4.block.compress(data, store_size=False),
+                struct.pack('<II', 1, 0))
+    if compression == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor(level=15).compress, None
+    raise ValueError(compression)
+
+
+class MetadataWriter():
+    """ Table made of metadata blocks """
+
+    def __init__(self, compress):
+        self.compress = compress
+        self.data = bytearray()
+        self.pending = bytearray()
+        self.block_starts = []
+
+    def position(self):
+        """ Uncompressed position of the next byte """
+        return len(self.block_starts) * METADATA_SIZE + len(self.pending)
+
+    def block_start(self, position):
+        """ Start of the block with a given uncompressed position, which
+        must be in a block already written or the pending one
+        """
+        block = position // METADATA_SIZE
+        if block < len(self.block_starts):
+            return self.block_starts[block]
+        assert block == len(self.block_starts)
+        return len(self.data)
+
+    def reference(self):
+        return (len(self.data) << 16) | len(self.pending)
+
+    def write(self, data):
+        self.pending += data
+        while len(self.pending) >= METADATA_SIZE:
+            self._flush(bytes(self.pending[:METADATA_SIZE]))
+            del self.pending[:METADATA_SIZE]
+
+    def _flush(self, block):
+        self.block_starts.append(len(self.data))
+        compressed = self.compress(block)
+        if len(compressed) < len(block):
+            self.data += struct.pack('<H', len(compressed)) + compressed
+        else:
+            self.data += struct.pack('<H', len(block) | 0x8000) + block
+
+    def finish(self):
+        if len(self.pending) > 0:
+            self._flush(bytes(self.pending))
+            self.pending = bytearray()
+        return bytes(self.data)
+
+
+class ImageWriter():
+    def __init__(self, root, compression):
+        self.root = root
+        self.compression = compression
+        self.compress, self.options = compressor(compression)
+        self.image = bytearray(96)
+        if self.options is not None:
+            self.image += struct.pack('<H', len(self.options) | 0x8000)
+            self.image += self.options
+        self.fragments = []
+        self.fragment_data = bytearray()
+        self.inodes = MetadataWriter(self.compress)
+        self.dirs = MetadataWriter(self.compress)
+
+    def _number(self):
+        """ Number the inodes like mksquashfs, children of a directory
+        before it, and count the links. Returns the nodes in order.
+        """
+        nodes = []
+
+        def visit(node):
+            for name in sorted(node.children):
+                child = node.children[name]
+                if child.kind == DIR:
+                    visit(child)
+                    continue
+                child.nlink += 1
+                if child.nlink == 1:
+                    nodes.append(child)
+            node.nlink = 2 + sum(1 for c in node.children.values()
+                                 if c.kind == DIR)
+            nodes.append(node)
+        visit(self.root)
+        for number, node in enumerate(nodes, 1):
+            node.number = number
+        return nodes
+
+    def _block(self, data):
+        """ Compress a data block, returns the data and the on-disk size """
+        compressed = self.compress(data)
+        if len(compressed) < len(data):
+            return compressed, len(compressed)
+        return data, len(data) | UNCOMPRESSED
+
+    def _flush_fragment(self):
+        if len(self.fragment_data) == 0:
+            return
+        data, size = self._block(bytes(self.fragment_data))
+        self.fragments.append((len(self.image), size))
+        self.image += data
+        self.fragment_data = bytearray()
+
+    def _write_data(self, node):
+        data = node.data
+        node.start = len(self.image)
+        node.block_sizes = []
+        node.fragment_index = NO_FRAGMENT
+        node.fragment_offset = 0
+        tail = len(data) % BLOCK_SIZE
+        use_fragment = node.fragment and tail > 0
+        blocks = len(data) // BLOCK_SIZE
+        if not use_fragment and tail > 0:
+            blocks += 1
+        for i in range(blocks):
+            block = data[i * BLOCK_SIZE:(i + 1) * BLOCK_SIZE]
+            if block.count(0) == len(block):
+                node.block_sizes.append(0)
+                continue
+            block, size = self._block(block)
+            node.block_sizes.append(size)
+            self.image += block
+        if use_fragment:
+            if len(self.fragment_data) + tail > BLOCK_SIZE:
+                self._flush_fragment()
+            node.fragment_index = len(self.fragments)
+            node.fragment_offset = len(self.fragment_data)
+            self.fragment_data += data[-tail:]
+
+    def _write_inode(self, node, body, itype):
+        node.ref = self.inodes.reference()
+        self.inodes.write(struct.pack(
+            '<HHHHII', itype, node.mode, IDS.index(node.uid),
+            IDS.index(node.gid), node.mtime, node.number) + body)
+
+    def _write_leaf(self, node):
+        if node.kind == FILE:
+            sizes = struct.pack('<{}I'.format(len(node.block_sizes)),
+                                *node.block_sizes)
+            if node.extended or node.nlink > 1:
+                self._write_inode(node, struct.pack(
+                    '<QQQIIII', node.start, len(node.data), 0, node.nlink,
+                    node.fragment_index, node.fragment_offset,
+                    NO_XATTR) + sizes, FILE + EXTENDED)
+            else:
+                self._write_inode(node, struct.pack(
+                    '<IIII', node.start, node.fragment_index,
+                    node.fragment_offset, len(node.data)) + sizes, FILE)
+        elif node.kind == SYMLINK:
+            body = struct.pack('<II', node.nlink, len(node.target)) + \
+                node.target
+            if node.extended:
+                self._write_inode(node, body + struct.pack('<I', NO_XATTR),
+                                  SYMLINK + EXTENDED)
+            else:
+                self._write_inode(node, body, SYMLINK)
+        elif node.kind in (BLKDEV, CHRDEV):
+            self._write_inode(node, struct.pack('<II', node.nlink, node.rdev),
+                              node.kind)
+        else:
+            self._write_inode(node, struct.pack('<I', node.nlink), node.kind)
+
+    def _write_dir(self, node, parent_number):
+        entries = []
+        for name in sorted(node.children):
+            child = node.children[name]
+            if child.kind == DIR:
+                self._write_dir(child, node.number)
+            elif child.ref is None:
+                self._write_leaf(child)
+            entries.append((name, child))
+
+        start = self.dirs.position()
+        listing = bytearray()
+        # (offset in listing, name) of the first header in each metadata
+        # block after the first one, for the index
+        index = []
+        header_block = start // METADATA_SIZE
+        i = 0
+        while i < len(entries):
+            block = entries[i][1].ref >> 16
+            base = entries[i][1].number
+            header_pos = start + len(listing)
+            if header_pos // METADATA_SIZE != header_block:
+                header_block = header_pos // METADATA_SIZE
+                index.append((len(listing), entries[i][0]))
+            group = []
+            pos = header_pos + 12
+            while i < len(entries) and len(group) < 256:
+                name, child = entries[i]
+                # A new header when the entry is in another block of the
+                # inode table, or would start in another metadata block
+                if child.ref >> 16 != block or \
+                        not -0x8000 <= child.number - base <= 0x7fff or \
+                        (len(group) > 0 and
+                         pos // METADATA_SIZE != header_block):
+                    break
+                group.append(entries[i])
+                pos += 8 + len(name)
+                i += 1
+            listing += struct.pack('<III', len(group) - 1, block, base)
+            for name, child in group:
+                listing += struct.pack('<HhHH', child.ref & 0xffff,
+                                       child.number - base, child.kind,
+                                       len(name) - 1) + name
+        dir_start = self.dirs.block_start(start)
+        dir_offset = start % METADATA_SIZE
+        self.dirs.write(bytes(listing))
+        size = len(listing) + 3
+        node.dir_size = size
+        if len(index) > 0 or size > 0xffff or node.extended:
+            body = struct.pack('<IIIIHHI', node.nlink, size, dir_start,
+                               parent_number, len(index), dir_offset,
+                               NO_XATTR)
+            for offset, name in index:
+                body += struct.pack(
+                    '<III', offset, self.dirs.block_start(start + offset),
+                    len(name) - 1) + name
+            self._write_inode(node, body, DIR + EXTENDED)
+        else:
+            self._write_inode(node, struct.pack(
+                '<IIHHI', dir_start, node.nlink, size, dir_offset,
+                parent_number), DIR)
+
+    def _write_table(self, table):
+        """ Write a table and the index of its blocks, returns the position
+        of the index
+        """
+        start = len(self.image)
+        self.image += table.finish()
+        index = len(self.image)
+        self.image += struct.pack('<{}Q'.format(len(table.block_starts)),
+                                  *(start + s for s in table.block_starts))
+        return index
+
+    def write(self):
+        nodes = self._number()
+        for node in nodes:
+            if node.kind == FILE:
+                self._write_data(node)
+        self._flush_fragment()
+
+        # The parent of the root is one past the last inode
+        self._write_dir(self.root, len(nodes) + 1)
+        inode_table_start = len(self.image)
+        self.image += self.inodes.finish()
+        directory_table_start = len(self.image)
+        self.image += self.dirs.finish()
+
+        fragments = MetadataWriter(self.compress)
+        for start, size in self.fragments:
+            fragments.write(struct.pack('<QII', start, size, 0))
+        fragment_table_start = self._write_table(fragments)
+
+        exports = MetadataWriter(self.compress)
+        for node in nodes:
+            exports.write(struct.pack('<Q', node.ref))
+        export_table_start = self._write_table(exports)
+
+        ids = MetadataWriter(self.compress)
+        ids.write(struct.pack('<{}I'.format(len(IDS)), *IDS))
+        id_table_start = self._write_table(ids)
+
+        bytes_used = len(self.image)
+        self.image += bytes(-bytes_used % 4096)
+        flags = FLAGS
+        if self.options is not None:
+            flags |= COMPRESSOR_OPTIONS
+        self.image[:96] = struct.pack(
+            '<IIIIIHHHHHHQQQQQQQQ', 0x73717368, len(nodes), MTIME,
+            BLOCK_SIZE, len(self.fragments), COMPRESSIONS[self.compression],
+            BLOCK_LOG, flags, len(IDS), 4, 0, self.root.ref, bytes_used,
+            id_table_start, INVALID_TABLE, inode_table_start,
+            directory_table_start, fragment_table_start, export_table_start)
+        return bytes(self.image)
+
+
+_TYPE_MODES = {DIR: stat.S_IFDIR, FILE: stat.S_IFREG, SYMLINK: stat.S_IFLNK,
+               BLKDEV: stat.S_IFBLK, CHRDEV: stat.S_IFCHR, FIFO: stat.S_IFIFO}
+
+
+def lln_line(path, st_mode, uid, gid, size, rdev, mtime, target):
+    """ Line of 'unsquashfs -lln' for a file, with the time in UTC """
+    uid = str(uid)
+    gid = str(gid)
+    line = '{} {}/{} '.format(stat.filemode(st_mode), uid, gid)
+    # The padding does not count the slash
+    width = 25 - len(uid) - len(gid)
+    if stat.S_ISCHR(st_mode) or stat.S_ISBLK(st_mode):
+        line += '{:>{}}{:3d},{:3d} '.format(' ', max(width - 7, 0),
+                                            rdev >> 8, rdev & 0xff)
+    else:
+        line += '{:>{}} '.format(size, max(width, 0))
+    when = datetime.datetime.fromtimestamp(mtime, datetime.timezone.utc)
+    line += when.strftime('%Y-%m-%d %H:%M ') + path
+    if stat.S_ISLNK(st_mode):
+        line += ' -> ' + target
+    return line + '\n'
+
+
+def listing(root):
+    """ Return tree.lln and tree.sha256 for a tree. The size of directories
+    depends on their headers, which are the same for all compressions, as
+    they depend only on the uncompressed tables.
+    """
+    ImageWriter(root, 'gzip').write()
+    lln = []
+    digests = []
+
+    def visit(node, path, size):
+        lln.append(lln_line(path, _TYPE_MODES[node.kind] | node.mode,
+                            node.uid, node.gid, size, node.rdev, node.mtime,
+                            os.fsdecode(node.target)))
+        if node.kind == FILE:
+            digests.append('{}  {}\n'.format(
+                hashlib.sha256(node.data).hexdigest(),
+                path[len('squashfs-root/'):]))
+        for name in sorted(node.children):
+            child = node.children[name]
+            child_path = path + '/' + os.fsdecode(name)
+            if child.kind == DIR:
+                visit(child, child_path, child.dir_size)
+            elif child.kind == SYMLINK:
+                visit(child, child_path, len(child.target))
+            else:
+                visit(child, child_path, len(child.data))
+
+    visit(root, 'squashfs-root', root.dir_size)
+    return ''.join(lln), ''.join(digests)
+
+
+def mount_listing(mount_d):
+    """ Return tree.lln and tree.sha256 for a mounted image """
+    lln = []
+    digests = []
+
+    def visit(path, rel):
+        st = os.lstat(path)
+        target = os.readlink(path) if stat.S_ISLNK(st.st_mode) else ''
+        rdev = os.major(st.st_rdev) << 8 | os.minor(st.st_rdev)
+        lln.append(lln_line('squashfs-root' + rel, st.st_mode, st.st_uid,
+                            st.st_gid, st.st_size, rdev, st.st_mtime,
+                            target))
+        if stat.S_ISREG(st.st_mode):
+            with open(path, 'rb') as in_f:
+                digests.append('{}  {}\n'.format(
+                    hashlib.sha256(in_f.read()).hexdigest(), rel[1:]))
+        elif stat.S_ISDIR(st.st_mode):
+            for name in sorted(os.listdir(os.fsencode(path))):
+                name = os.fsdecode(name)
+                visit(os.path.join(path, name), rel + '/' + name)
+
+    visit(mount_d, '')
+    return ''.join(lln), ''.join(digests)
+
+
+def verify(image_p, compression, expected_lln, expected_sha256):
+    ok = True
+    if compression != 'lzma':
+        with tempfile.TemporaryDirectory() as mount_d:
+            subprocess.run(['mount', '-t', 'squashfs', '-o', 'loop,ro',
+                            image_p, mount_d], check=True)
+            try:
+                lln, digests = mount_listing(mount_d)
+            finally:
+                subprocess.run(['umount', mount_d], check=True)
+        if (lln, digests) != (expected_lln, expected_sha256):
+            print(image_p + ': kernel listing differs')
+            ok = False
+    try:
+        proc = subprocess.run(['unsquashfs', '-lln', image_p],
+                              env=dict(os.environ, TZ='UTC'),
+                              stdout=subprocess.PIPE, text=True, check=True)
+    except FileNotFoundError:
+        return ok
+    if proc.stdout != expected_lln:
+        print(image_p + ': unsquashfs listing differs')
+        ok = False
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Write the squashfs images used by the tests')
+    parser.add_argument('--verify', action='store_true',
+                        help='check the images with the kernel and '
+                        'unsquashfs, needs root')
+    parser.add_argument('compressions', nargs='*',
+                        default=list(COMPRESSIONS))
+    args = parser.parse_args()
+
+    lln, digests = listing(make_tree())
+    with open(os.path.join(DATA_D, 'tree.lln'), 'w') as lln_f:
+        lln_f.write(lln)
+    with open(os.path.join(DATA_D, 'tree.sha256'), 'w') as sha256_f:
+        sha256_f.write(digests)
+    ok = True
+    for compression in args.compressions:
+        image_p = os.path.join(DATA_D, 'tree-{}.sqfs'.format(compression))
+        # Nodes keep the state of the writer, so a new tree for each image
+        image = ImageWriter(make_tree(), compression).write()
+        with open(image_p, 'wb') as image_f:
+            image_f.write(image)
+        if args.verify:
+            ok = verify(image_p, compression, lln, digests) and ok
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
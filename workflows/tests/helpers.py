@@ -0,0 +1,86 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Helpers shared by the tests
+
+import datetime
+import importlib.machinery
+import importlib.util
+import os
+import stat
+
+from tools import squashfs
+
+WORKFLOWS_D = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_D = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+def load_script(name):
+    """ Import one of the workflow scripts, which have dashes in their
+    names, as a module
+    :param name: file name of the script, like 'upload-snaps.py'
+    """
+    path = os.path.join(WORKFLOWS_D, name)
+    module_name = name[:-len('.py')].replace('-', '_')
+    loader = importlib.machinery.SourceFileLoader(module_name, path)
+    spec = importlib.util.spec_from_loader(module_name, loader)
+    module = importlib.util.module_from_spec(spec)
+    loader.exec_module(module)
+    return module
+
+
+def data_path(*names):
+    """ Path to a file in tests/data """
+    return os.path.join(DATA_D, *names)
+
+
+def lln_line(path, st_mode, uid, gid, size, rdev, mtime, target=b''):
+    """ Line of 'unsquashfs -lln' for a file, with the time in UTC """
+    uid = str(uid)
+    gid = str(gid)
+    line = '{} {}/{} '.format(stat.filemode(st_mode), uid, gid)
+    # The padding does not count the slash
+    width = 25 - len(uid) - len(gid)
+    if stat.S_ISCHR(st_mode) or stat.S_ISBLK(st_mode):
+        line += '{:>{}}{:3d},{:3d} '.format(' ', max(width - 7, 0),
+                                            rdev >> 8, rdev & 0xff)
+    else:
+        line += '{:>{}} '.format(size, max(width, 0))
+    when = datetime.datetime.fromtimestamp(mtime, datetime.timezone.utc)
+    line += when.strftime('%Y-%m-%d %H:%M ') + path
+    if stat.S_ISLNK(st_mode):
+        line += ' -> ' + os.fsdecode(target)
+    return line + '\n'
+
+
+def unsquashfs_lln(image):
+    """ Listing of a tools.squashfs.SquashFS image, as 'unsquashfs -lln'
+    prints it with TZ=UTC
+    """
+    ids = image.read_ids()
+    lines = []
+
+    def add(path, inode):
+        lines.append(lln_line(path, inode.st_mode, ids[inode.uid],
+                              ids[inode.gid], inode.size, inode.rdev,
+                              inode.mtime, inode.target))
+        if inode.type == squashfs.DIR:
+            for entry in image.iter_dir(inode):
+                add(path + '/' + os.fsdecode(entry.name),
+                    image.read_inode(entry.inode_ref))
+
+    add('squashfs-root', image.root_inode())
+    return ''.join(lines)
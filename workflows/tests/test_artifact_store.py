@@ -0,0 +1,252 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import http.server
+import os
+import stat
+import threading
+
+import pytest
+import urllib3
+
+import helpers
+from se_utils import artifact_store
+
+fetch_old_manifests = helpers.load_script('fetch-old-manifests.py')
+
+SNAP_DATA = b'snap data\n' * 1000
+
+
+class SnapHandler(http.server.BaseHTTPRequestHandler):
+    """ Serves SNAP_DATA at /snap, 404 for anything else """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        body = SNAP_DATA if self.path == '/snap' else b'not found\n'
+        self.send_response(200 if self.path == '/snap' else 404)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def snap_url():
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), SnapHandler)
+    thread = threading.Thread(target=httpd.serve_forever,
+                              kwargs={'poll_interval': 0.05})
+    thread.start()
+    try:
+        yield 'http://127.0.0.1:{}/'.format(httpd.server_address[1])
+    finally:
+        httpd.shutdown()
+        thread.join()
+        httpd.server_close()
+
+
+class InterruptedResponse():
+    status = 200
+
+    def stream(self, size):
+        yield SNAP_DATA[:size]
+        raise KeyboardInterrupt()
+
+    def release_conn(self):
+        pass
+
+
+class InterruptedPool():
+    def request(self, method, url, **kwargs):
+        return InterruptedResponse()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return artifact_store.ArtifactStore(str(tmp_path / 'store'), 1 << 20)
+
+
+def write_file(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+
+def channel_entry(track, name, arch, revision):
+    return {'channel': {'architecture': arch, 'name': name,
+                        'risk': name.split('/')[0], 'track': track},
+            'revision': revision, 'version': '1.{}'.format(revision),
+            'download': {'url': 'https://example.com/{}.snap'.format(
+                revision), 'sha3-384': '{:096x}'.format(revision)}}
+
+
+def test_closed_channel_follows_more_stable_risk():
+    # After a promotion only stable is open
+    channel_map = [channel_entry('22', 'stable', 'arm64', 10),
+                   channel_entry('20', 'beta', 'arm64', 5),
+                   channel_entry('22', 'beta', 'amd64', 11)]
+    for channel in ['22/edge', '22/beta', '22/candidate', '22/stable',
+                    '22/beta/fix-1']:
+        info = artifact_store.find_store_snap_info(channel_map, channel,
+                                                   'arm64')
+        assert (info['revision'], info['channel']) == (10, '22/stable')
+    assert artifact_store.find_store_snap_info(
+        channel_map, '22/beta', 'amd64')['revision'] == 11
+    assert artifact_store.find_store_snap_info(
+        channel_map, '22/stable', 'amd64') is None
+    assert artifact_store.find_store_snap_info(
+        channel_map, '24/beta', 'arm64') is None
+
+
+def test_channel_and_branch_before_more_stable_risks():
+    channel_map = [channel_entry('latest', risk, 'amd64', revision)
+                   for revision, risk in enumerate(
+                       ['stable', 'candidate', 'beta', 'edge', 'beta/fix'])]
+    for channel, revision in [('edge', 3), ('beta', 2), ('latest/beta', 2),
+                              ('beta/fix', 4), ('beta/other', 2),
+                              ('candidate', 1), ('stable', 0)]:
+        info = artifact_store.find_store_snap_info(channel_map, channel,
+                                                   'amd64')
+        assert info['revision'] == revision, channel
+
+
+def test_old_manifest_revision_in_same_track_first():
+    channel_map = [channel_entry('22', 'stable', 'arm64', 10),
+                   channel_entry('20', 'beta', 'arm64', 5),
+                   channel_entry('22', 'beta', 'amd64', 11),
+                   channel_entry('20', 'beta', 'riscv64', 6)]
+    revisions = {arch: fetch_old_manifests.find_revision(
+        channel_map, 'core22', '22/beta', arch)['revision']
+        for arch in ['arm64', 'amd64', 'riscv64', 's390x']}
+    # riscv64 has only the previous track, s390x nothing at all
+    assert revisions == {'arm64': 10, 'amd64': 11, 'riscv64': 6,
+                         's390x': 11}
+
+
+def test_add_file_and_place(store, tmp_path):
+    source = write_file(tmp_path / 'source', b'snap data\n')
+    digest = store.add_file(source)
+    assert digest == hashlib.sha3_384(b'snap data\n').hexdigest()
+    obj_p = store.object_path(digest)
+    assert stat.S_IMODE(os.stat(obj_p).st_mode) == 0o444
+    assert os.listdir(store.tmp_d) == []
+
+    # Neither the added file nor a placed one share data with the object
+    with open(source, 'wb') as source_f:
+        source_f.write(b'modified\n')
+    dest = tmp_path / 'dest'
+    assert store.place(digest, str(dest))
+    assert dest.read_bytes() == b'snap data\n'
+    with open(dest, 'ab') as dest_f:
+        dest_f.write(b'more\n')
+    with open(obj_p, 'rb') as obj_f:
+        assert obj_f.read() == b'snap data\n'
+    assert store.add_file(source, digest) == digest
+    with open(obj_p, 'rb') as obj_f:
+        assert obj_f.read() == b'snap data\n'
+
+    assert not store.place('0' * 96, str(tmp_path / 'missing'))
+    assert not os.path.exists(tmp_path / 'missing')
+    assert sorted(os.listdir(tmp_path)) == ['dest', 'source', 'store']
+
+
+def test_add_build_and_place_build(store, tmp_path):
+    paths = [write_file(tmp_path / name, name.encode())
+             for name in ['core22_1_amd64.snap', 'buildlog.txt.gz']]
+    store.add_build('build-42', paths)
+    dest_d = tmp_path / 'dest'
+    assert store.place_build('build-42', str(dest_d))
+    assert {p.name: p.read_bytes() for p in dest_d.iterdir()} == \
+        {'core22_1_amd64.snap': b'core22_1_amd64.snap',
+         'buildlog.txt.gz': b'buildlog.txt.gz'}
+
+    assert not store.place_build('build-43', str(tmp_path / 'other'))
+    # A build with missing objects is not placed
+    os.unlink(store.object_path(artifact_store.sha3_384_file(paths[1])))
+    assert not store.place_build('build-42', str(tmp_path / 'other'))
+    assert not os.path.exists(tmp_path / 'other')
+
+
+def test_evict_least_recently_used(tmp_path):
+    store = artifact_store.ArtifactStore(str(tmp_path / 'store'), 25)
+    digests = [store.add_file(write_file(tmp_path / name, name.encode() * 10))
+               for name in 'ab']
+    for mtime, digest in zip([1000, 2000], digests):
+        os.utime(store.object_path(digest), (mtime, mtime))
+    # Using a makes b the least recently used one
+    assert store.place(digests[0], str(tmp_path / 'placed'))
+    digests.append(store.add_file(write_file(tmp_path / 'c', b'c' * 10)))
+    assert [store.has(digest) for digest in digests] == [True, False, True]
+
+    store.max_size = 0
+    store.evict()
+    assert not any(store.has(digest) for digest in digests)
+
+
+def test_store_from_env(tmp_path, monkeypatch, capsys):
+    monkeypatch.delenv('SNAP_ARTIFACT_STORE', raising=False)
+    monkeypatch.delenv('SNAP_ARTIFACT_STORE_MAX_SIZE', raising=False)
+    assert artifact_store.ArtifactStore.from_env() is None
+
+    root = str(tmp_path / 'store')
+    monkeypatch.setenv('SNAP_ARTIFACT_STORE', root)
+    store = artifact_store.ArtifactStore.from_env()
+    assert store.root == root
+    assert store.max_size == artifact_store.DEFAULT_MAX_SIZE_MIB * 1024 * 1024
+    monkeypatch.setenv('SNAP_ARTIFACT_STORE_MAX_SIZE', '0')
+    assert artifact_store.ArtifactStore.from_env() is None
+
+    # A store that cannot be created is not used
+    monkeypatch.setenv('SNAP_ARTIFACT_STORE_MAX_SIZE', '10')
+    monkeypatch.setenv('SNAP_ARTIFACT_STORE',
+                       os.path.join(write_file(tmp_path / 'file', b''), 's'))
+    assert artifact_store.ArtifactStore.from_env() is None
+    assert 'WARNING: not using artifact store' in capsys.readouterr().out
+
+
+def snap_info(url, digest=None):
+    if digest is None:
+        digest = hashlib.sha3_384(SNAP_DATA).hexdigest()
+    return {'revision': 7, 'channel': 'latest/stable', 'arch': 'amd64',
+            'url': url, 'sha3-384': digest}
+
+
+def test_fetch_store_snap_revision(store, snap_url, tmp_path):
+    dest_d = str(tmp_path / 'dest')
+    info = snap_info(snap_url + 'snap')
+    with urllib3.PoolManager() as pool:
+        snap_p = artifact_store.fetch_store_snap_revision(
+            store, pool, 'core22', info, dest_d)
+        assert snap_p == os.path.join(dest_d, 'core22_7.snap')
+        with open(snap_p, 'rb') as snap_f:
+            assert snap_f.read() == SNAP_DATA
+        assert store.has(info['sha3-384'])
+
+        # Failed downloads leave nothing behind
+        os.unlink(snap_p)
+        for info, error in [(snap_info(snap_url + 'missing'), 'status 404'),
+                            (snap_info(snap_url + 'snap', '0' * 96),
+                             'SHA3-384 mismatch')]:
+            with pytest.raises(urllib3.exceptions.HTTPError, match=error):
+                artifact_store.fetch_store_snap_revision(
+                    None, pool, 'core22', info, dest_d)
+            assert os.listdir(dest_d) == []
+    with pytest.raises(KeyboardInterrupt):
+        artifact_store.fetch_store_snap_revision(
+            None, InterruptedPool(), 'core22', info, dest_d)
+    assert os.listdir(dest_d) == []
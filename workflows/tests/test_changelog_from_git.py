@@ -0,0 +1,64 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import subprocess
+
+import helpers
+
+changelog_from_git = helpers.load_script('changelog-from-git.py')
+
+
+def git(*args):
+    subprocess.run(['git', '-c', 'user.name=CI', '-c', 'user.email=ci@x',
+                    '-c', 'init.defaultBranch=main'] + list(args),
+                   check=True, stdout=subprocess.DEVNULL)
+
+
+def merge(branch, message):
+    git('checkout', '-q', '-b', branch)
+    git('commit', '-q', '--allow-empty', '-m', 'Work in ' + branch)
+    git('checkout', '-q', 'main')
+    git('merge', '-q', '--no-ff', '-m', message, branch)
+
+
+def test_authors_in_order_of_first_merge(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    git('init', '-q')
+    git('commit', '-q', '--allow-empty', '-m', 'Initial commit')
+    for i, author in enumerate(['zed', 'amy', 'bob', 'amy']):
+        merge('branch-{}'.format(i),
+              'Merge branch-{}\n\nAuthor: {} <{}@example.com>\n'
+              'Merge-Proposal: https://example.com/{}\n\n'
+              'Change {}\n'.format(i, author, author, i, i))
+
+    text = changelog_from_git.get_changelog_text('pc', '22-1.0', 'HEAD')
+    header, paragraphs = text.split('\n', 1)
+    assert header.endswith(' pc 22-1.0')
+    assert paragraphs == '''
+  [ zed <zed@example.com> ]
+  * Change 0
+    Merge-Proposal: https://example.com/0
+
+  [ amy <amy@example.com> ]
+  * Change 1
+    Merge-Proposal: https://example.com/1
+  * Change 3
+    Merge-Proposal: https://example.com/3
+
+  [ bob <bob@example.com> ]
+  * Change 2
+    Merge-Proposal: https://example.com/2
+'''
@@ -0,0 +1,133 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import gzip
+import os
+import types
+
+import pytest
+
+import helpers
+
+changelog_from_manifest = helpers.load_script('changelog-from-manifest.py')
+
+ENTRY = '''{src} ({version}) jammy; urgency=medium
+
+  * Release {version} of {src}.
+
+ -- Maintainer <maintainer@example.com>  Mon, 01 Jan 2024 00:00:00 +0000
+
+'''
+
+
+def changelog(src, versions):
+    return ''.join(ENTRY.format(src=src, version=v) for v in versions)
+
+
+def write_manifest(path, packages):
+    with open(path, 'w') as manifest_f:
+        manifest_f.write('parts: {}\nprimed-stage-packages:\n')
+        for pkg, version in sorted(packages.items()):
+            manifest_f.write('- {}={}\n'.format(pkg, version))
+
+
+def write_docs(docs_d, pkg, text):
+    os.makedirs(os.path.join(docs_d, pkg))
+    with gzip.open(os.path.join(docs_d, pkg, 'changelog.Debian.gz'),
+                   'wt') as chl_f:
+        chl_f.write(text)
+
+
+@pytest.fixture
+def pair(tmp_path):
+    """ Manifests where liba and libb go from 1.0 to 2.0 """
+    old_p = str(tmp_path / 'old.yaml')
+    new_p = str(tmp_path / 'new.yaml')
+    write_manifest(old_p, {'liba': '1.0', 'libb': '1.0'})
+    write_manifest(new_p, {'liba': '2.0', 'libb': '2.0'})
+    return old_p, new_p, str(tmp_path / 'docs')
+
+
+@pytest.fixture
+def remote(monkeypatch):
+    """ Changelogs of changelogs.ubuntu.com, in remote.changelogs by
+    package. The packages fetched are appended to remote.fetched.
+    """
+    remote = types.SimpleNamespace(changelogs={}, fetched=[])
+
+    def get_changes_from_url(pkg, old_v, new_v, indent, session=None,
+                             cache=None):
+        remote.fetched.append(pkg)
+        return changelog_from_manifest.read_changes(
+            [remote.changelogs[pkg]], old_v, indent)
+
+    monkeypatch.setattr(changelog_from_manifest, 'get_changes_from_url',
+                        get_changes_from_url)
+    return remote
+
+
+def test_group_binaries_by_source(pair, remote):
+    old_p, new_p, docs_d = pair
+    write_docs(docs_d, 'liba', changelog('a', ['2.0', '1.0']))
+    changes = changelog_from_manifest.compare_manifests(
+        old_p, new_p, docs_d, {'libb': 'a'})
+    assert changes.startswith('liba, libb (built from a) updated from '
+                              '1.0 to 2.0:\n')
+    assert remote.fetched == []
+
+
+def test_wrong_index_for_grouped_binary(pair, remote):
+    # The index says libb is built from a, but the changelog in docs says b.
+    # liba would be the representative of a, and only the source of
+    # representatives is checked after fetching, so the header must win.
+    old_p, new_p, docs_d = pair
+    write_docs(docs_d, 'liba', changelog('a', ['2.0', '1.0']))
+    write_docs(docs_d, 'libb', changelog('b', ['2.0', '1.0']))
+    changes = changelog_from_manifest.compare_manifests(
+        old_p, new_p, docs_d, {'liba': 'a', 'libb': 'a'})
+    assert 'liba (built from a) updated from 1.0 to 2.0:\n' in changes
+    assert 'libb (built from b) updated from 1.0 to 2.0:\n' in changes
+    assert 'Release 2.0 of b.' in changes
+
+
+def test_wrong_index_for_representative(pair, remote):
+    # liba has no changelog in docs and the index says it is built from b,
+    # so it is fetched as representative of b, which turns out to be wrong.
+    old_p, new_p, docs_d = pair
+    write_docs(docs_d, 'libb', changelog('b', ['2.0', '1.0']))
+    remote.changelogs['liba'] = changelog('a', ['2.0', '1.0'])
+    changes = changelog_from_manifest.compare_manifests(
+        old_p, new_p, docs_d, {'liba': 'b'})
+    assert 'liba (built from a) updated from 1.0 to 2.0:\n' in changes
+    assert 'libb (built from b) updated from 1.0 to 2.0:\n' in changes
+    assert remote.fetched == ['liba']
+
+
+def test_main_rejects_ambiguous_pairs(pair, capsys):
+    old_p, new_p, docs_d = pair
+    with pytest.raises(SystemExit) as exit_info:
+        changelog_from_manifest.main([old_p, new_p, docs_d,
+                                      '--pair', 'amd64', old_p, new_p,
+                                      docs_d])
+    assert exit_info.value.code == 2
+    with pytest.raises(SystemExit) as exit_info:
+        changelog_from_manifest.main(['--pair', 'amd64', old_p, new_p,
+                                      docs_d,
+                                      '--pair', 'amd64', old_p, new_p,
+                                      docs_d])
+    assert exit_info.value.code == 2
+    assert '--pair used more than once for amd64' in \
+        capsys.readouterr().err
@@ -0,0 +1,153 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+
+import pytest
+
+from tools import manifest
+
+MANIFEST = '''name: test
+parts:
+  app:
+    plugin: nil
+    stage-packages:
+    - liba=1.0
+    - libb=2:1.0-1ubuntu1
+  tools:
+    stage-packages:
+    - libc=3.0
+primed-stage-packages:
+- liba=1.0
+- libc=3.0
+'''
+
+DPKG = '''packages:
+- base-files=13ubuntu10
+- libc6:amd64=2.35-0ubuntu3
+- libc6:i386=2.35-0ubuntu3
+'''
+
+
+@pytest.fixture(autouse=True)
+def no_cache_env(monkeypatch):
+    monkeypatch.delenv('MANIFEST_CACHE_DIR', raising=False)
+
+
+def write_file(path, text):
+    path.write_text(text)
+    return str(path)
+
+
+def cache_files(cache_d):
+    return sorted(os.listdir(cache_d))
+
+
+def test_load_manifest(tmp_path):
+    loaded = manifest.load_manifest(write_file(tmp_path / 'manifest.yaml',
+                                               MANIFEST))
+    assert loaded.parts == {'app': {'liba': '1.0', 'libb': '2:1.0-1ubuntu1'},
+                            'tools': {'libc': '3.0'}}
+    assert loaded.primed_versions() == {'liba': '1.0', 'libc': '3.0'}
+    assert loaded.staged_versions() == {'liba': '1.0',
+                                        'libb': '2:1.0-1ubuntu1',
+                                        'libc': '3.0'}
+
+    # Older manifests do not have primed-stage-packages
+    old = manifest.load_manifest(write_file(
+        tmp_path / 'old.yaml', MANIFEST.split('primed-stage-packages')[0]))
+    assert old.primed_stage_packages is None
+    assert old.primed_versions() == loaded.staged_versions()
+
+
+def test_load_dpkg_packages(tmp_path):
+    assert manifest.load_dpkg_packages(write_file(
+        tmp_path / 'dpkg.yaml', DPKG)) == {
+            'base-files': '13ubuntu10', 'libc6:amd64': '2.35-0ubuntu3',
+            'libc6:i386': '2.35-0ubuntu3'}
+
+
+def test_cache_hit(tmp_path, monkeypatch):
+    cache_d = tmp_path / 'cache'
+    monkeypatch.setenv('MANIFEST_CACHE_DIR', str(cache_d))
+    manifest_p = write_file(tmp_path / 'manifest.yaml', MANIFEST)
+    dpkg_p = write_file(tmp_path / 'dpkg.yaml', DPKG)
+    expected = manifest.load_manifest(manifest_p)
+    expected_dpkg = manifest.load_dpkg_packages(dpkg_p)
+    names = cache_files(cache_d)
+    assert [name.split('-')[0] for name in names] == ['dpkg', 'manifest']
+
+    # The view is read from the cache, not from the file
+    for name in names:
+        cache_p = cache_d / name
+        cached = json.loads(cache_p.read_text())
+        assert cached['format'] == manifest.CACHE_FORMAT
+        for versions in [cached['view'].get('packages'),
+                         cached['view'].get('primed-stage-packages')]:
+            if versions is not None:
+                versions['cached'] = '1'
+        cache_p.write_text(json.dumps(cached))
+    loaded = manifest.load_manifest(manifest_p)
+    assert loaded.parts == expected.parts
+    assert loaded.primed_versions() == dict(expected.primed_versions(),
+                                            cached='1')
+    assert manifest.load_dpkg_packages(dpkg_p) == dict(expected_dpkg,
+                                                       cached='1')
+
+    # Changed files have a different key
+    write_file(tmp_path / 'manifest.yaml', MANIFEST.replace('3.0', '3.1'))
+    assert manifest.load_manifest(manifest_p).primed_versions() == \
+        {'liba': '1.0', 'libc': '3.1'}
+    assert len(cache_files(cache_d)) == 3
+
+
+@pytest.mark.parametrize('contents', [
+    json.dumps({'format': manifest.CACHE_FORMAT - 1,
+                'view': {'packages': {'stale': '1'}}}),
+    '{"format": 1, "view": {"packages"',
+    'not json'])
+def test_cache_is_rewritten(tmp_path, contents):
+    cache_d = tmp_path / 'cache'
+    dpkg_p = write_file(tmp_path / 'dpkg.yaml', DPKG)
+    expected = manifest.load_dpkg_packages(dpkg_p)
+    manifest.load_dpkg_packages(dpkg_p, str(cache_d))
+    [name] = cache_files(cache_d)
+
+    (cache_d / name).write_text(contents)
+    assert manifest.load_dpkg_packages(dpkg_p, str(cache_d)) == expected
+    assert json.loads((cache_d / name).read_text()) == {
+        'format': manifest.CACHE_FORMAT, 'view': {'packages': expected}}
+    assert cache_files(cache_d) == [name]
+
+
+def test_cache_write_error(tmp_path, monkeypatch):
+    def failing_dump(obj, out_f):
+        out_f.write('{"format"')
+        raise OSError('no space left on device')
+
+    cache_d = tmp_path / 'cache'
+    dpkg_p = write_file(tmp_path / 'dpkg.yaml', DPKG)
+    monkeypatch.setattr(manifest.json, 'dump', failing_dump)
+    assert manifest.load_dpkg_packages(dpkg_p, str(cache_d))['base-files'] \
+        == '13ubuntu10'
+    # The partial cache file is removed
+    assert cache_files(cache_d) == []
+
+    # A cache directory that cannot be created is ignored
+    cache_d = os.path.join(write_file(tmp_path / 'file', ''), 'cache')
+    assert manifest.load_dpkg_packages(dpkg_p, cache_d)['base-files'] == \
+        '13ubuntu10'
@@ -0,0 +1,373 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# The images in tests/data/squashfs are written by make-images.py there,
+# see the README for how they were checked.
+
+import hashlib
+import os
+import shutil
+import stat
+import struct
+import subprocess
+
+import pytest
+
+import helpers
+from tools import squashfs
+
+COMPRESSIONS = {
+    'gzip': True,
+    'lzma': True,
+    'lzo': squashfs.lzo is not None,
+    'xz': True,
+    'lz4': squashfs.lz4 is not None,
+    'zstd': squashfs.zstd is not None or squashfs.zstandard is not None,
+}
+MANY_NAME = 'entry-{:03d}-with-a-long-name-for-a-large-listing'
+
+
+def tree_path(compression):
+    return helpers.data_path('squashfs', 'tree-{}.sqfs'.format(compression))
+
+
+def tree_digests():
+    """ Digests of the files in the test images, by path """
+    with open(helpers.data_path('squashfs', 'tree.sha256')) as sha256_f:
+        return {path: digest for digest, path in
+                (line.rstrip('\n').split('  ', 1) for line in sha256_f)}
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def raw_type(image, inode_ref):
+    """ Inode type as stored, read_inode() returns the basic types """
+    data, _, _ = image._read_metadata(
+        image.superblock.inode_table_start + (inode_ref >> 16),
+        inode_ref & 0xffff, 2)
+    return struct.unpack('<H', data)[0]
+
+
+def entry_ref(image, path):
+    """ Inode reference of a path, from the entry in its directory """
+    dir_path, _, name = path.rpartition('/')
+    for entry in image.iter_dir(image.lookup(dir_path)):
+        if entry.name == os.fsencode(name):
+            return entry.inode_ref
+    raise FileNotFoundError(path)
+
+
+@pytest.fixture(params=list(COMPRESSIONS))
+def image(request):
+    if not COMPRESSIONS[request.param]:
+        pytest.skip('no module for ' + request.param)
+    with squashfs.SquashFS.open(tree_path(request.param)) as image:
+        yield image
+
+
+@pytest.fixture
+def gzip_image():
+    with squashfs.SquashFS.open(tree_path('gzip')) as image:
+        yield image
+
+
+def test_listing(image):
+    with open(helpers.data_path('squashfs', 'tree.lln')) as lln_f:
+        assert helpers.unsquashfs_lln(image) == lln_f.read()
+
+
+def test_file_contents(image):
+    for path, digest in tree_digests().items():
+        assert sha256(image.read_file(path)) == digest, path
+
+
+def test_superblock(image):
+    assert image.block_size == 4096
+    assert image.read_ids() == [0, 1000]
+    assert image.root_inode().type == squashfs.DIR
+
+
+def test_lookup(gzip_image):
+    hostname = gzip_image.lookup('etc/hostname')
+    assert gzip_image.lookup('/etc/hostname') == hostname
+    assert gzip_image.lookup('./etc//./hostname') == hostname
+    assert gzip_image.lookup('bin/../etc/hostname') == hostname
+    # .. of the root is the root
+    assert gzip_image.lookup('../../etc/hostname') == hostname
+    assert gzip_image.lookup('etc/') == gzip_image.lookup('etc')
+    assert gzip_image.lookup('') == gzip_image.root_inode()
+    assert gzip_image.lookup('.') == gzip_image.root_inode()
+    with pytest.raises(FileNotFoundError):
+        gzip_image.lookup('etc/missing')
+    with pytest.raises(FileNotFoundError):
+        gzip_image.lookup('missing/hostname')
+    with pytest.raises(NotADirectoryError):
+        gzip_image.lookup('etc/hostname/x')
+    assert sorted(gzip_image.listdir('/')) == \
+        ['bin', 'data', 'etc', 'many', 'meta', 'usr']
+
+
+def test_symlinks(gzip_image):
+    tool = gzip_image.lookup('bin/tool')
+    link = gzip_image.lookup('bin/tool-link', follow_symlinks=False)
+    assert link.type == squashfs.SYMLINK
+    assert link.target == b'tool'
+    assert link.size == 4
+    assert gzip_image.lookup('bin/tool-link') == tool
+    # Absolute
+    assert gzip_image.lookup('etc/alternatives/editor') == tool
+    # Chain of symlinks
+    assert gzip_image.lookup('usr/lib/libfoo-chain.so') == \
+        gzip_image.lookup('usr/lib/libfoo.so.1')
+    assert gzip_image.lookup('usr/lib/parent-link') == \
+        gzip_image.lookup('etc/os-release')
+    # Symlinks in the middle of a path are always followed, and .. after
+    # them goes to the parent of the target
+    assert gzip_image.lookup('usr/lib/dir-link/snap.yaml',
+                             follow_symlinks=False) == \
+        gzip_image.lookup('meta/snap.yaml')
+    assert gzip_image.lookup('usr/lib/dir-link/../etc/hostname') == \
+        gzip_image.lookup('etc/hostname')
+    assert gzip_image.read_file('meta/ext-link') == b'ubuntu\n'
+
+    dangling = gzip_image.lookup('data/dangling', follow_symlinks=False)
+    assert dangling.target == b'missing-file'
+    with pytest.raises(FileNotFoundError):
+        gzip_image.lookup('data/dangling')
+    with pytest.raises(squashfs.SquashFSError, match='too many symlinks'):
+        gzip_image.lookup('data/loop-a')
+    assert gzip_image.lookup('data/loop-a', follow_symlinks=False).target \
+        == b'loop-b'
+
+
+def test_fragments(gzip_image):
+    # Small files are only in a fragment
+    hostname = gzip_image.lookup('etc/hostname')
+    assert hostname.block_sizes == ()
+    assert hostname.fragment != squashfs.NO_FRAGMENT
+    # Full blocks and the tail in a fragment
+    libfoo = gzip_image.lookup('usr/lib/libfoo.so.1')
+    assert len(libfoo.block_sizes) == 2
+    assert libfoo.fragment != squashfs.NO_FRAGMENT
+    # The tail in its own block
+    tool = gzip_image.lookup('bin/tool')
+    assert len(tool.block_sizes) == 4
+    assert tool.fragment == squashfs.NO_FRAGMENT
+
+    count = gzip_image.superblock.fragment_count
+    assert count > 1
+    start, size = gzip_image.fragment_entry(count - 1)
+    assert start + (size & ~squashfs.DATA_UNCOMPRESSED) <= \
+        gzip_image.superblock.inode_table_start
+    with pytest.raises(squashfs.SquashFSError, match='out of bounds'):
+        gzip_image.fragment_entry(count)
+
+    # Files sharing a fragment, read in any order
+    digests = tree_digests()
+    for path in ['etc/os-release', 'etc/hostname', 'etc/os-release',
+                 'bin/setuid-tool', 'usr/lib/libfoo.so.1']:
+        assert sha256(gzip_image.read_file(path)) == digests[path]
+
+
+def test_uncompressed_blocks(gzip_image):
+    inode = gzip_image.lookup('data/random.bin')
+    assert len(inode.block_sizes) == 2
+    assert all(size & squashfs.DATA_UNCOMPRESSED
+               for size in inode.block_sizes)
+    _, size = gzip_image.fragment_entry(inode.fragment)
+    assert size & squashfs.DATA_UNCOMPRESSED
+    assert sha256(gzip_image.read_file('data/random.bin')) == \
+        tree_digests()['data/random.bin']
+
+
+def test_sparse_blocks(gzip_image):
+    sparse = gzip_image.lookup('data/sparse.img')
+    assert [size == 0 for size in sparse.block_sizes] == \
+        [False, True, True, False, True]
+    blocks = list(gzip_image.iter_inode_data(sparse))
+    assert [len(block) for block in blocks] == [4096] * 5
+    assert blocks[1] == blocks[2] == blocks[4] == bytes(4096)
+
+    tail = gzip_image.lookup('data/sparse-tail.img')
+    assert tail.block_sizes == (0,)
+    assert tail.fragment != squashfs.NO_FRAGMENT
+    data = gzip_image.read_file('data/sparse-tail.img')
+    assert data[:4096] == bytes(4096)
+    assert len(data) == 4196
+
+
+def test_empty_file(gzip_image):
+    empty = gzip_image.lookup('data/empty')
+    assert empty.size == 0
+    assert empty.block_sizes == ()
+    assert empty.fragment == squashfs.NO_FRAGMENT
+    assert gzip_image.read_file('data/empty') == b''
+
+
+def test_extended_inodes(gzip_image):
+    ids = gzip_image.read_ids()
+
+    # Hard links, both names have the same extended inode
+    ref = entry_ref(gzip_image, 'data/hardlink-1')
+    assert raw_type(gzip_image, ref) == squashfs.EXT_FILE
+    assert entry_ref(gzip_image, 'data/hardlink-2') == ref
+    inode = gzip_image.read_inode(ref)
+    assert inode.type == squashfs.FILE
+    assert inode.nlink == 2
+    assert gzip_image.read_file('data/hardlink-2') == \
+        gzip_image.read_file('data/hardlink-1')
+
+    ref = entry_ref(gzip_image, 'data/extended.bin')
+    assert raw_type(gzip_image, ref) == squashfs.EXT_FILE
+    inode = gzip_image.read_inode(ref)
+    assert (inode.nlink, inode.xattr) == (1, 0xffffffff)
+    assert (ids[inode.uid], ids[inode.gid]) == (1000, 1000)
+    assert len(inode.block_sizes) == 1
+
+    ref = entry_ref(gzip_image, 'meta/ext-link')
+    assert raw_type(gzip_image, ref) == squashfs.EXT_SYMLINK
+    inode = gzip_image.read_inode(ref)
+    assert inode.type == squashfs.SYMLINK
+    assert inode.target == b'../etc/hostname'
+
+    # Directory with an index and more than one header
+    ref = entry_ref(gzip_image, 'many')
+    assert raw_type(gzip_image, ref) == squashfs.EXT_DIR
+    inode = gzip_image.read_inode(ref)
+    assert inode.type == squashfs.DIR
+    assert inode.size > squashfs.METADATA_SIZE
+    names = gzip_image.listdir('many')
+    assert names == [MANY_NAME.format(i) for i in range(300)]
+    assert gzip_image.read_file('many/' + MANY_NAME.format(299)) == \
+        b'entry 299\n'
+
+
+def test_special_files(gzip_image):
+    null = gzip_image.lookup('data/null')
+    assert null.type == squashfs.CHRDEV
+    assert null.rdev == 0x103
+    assert stat.S_ISCHR(null.st_mode)
+    assert gzip_image.lookup('data/loop0').type == squashfs.BLKDEV
+    assert gzip_image.lookup('data/fifo').type == squashfs.FIFO
+    with pytest.raises(squashfs.SquashFSError, match='not a regular file'):
+        gzip_image.read_file('data/null')
+    with pytest.raises(squashfs.SquashFSError, match='not a directory'):
+        list(gzip_image.iter_dir(null))
+    setuid = gzip_image.lookup('bin/setuid-tool')
+    assert setuid.st_mode == stat.S_IFREG | 0o4755
+
+
+def test_extract(gzip_image, tmp_path):
+    dest = str(tmp_path / 'root')
+    gzip_image.extract('/', dest)
+
+    digests = tree_digests()
+    for path, digest in digests.items():
+        with open(os.path.join(dest, path), 'rb') as extracted_f:
+            assert sha256(extracted_f.read()) == digest, path
+    assert os.readlink(os.path.join(dest, 'bin/tool-link')) == 'tool'
+    assert os.readlink(os.path.join(dest, 'data/dangling')) == \
+        'missing-file'
+    assert stat.S_IMODE(os.lstat(os.path.join(dest, 'usr')).st_mode) == \
+        0o700
+    assert stat.S_IMODE(os.stat(os.path.join(dest, 'bin/tool')).st_mode) \
+        == 0o755
+    # Devices and fifos are skipped
+    assert sorted(os.listdir(os.path.join(dest, 'data'))) == \
+        sorted(set(gzip_image.listdir('data')) -
+               {'null', 'loop0', 'fifo'})
+    assert len(os.listdir(os.path.join(dest, 'many'))) == 300
+
+    # A single file, and the target of a symlink
+    gzip_image.extract('etc/hostname', str(tmp_path / 'hostname'))
+    assert (tmp_path / 'hostname').read_bytes() == b'ubuntu\n'
+    gzip_image.extract('bin/tool-link', str(tmp_path / 'link'))
+    assert os.readlink(str(tmp_path / 'link')) == 'tool'
+    gzip_image.extract('bin/tool-link', str(tmp_path / 'tool'),
+                       follow_symlinks=True)
+    assert sha256((tmp_path / 'tool').read_bytes()) == digests['bin/tool']
+
+
+def test_extract_file(tmp_path):
+    dest = str(tmp_path / 'snap.yaml')
+    squashfs.extract_file(tree_path('xz'), 'meta/snap.yaml', dest)
+    assert squashfs.read_file(tree_path('xz'), 'meta/snap.yaml') == \
+        (tmp_path / 'snap.yaml').read_bytes()
+
+
+def test_mksquashfs_image():
+    # Written by mksquashfs 4.4, with 128 KiB blocks
+    with squashfs.SquashFS.open(
+            helpers.data_path('squashfs', 'mksquashfs-gzip.sqfs')) as image:
+        assert image.block_size == 131072
+        assert helpers.unsquashfs_lln(image) == '''\
+drwxr-xr-x 1000/1000                51 2015-06-24 14:47 squashfs-root
+lrwxrwxrwx 1000/1000                 6 2015-06-24 14:47 squashfs-root/link -> broken
+crw-r--r-- 0/0                   1,  3 2015-06-24 14:47 squashfs-root/null
+-rw-r--r-- 1000/1000               446 2015-06-24 14:49 squashfs-root/text
+'''  # noqa: E501
+        assert sha256(image.read_file('text')) == \
+            'd7215606b073b0c4149f21a429db6b344a5cc18279043ca2baa4b819f7002a3d'
+        with pytest.raises(FileNotFoundError):
+            image.lookup('link')
+
+
+def test_not_squashfs(tmp_path):
+    path = tmp_path / 'image'
+    path.write_bytes(bytes(4096))
+    with pytest.raises(squashfs.SquashFSError, match='not a squashfs'):
+        squashfs.SquashFS.open(str(path))
+    path.write_bytes(b'hsqs')
+    with pytest.raises(squashfs.SquashFSError, match='too small'):
+        squashfs.SquashFS.open(str(path))
+
+
+@pytest.mark.skipif(shutil.which('unsquashfs') is None,
+                    reason='needs unsquashfs')
+@pytest.mark.parametrize('path', [tree_path(c) for c in COMPRESSIONS] +
+                         [helpers.data_path('squashfs',
+                                            'mksquashfs-gzip.sqfs')])
+def test_listing_as_unsquashfs(path):
+    proc = subprocess.run(['unsquashfs', '-lln', path],
+                          env=dict(os.environ, TZ='UTC'),
+                          stdout=subprocess.PIPE, text=True, check=True)
+    try:
+        with squashfs.SquashFS.open(path) as image:
+            assert helpers.unsquashfs_lln(image) == proc.stdout
+    except squashfs.SquashFSError as ex:
+        pytest.skip(str(ex))
+
+
+@pytest.mark.skipif(shutil.which('mksquashfs') is None,
+                    reason='needs mksquashfs')
+@pytest.mark.parametrize('compression', list(COMPRESSIONS))
+def test_mksquashfs_images(gzip_image, tmp_path, compression):
+    if not COMPRESSIONS[compression]:
+        pytest.skip('no module for ' + compression)
+    root = str(tmp_path / 'root')
+    gzip_image.extract('/', root)
+    image_path = str(tmp_path / 'image.sqfs')
+    subprocess.run(['mksquashfs', root, image_path, '-quiet', '-noappend',
+                    '-comp', compression, '-b', '4096'],
+                   stdout=subprocess.DEVNULL, check=True)
+    with squashfs.SquashFS.open(image_path) as image:
+        for path, digest in tree_digests().items():
+            assert sha256(image.read_file(path)) == digest, path
+        assert image.lookup('usr/lib/libfoo-chain.so') == \
+            image.lookup('usr/lib/libfoo.so.1')
+        assert image.listdir('many') == gzip_image.listdir('many')
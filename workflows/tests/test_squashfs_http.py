@@ -0,0 +1,233 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import http.server
+import re
+import threading
+
+import pytest
+import urllib3
+
+import helpers
+from se_utils import transport
+from tools import squashfs
+
+RANGE_RE = re.compile(r'bytes=(\d+)-(\d+)')
+
+
+class ImageHandler(http.server.BaseHTTPRequestHandler):
+    """ Serves the image of the server at /image, with range requests as
+    set in the mode of the server:
+
+        range         206 with the requested range
+        ignore-range  200 with the full image
+        short         206 with less data than requested
+        wrong-range   206 with a range that starts after the requested one
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/redirect':
+            self._send(302, b'', [('Location', '/image')])
+            return
+        if self.path != '/image':
+            self._send(404, b'not found\n')
+            return
+        image = self.server.image
+        mode = self.server.mode
+        match = RANGE_RE.fullmatch(self.headers.get('Range', ''))
+        self.server.ranges.append(
+            (int(match.group(1)), int(match.group(2))) if match else None)
+        if match is None or mode == 'ignore-range':
+            self._send(200, image)
+            return
+        start = int(match.group(1))
+        end = min(int(match.group(2)), len(image) - 1)
+        body = image[start:end + 1]
+        if mode == 'short':
+            body = body[:-1]
+        elif mode == 'wrong-range':
+            start += 1
+            body = body[1:]
+        self._send(206, body, [('Content-Range', 'bytes {}-{}/{}'.format(
+            start, end, len(image)))])
+
+
+@pytest.fixture
+def server():
+    """ Server of tree-gzip.sqfs. ranges has the (start, end) of the
+    requests, in order.
+    """
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), ImageHandler)
+    with open(helpers.data_path('squashfs', 'tree-gzip.sqfs'), 'rb') as in_f:
+        httpd.image = in_f.read()
+    httpd.mode = 'range'
+    httpd.ranges = []
+    httpd.url = 'http://127.0.0.1:{}'.format(httpd.server_address[1])
+    thread = threading.Thread(target=httpd.serve_forever,
+                              kwargs={'poll_interval': 0.05})
+    thread.start()
+    try:
+        yield httpd
+    finally:
+        httpd.shutdown()
+        thread.join()
+        httpd.server_close()
+
+
+@pytest.fixture
+def pool():
+    with urllib3.PoolManager() as pool:
+        yield pool
+
+
+def test_read_image(server, pool):
+    source = squashfs.HTTPSource(server.url + '/image', pool)
+    # The image is smaller than the first request, which gets two chunks
+    assert source.size == len(server.image)
+    assert server.ranges == [(0, 2 * 64 * 1024 - 1)]
+    with squashfs.SquashFS(source) as image:
+        with open(helpers.data_path('squashfs', 'tree.lln')) as lln_f:
+            assert helpers.unsquashfs_lln(image) == lln_f.read()
+        with open(helpers.data_path('squashfs', 'tree.sha256')) as sha256_f:
+            for line in sha256_f:
+                digest, path = line.rstrip('\n').split('  ', 1)
+                assert hashlib.sha256(image.read_file(path)).hexdigest() == \
+                    digest
+    assert source.requests == 1
+    assert source.bytes_fetched == len(server.image)
+
+
+def test_read_image_with_transport(server):
+    # Also follows redirections
+    with transport.Transport(retries=0) as url_pool:
+        source = squashfs.HTTPSource(server.url + '/redirect', url_pool,
+                                     chunk_size=1024)
+        with squashfs.SquashFS(source) as image:
+            assert image.read_file('etc/hostname') == b'ubuntu\n'
+            assert image.read_file('many/entry-299-with-a-long-name-for-'
+                                   'a-large-listing') == b'entry 299\n'
+    assert source.requests == len(server.ranges) > 1
+    # Only part of the image was needed
+    assert source.bytes_fetched < len(server.image)
+
+
+def test_ranges(server, pool):
+    size = len(server.image)
+    source = squashfs.HTTPSource(server.url + '/image', pool,
+                                 chunk_size=1024)
+    # The first request gets two chunks
+    assert server.ranges == [(0, 2047)]
+    assert source.read(100, 10) == server.image[100:110]
+    assert source.requests == 1
+
+    # Chunks 2 and 3 in one request
+    assert source.read(1000, 2500) == server.image[1000:3500]
+    assert server.ranges[1:] == [(2048, 4095)]
+
+    # Chunks 4 and 6 are fetched, 3 and 5 are in the cache
+    assert source.read(5 * 1024, 10) == server.image[5 * 1024:5 * 1024 + 10]
+    assert source.read(4000, 3 * 1024) == server.image[4000:4000 + 3 * 1024]
+    assert server.ranges[2:] == [(5 * 1024, 6 * 1024 - 1),
+                                 (4 * 1024, 5 * 1024 - 1),
+                                 (6 * 1024, 7 * 1024 - 1)]
+
+    # The end of the image is not requested past its size, and reads past
+    # it are short
+    last = (size - 1) // 1024
+    assert source.read(size - 10, 100) == server.image[-10:]
+    assert server.ranges[-1] == (last * 1024, size - 1)
+    assert source.read(size, 10) == b''
+    assert source.requests == len(server.ranges) == 6
+    assert source.bytes_fetched == 1024 * 7 + size - last * 1024
+
+
+def test_chunk_eviction(server, pool):
+    source = squashfs.HTTPSource(server.url + '/image', pool,
+                                 chunk_size=1024, cache_chunks=3)
+    assert list(source._chunks) == [0, 1]
+    for chunk in [2, 0, 3]:
+        source.read(chunk * 1024, 1)
+    # 1 was the least recently used one
+    assert list(source._chunks) == [2, 0, 3]
+    assert source.requests == 3
+
+    source.read(0, 1)
+    assert source.requests == 3
+    assert list(source._chunks) == [2, 3, 0]
+    source.read(1024, 1)
+    assert source.requests == 4
+    assert list(source._chunks) == [3, 0, 1]
+
+    # A read larger than the cache fetches only the missing chunks, and
+    # uses the cached ones even if evicted by those fetches
+    assert source.read(0, 5 * 1024) == server.image[:5 * 1024]
+    assert server.ranges[-2:] == [(2 * 1024, 3 * 1024 - 1),
+                                  (4 * 1024, 5 * 1024 - 1)]
+    assert source.requests == 6
+    assert list(source._chunks) == [3, 2, 4]
+    source.close()
+    assert len(source._chunks) == 0
+
+
+def test_server_ignores_range(server, pool):
+    server.mode = 'ignore-range'
+    with pytest.raises(squashfs.SquashFSError, match='status 200'):
+        squashfs.HTTPSource(server.url + '/image', pool)
+    # The connection with the unread body is not reused
+    server.mode = 'range'
+    source = squashfs.HTTPSource(server.url + '/image', pool)
+    assert source.read(0, 4) == b'hsqs'
+
+
+def test_short_read(server, pool):
+    server.mode = 'short'
+    with pytest.raises(squashfs.SquashFSError, match='short read'):
+        squashfs.HTTPSource(server.url + '/image', pool, chunk_size=1024)
+
+    server.mode = 'range'
+    source = squashfs.HTTPSource(server.url + '/image', pool,
+                                 chunk_size=1024)
+    server.mode = 'short'
+    with pytest.raises(squashfs.SquashFSError, match='short read'):
+        source.read(2048, 10)
+    # Nothing is cached from the failed request
+    server.mode = 'range'
+    assert source.read(2048, 10) == server.image[2048:2058]
+
+
+def test_wrong_range(server, pool):
+    server.mode = 'wrong-range'
+    with pytest.raises(squashfs.SquashFSError, match='unexpected range'):
+        squashfs.HTTPSource(server.url + '/image', pool)
+
+
+def test_not_found(server, pool):
+    with pytest.raises(squashfs.SquashFSError, match='status 404'):
+        squashfs.HTTPSource(server.url + '/missing', pool)
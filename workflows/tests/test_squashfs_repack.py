@@ -0,0 +1,291 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import os
+import re
+import shutil
+import stat
+import subprocess
+
+import pytest
+
+import helpers
+from tools import squashfs
+from tools import squashfs_repack
+
+# Compressions that can be written
+COMPRESSIONS = {
+    'gzip': True,
+    'lzo': squashfs.lzo is not None,
+    'xz': True,
+    'lz4': squashfs.lz4 is not None,
+    'zstd': squashfs.zstd is not None or squashfs.zstandard is not None,
+}
+REPACK_TIME = 1767225600  # 2026-01-01 00:00 UTC
+UMASK = 0o022
+MANY_NAME = 'many/entry-{:03d}-with-a-long-name-for-a-large-listing'
+
+REPLACED = {
+    # Only in a fragment
+    'etc/hostname': b'core\n',
+    # In blocks, with the tail in its own block
+    'bin/tool': b'new tool\n' * 5000,
+}
+ADDED = {
+    'etc/new/dir/file.txt': b'created with its parents\n',
+    'many/zzz-last': b'after the other entries\n',
+}
+REMOVED = ['data/random.bin', 'usr/lib/libfoo.so', MANY_NAME.format(0),
+           'data/missing', 'missing/file']
+
+
+def tree_path(compression):
+    return helpers.data_path('squashfs', 'tree-{}.sqfs'.format(compression))
+
+
+def listing_lines(lln):
+    """ Lines of a listing by path. The size of directories depends on the
+    layout of the listing, so it is replaced by '-'.
+    """
+    lines = {}
+    for line in lln.splitlines(keepends=True):
+        path = re.search(r' \d\d:\d\d (\S+)', line).group(1)
+        if line.startswith('d'):
+            line = re.sub(r'^(\S+ \S+) +\d+ ', r'\1 - ', line)
+        lines[path] = line
+    return lines
+
+
+def expected_listing(mode_bits):
+    """ Listing of the image after the changes, with the size of
+    directories replaced
+    :param mode_bits: permissions of the sources of the added files
+    """
+    with open(helpers.data_path('squashfs', 'tree.lln')) as lln_f:
+        lines = listing_lines(lln_f.read())
+    root = 'squashfs-root/'
+    for path in REMOVED:
+        lines.pop(root + path, None)
+    with squashfs.SquashFS.open(tree_path('gzip')) as image:
+        ids = image.read_ids()
+        for path, data in REPLACED.items():
+            # The permissions and owner of the replaced file are kept
+            inode = image.lookup(path)
+            lines[root + path] = helpers.lln_line(
+                root + path, inode.st_mode, ids[inode.uid], ids[inode.gid],
+                len(data), 0, REPACK_TIME)
+    for path in ['squashfs-root/etc/new', 'squashfs-root/etc/new/dir']:
+        lines[path] = helpers.lln_line(path, stat.S_IFDIR | 0o755, 0, 0, 0,
+                                       0, REPACK_TIME)
+    for path, data in ADDED.items():
+        lines[root + path] = helpers.lln_line(
+            root + path, stat.S_IFREG | mode_bits & ~UMASK, 0, 0, len(data),
+            0, REPACK_TIME)
+    # Directories with changed entries
+    for path in ['etc', 'etc/new', 'etc/new/dir', 'many', 'data', 'usr/lib']:
+        path = root + path
+        lines[path] = re.sub(r'\d{4}-\d\d-\d\d \d\d:\d\d',
+                             '2026-01-01 00:00', lines[path])
+    return listing_lines(''.join(lines.values()))
+
+
+def repack(compression, tmp_path):
+    """ Repack a test image with the changes, returns the new path and the
+    permissions of the added files
+    """
+    sources = {}
+    for path, data in list(REPLACED.items()) + list(ADDED.items()):
+        source = tmp_path / path.replace('/', '_')
+        source.write_bytes(data)
+        source.chmod(0o764)
+        sources[path] = str(source)
+    out_path = str(tmp_path / 'repacked.sqfs')
+    with squashfs.SquashFS.open(tree_path(compression)) as image:
+        repack = squashfs_repack.Repack(image)
+        repack.time = REPACK_TIME
+        repack.umask = UMASK
+        for path, source in sources.items():
+            repack.replace(path, source)
+        for path in REMOVED:
+            repack.remove(path)
+        with open(out_path, 'wb') as out_f:
+            repack.write(out_f)
+    return out_path, 0o764
+
+
+@pytest.fixture(params=list(COMPRESSIONS))
+def compression(request):
+    if not COMPRESSIONS[request.param]:
+        pytest.skip('no module for ' + request.param)
+    return request.param
+
+
+def test_repack(compression, tmp_path):
+    out_path, mode_bits = repack(compression, tmp_path)
+    assert os.path.getsize(out_path) % squashfs_repack.PAD_SIZE == 0
+
+    with squashfs.SquashFS.open(out_path) as new:
+        assert new.superblock.mkfs_time == REPACK_TIME
+        assert listing_lines(helpers.unsquashfs_lln(new)) == \
+            expected_listing(mode_bits)
+
+        with open(helpers.data_path('squashfs', 'tree.sha256')) as sha256_f:
+            digests = {path: digest for digest, path in
+                       (line.rstrip('\n').split('  ', 1)
+                        for line in sha256_f)}
+        for path in REMOVED:
+            digests.pop(path, None)
+        for path, data in list(REPLACED.items()) + list(ADDED.items()):
+            digests[path] = hashlib.sha256(data).hexdigest()
+        for path, digest in digests.items():
+            assert hashlib.sha256(new.read_file(path)).hexdigest() == \
+                digest, path
+
+        # Hard links are kept
+        hardlinks = [entry.inode_ref for entry in new.iter_dir(
+            new.lookup('data')) if entry.name.startswith(b'hardlink-')]
+        assert len(hardlinks) == 2 and hardlinks[0] == hardlinks[1]
+        assert new.read_inode(hardlinks[0]).nlink == 2
+        assert new.lookup('usr/lib/libfoo-chain.so', follow_symlinks=False) \
+            .target == b'libfoo.so'
+        with pytest.raises(FileNotFoundError):
+            new.lookup('usr/lib/libfoo-chain.so')
+        assert new.listdir('many')[-1] == 'zzz-last'
+        assert new.lookup('bin/tool').fragment == squashfs.NO_FRAGMENT
+
+
+def test_repack_copies_kept_data(compression, tmp_path):
+    out_path, _ = repack(compression, tmp_path)
+    changed = set(REPLACED) | set(ADDED) | set(REMOVED)
+    with open(helpers.data_path('squashfs', 'tree.sha256')) as sha256_f:
+        kept = [line.rstrip('\n').split('  ', 1)[1] for line in sha256_f
+                if line.rstrip('\n').split('  ', 1)[1] not in changed]
+
+    with squashfs.SquashFS.open(tree_path(compression)) as old, \
+            squashfs.SquashFS.open(out_path) as new:
+        copied_blocks = 0
+        copied_fragments = set()
+        for path in kept:
+            old_inode = old.lookup(path)
+            new_inode = new.lookup(path)
+            assert new_inode.block_sizes == old_inode.block_sizes, path
+            size = sum(s & ~squashfs.DATA_UNCOMPRESSED
+                       for s in old_inode.block_sizes)
+            assert new._read(new_inode.start, size) == \
+                old._read(old_inode.start, size), path
+            copied_blocks += sum(1 for s in old_inode.block_sizes if s != 0)
+            if old_inode.fragment == squashfs.NO_FRAGMENT:
+                assert new_inode.fragment == squashfs.NO_FRAGMENT
+                continue
+            assert new_inode.offset == old_inode.offset
+            old_start, old_size = old.fragment_entry(old_inode.fragment)
+            new_start, new_size = new.fragment_entry(new_inode.fragment)
+            assert new_size == old_size
+            size = old_size & ~squashfs.DATA_UNCOMPRESSED
+            assert new._read(new_start, size) == old._read(old_start, size)
+            copied_fragments.add(old_inode.fragment)
+        assert copied_blocks > 5
+        assert len(copied_fragments) > 1
+
+
+def test_repack_write_twice(compression, tmp_path):
+    source = str(tmp_path / 'source')
+    with open(source, 'wb') as source_f:
+        source_f.write(b'new data\n' * 100)
+
+    def write(repack, name):
+        out_path = str(tmp_path / name)
+        with open(out_path, 'wb') as out_f:
+            repack.write(out_f)
+        with open(out_path, 'rb') as out_f:
+            return out_f.read()
+
+    def new_repack(image, changes):
+        repack = squashfs_repack.Repack(image)
+        repack.time = REPACK_TIME
+        repack.umask = UMASK
+        for path in changes:
+            repack.replace(path, source)
+        return repack
+
+    with squashfs.SquashFS.open(tree_path(compression)) as image:
+        repack = new_repack(image, ['etc/hostname'])
+        first = write(repack, 'first.sqfs')
+        assert write(repack, 'second.sqfs') == first
+        # Changes after a write are in the next one
+        repack.replace('bin/tool', source)
+        third = write(repack, 'third.sqfs')
+        assert third == write(new_repack(image, ['etc/hostname', 'bin/tool']),
+                              'fresh.sqfs')
+    with squashfs.SquashFS.open(str(tmp_path / 'second.sqfs')) as new:
+        assert new.lookup('data/hardlink-1').nlink == 2
+        assert new.read_file('etc/hostname') == b'new data\n' * 100
+    with squashfs.SquashFS.open(str(tmp_path / 'third.sqfs')) as new:
+        assert new.read_file('bin/tool') == b'new data\n' * 100
+
+
+def test_repack_file(tmp_path):
+    source = tmp_path / 'manifest.yaml'
+    source.write_bytes(b'name: test\n')
+    dest = str(tmp_path / 'new.sqfs')
+    squashfs_repack.repack_file(
+        tree_path('gzip'), dest,
+        [(str(source), 'snap/manifest.yaml'), (None, 'etc/hostname')])
+    assert squashfs.read_file(dest, 'snap/manifest.yaml') == b'name: test\n'
+    with pytest.raises(FileNotFoundError):
+        squashfs.read_file(dest, 'etc/hostname')
+
+
+def test_repack_errors(tmp_path):
+    source = tmp_path / 'source'
+    source.write_bytes(b'data\n')
+    with squashfs.SquashFS.open(tree_path('gzip')) as image:
+        repack = squashfs_repack.Repack(image)
+        for path, error in [('etc', 'not a regular file in the image'),
+                            ('data/null', 'not a regular file in the image'),
+                            ('data/hardlink-1', 'hard links'),
+                            ('etc/hostname/x', 'parent is not a directory'),
+                            ('etc/../x', 'invalid path'),
+                            ('/', 'invalid path')]:
+            with pytest.raises(squashfs.SquashFSError, match=error):
+                repack.replace(path, str(source))
+        with pytest.raises(squashfs.SquashFSError, match='is a directory'):
+            repack.remove('etc')
+        with pytest.raises(squashfs.SquashFSError,
+                           match='not a regular file'):
+            repack.replace('etc/dir', str(tmp_path))
+
+    with squashfs.SquashFS.open(tree_path('lzma')) as image:
+        with pytest.raises(squashfs.SquashFSError, match='compression 2'):
+            squashfs_repack.Repack(image)
+
+
+@pytest.mark.skipif(shutil.which('unsquashfs') is None,
+                    reason='needs unsquashfs')
+def test_repack_as_unsquashfs(compression, tmp_path):
+    out_path, _ = repack(compression, tmp_path)
+    proc = subprocess.run(['unsquashfs', '-lln', out_path],
+                          env=dict(os.environ, TZ='UTC'),
+                          stdout=subprocess.PIPE, text=True, check=True)
+    with squashfs.SquashFS.open(out_path) as new:
+        assert helpers.unsquashfs_lln(new) == proc.stdout
+    extract_d = str(tmp_path / 'extracted')
+    subprocess.run(['unsquashfs', '-q', '-n', '-d', extract_d, out_path],
+                   stdout=subprocess.DEVNULL, check=True)
+    for path, data in list(REPLACED.items()) + list(ADDED.items()):
+        with open(os.path.join(extract_d, path), 'rb') as extracted_f:
+            assert extracted_f.read() == data
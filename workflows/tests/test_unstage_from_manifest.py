@@ -0,0 +1,129 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# The expected files in tests/data/unstage were written by loading the
+# manifests with yaml_utils.load_yaml_file() and dumping them with
+# yaml_utils.dump(), that is, with _SafeOrderedDumper like snapcraft, after
+# removing the packages.
+
+import os
+import shutil
+
+import pytest
+
+import helpers
+from tools import yaml_stream
+
+unstage_from_manifest = helpers.load_script('unstage-from-manifest.py')
+
+PKG_LIST = helpers.data_path('unstage', 'unstage-packages')
+
+
+def read(path):
+    with open(path, 'rb') as in_f:
+        return in_f.read()
+
+
+def expected(name):
+    return read(helpers.data_path('unstage', name + '.expected.yaml'))
+
+
+def copy_manifest(name, dest_d):
+    dest = os.path.join(dest_d, name + '.yaml')
+    shutil.copyfile(helpers.data_path('unstage', name + '.yaml'), dest)
+    return dest
+
+
+@pytest.fixture
+def streamed(monkeypatch):
+    """ Records whether the streaming rewrite was used, or it fell back to
+    loading the manifest
+    """
+    calls = []
+    full = unstage_from_manifest.remove_from_staged_full
+
+    def remove_from_staged_full(*args):
+        calls.append(args)
+        full(*args)
+
+    monkeypatch.setattr(unstage_from_manifest, 'remove_from_staged_full',
+                        remove_from_staged_full)
+    return lambda: len(calls) == 0
+
+
+@pytest.mark.parametrize('name,is_streamed', [
+    ('manifest', True),
+    ('manifest-anchors', False),
+])
+def test_remove_from_staged(tmp_path, streamed, name, is_streamed):
+    manifest_p = copy_manifest(name, str(tmp_path))
+    out_p = str(tmp_path / 'out.yaml')
+    unstage_from_manifest.remove_from_staged(PKG_LIST, manifest_p, out_p)
+    assert read(out_p) == expected(name)
+    assert streamed() == is_streamed
+    assert sorted(os.listdir(str(tmp_path))) == sorted([name + '.yaml',
+                                                        'out.yaml'])
+
+
+@pytest.mark.parametrize('name,is_streamed', [
+    ('manifest', True),
+    ('manifest-anchors', False),
+])
+def test_remove_from_staged_in_place(tmp_path, streamed, name, is_streamed):
+    manifest_p = copy_manifest(name, str(tmp_path))
+    unstage_from_manifest.remove_from_staged(PKG_LIST, manifest_p,
+                                             manifest_p)
+    assert read(manifest_p) == expected(name)
+    assert streamed() == is_streamed
+    assert os.listdir(str(tmp_path)) == [name + '.yaml']
+
+
+def test_full_load_matches_expected(tmp_path):
+    for name in ('manifest', 'manifest-anchors'):
+        out_p = str(tmp_path / (name + '.yaml'))
+        unstage_from_manifest.remove_from_staged_full(
+            helpers.data_path('unstage', name + '.yaml'), out_p,
+            unstage_from_manifest.load_pkg_list(PKG_LIST))
+        assert read(out_p) == expected(name)
+
+
+def test_error_keeps_output(tmp_path):
+    manifest_p = str(tmp_path / 'manifest.yaml')
+    with open(manifest_p, 'w') as manifest_f:
+        manifest_f.write('name: broken\n')
+    with pytest.raises(KeyError):
+        unstage_from_manifest.remove_from_staged(PKG_LIST, manifest_p,
+                                                 manifest_p)
+    assert read(manifest_p) == b'name: broken\n'
+    assert os.listdir(str(tmp_path)) == ['manifest.yaml']
+
+
+def test_streaming_not_supported_for_anchors():
+    with open(os.devnull, 'w') as out_f, \
+            pytest.raises(yaml_stream.StreamingNotSupported):
+        yaml_stream.rewrite_manifest(
+            helpers.data_path('unstage', 'manifest-anchors.yaml'), out_f,
+            unstage_from_manifest.load_pkg_list(PKG_LIST))
+
+
+def test_main_bulk(tmp_path):
+    args = []
+    for name in ('manifest', 'manifest-anchors'):
+        manifest_p = copy_manifest(name, str(tmp_path))
+        args += [PKG_LIST, manifest_p, manifest_p]
+    assert unstage_from_manifest.main(args) == 0
+    for name in ('manifest', 'manifest-anchors'):
+        assert read(str(tmp_path / (name + '.yaml'))) == expected(name)
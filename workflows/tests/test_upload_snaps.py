@@ -0,0 +1,90 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# upload-snaps.py runs with tests/data/bin/snapcraft first in PATH, which
+# simulates the uploads.
+
+import os
+import re
+import subprocess
+import sys
+
+import helpers
+
+ARCHS = ['riscv64', 'amd64', 'arm64', 'armhf', 'ppc64el', 's390x']
+SNAP_SIZE = 3 * 1024 * 1024
+SPEED_MIB_S = 30
+REVIEW_S = 0.2
+WORKERS = 2
+
+# snap, result, revision, size, upload time, MiB/s and review time
+SUMMARY_RE = re.compile(r'(\S+) +(ok|error|failed \(\d+\)) +(\d+|-) +'
+                        r'([\d.]+) +([\d.]+)s +([\d.]+) +([\d.]+s|-)')
+
+
+def run_upload_snaps(tmp_path, snaps):
+    env = dict(os.environ)
+    env['PATH'] = helpers.data_path('bin') + os.pathsep + env['PATH']
+    env['SNAP_UPLOAD_WORKERS'] = str(WORKERS)
+    env['FAKE_SNAPCRAFT_STATE'] = str(tmp_path / 'state')
+    env['FAKE_SNAPCRAFT_FAIL'] = 'riscv64'
+    env['FAKE_SNAPCRAFT_SPEED'] = str(SPEED_MIB_S)
+    env['FAKE_SNAPCRAFT_REVIEW'] = str(REVIEW_S)
+    return subprocess.run(
+        [sys.executable, os.path.join(helpers.WORKFLOWS_D, 'upload-snaps.py'),
+         '--release', 'latest/edge'] + snaps,
+        env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+
+def test_upload_snaps(tmp_path):
+    snaps = []
+    for arch in ARCHS:
+        snap_p = str(tmp_path / 'core_1_{}.snap'.format(arch))
+        with open(snap_p, 'wb') as snap_f:
+            snap_f.write(bytes(SNAP_SIZE))
+        snaps.append(snap_p)
+
+    proc = run_upload_snaps(tmp_path, snaps)
+
+    assert proc.returncode == 1
+    assert proc.stderr == 'ERROR: 1 of 6 uploads failed\n'
+    # No more than WORKERS uploads at once, and that many at some point
+    with open(str(tmp_path / 'state')) as state_f:
+        assert state_f.read() == '0 {}'.format(WORKERS)
+
+    lines = proc.stdout.splitlines()
+    header = lines.index('{:<40} {:<11} {:>8} {:>10} {:>9} {:>8} {:>9}'.format(
+        'snap', 'result', 'revision', 'size (MiB)', 'upload', 'MiB/s',
+        'review'))
+    summary = [SUMMARY_RE.fullmatch(line) for line in lines[header + 1:]]
+    assert all(summary)
+    # In the order of the arguments, the failure does not stop the others
+    assert [m.group(1) for m in summary] == \
+        [os.path.basename(p) for p in snaps]
+    for match, snap_p in zip(summary, snaps):
+        (name, result, revision, size, upload_s, speed,
+         review_s) = match.groups()
+        assert float(size) == SNAP_SIZE / (1024 * 1024)
+        assert 0 < float(speed) <= SPEED_MIB_S * 1.1
+        assert float(review_s[:-1]) >= REVIEW_S
+        if 'riscv64' in name:
+            assert result == 'failed (2)'
+            assert revision == '-'
+            assert '[{}] - human review required'.format(name) in lines
+        else:
+            assert result == 'ok'
+            assert "[{}] Revision {} created for 'core' and released to " \
+                "'latest/edge'".format(name, revision) in lines
@@ -0,0 +1,140 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Persistent cache of the changelogs from changelogs.ubuntu.com. The
+# changelog of a given package version never changes, so it is stored
+# gzipped in <root>/<package>/<version>.gz and reused by every job running
+# on the machine. Entries are written to a temporary file and renamed, so
+# concurrent jobs can share the cache. When the cache grows over its size
+# limit, the least recently used entries are removed.
+#
+# Environment:
+#   CHANGELOG_CACHE_DIR       root directory of the cache
+#   CHANGELOG_CACHE_MAX_SIZE  size limit in MiB, 0 disables the cache
+
+import gzip
+import os
+import tempfile
+import threading
+import urllib.parse
+import zlib
+
+DEFAULT_MAX_SIZE_MIB = 512
+
+
+def default_root():
+    cache_d = os.environ.get('XDG_CACHE_HOME',
+                             os.path.expanduser('~/.cache'))
+    return os.path.join(cache_d, 'system-snaps-cicd', 'changelogs')
+
+
+class ChangelogCache():
+    """ Size-bounded on-disk cache of changelogs by (package, version) """
+
+    def __init__(self, root=None, max_size=DEFAULT_MAX_SIZE_MIB * 1024 * 1024):
+        if root is None:
+            root = default_root()
+        self.root = root
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        """ Return the cache configured by the environment, or None if it
+        has been disabled.
+        """
+        max_size = int(os.environ.get('CHANGELOG_CACHE_MAX_SIZE',
+                                      DEFAULT_MAX_SIZE_MIB))
+        if max_size <= 0:
+            return None
+        root = os.environ.get('CHANGELOG_CACHE_DIR') or None
+        return cls(root, max_size * 1024 * 1024)
+
+    def _path(self, pkg, version):
+        # Versions can have epochs, quote to get a safe file name
+        return os.path.join(self.root, pkg,
+                            urllib.parse.quote(version, safe='') + '.gz')
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, pkg, version):
+        """ Return the cached changelog text, or None if not cached """
+        path = self._path(pkg, version)
+        try:
+            with gzip.open(path) as chl_f:
+                text = chl_f.read().decode('utf-8')
+        except (OSError, EOFError, zlib.error):
+            self._count(False)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self._count(True)
+        return text
+
+    def put(self, pkg, version, text):
+        """ Store a changelog in the cache """
+        path = self._path(pkg, version)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_p = tempfile.mkstemp(dir=os.path.dirname(path),
+                                     suffix='.partial')
+        os.fchmod(fd, 0o644)
+        try:
+            with os.fdopen(fd, 'wb') as raw_f, \
+                    gzip.GzipFile(fileobj=raw_f, mode='wb') as chl_f:
+                chl_f.write(text.encode('utf-8'))
+            os.replace(tmp_p, path)
+        except BaseException:
+            os.unlink(tmp_p)
+            raise
+
+    def evict(self):
+        """ Remove least recently used entries until we fit in max_size """
+        entries = []
+        total = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for f in filenames:
+                if not f.endswith('.gz'):
+                    continue
+                p = os.path.join(dirpath, f)
+                try:
+                    st = os.stat(p)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, p))
+                total += st.st_size
+        entries.sort()
+        for _, size, p in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(p)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def stats(self):
+        return 'changelog cache: {} hits, {} misses'.format(self.hits,
+                                                           self.misses)
@@ -0,0 +1,154 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Reading of snapcraft manifests and base dpkg.yaml files. Documents are
+# loaded with libyaml and turned into a compact view with only the package
+# versions, which is what the scripts need. The view can be stored in a
+# cache directory, keyed by the SHA-256 of the file, as JSON is much faster
+# to load than YAML and the same manifests are read several times in a
+# release.
+#
+# Environment:
+#   MANIFEST_CACHE_DIR  directory for the parsed manifests cache, no cache
+#                       is used if not set
+
+import hashlib
+import json
+import os
+import tempfile
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import yaml
+
+from tools import yaml_utils
+
+# Bump when the cached views change
+CACHE_FORMAT = 1
+
+
+class Manifest(NamedTuple):
+    """Package versions from a snapcraft manifest."""
+
+    # Part name to map of staged package name to version
+    parts: Dict[str, Dict[str, str]]
+    # Primed package name to version, None if not in the manifest
+    primed_stage_packages: Optional[Dict[str, str]]
+
+    def staged_versions(self) -> Dict[str, str]:
+        """Return the versions of the packages staged by all parts."""
+        staged_v = {}  # type: Dict[str, str]
+        for stage_packages in self.parts.values():
+            staged_v.update(stage_packages)
+        return staged_v
+
+    def primed_versions(self) -> Dict[str, str]:
+        """Return the versions of the primed packages, or of the staged
+        packages for manifests without primed-stage-packages."""
+        if self.primed_stage_packages is not None:
+            return self.primed_stage_packages
+        return self.staged_versions()
+
+
+def package_versions(pkgs: List[str]) -> Dict[str, str]:
+    """Convert a list of package_name=version to a map."""
+    versions = {}  # type: Dict[str, str]
+    for pkg in pkgs:
+        pkg_data = pkg.split('=')
+        versions[pkg_data[0]] = pkg_data[1]
+    return versions
+
+
+def load_yaml_bytes(data: bytes) -> object:
+    """Load a YAML document with the libyaml safe loader."""
+    # libyaml detects UTF-16 BOMs by itself when given bytes
+    return yaml.load(data, Loader=yaml_utils.CSafeLoader)
+
+
+def _cache_dir() -> Optional[str]:
+    return os.environ.get('MANIFEST_CACHE_DIR') or None
+
+
+def _load_cached(path: str, kind: str, make_view: Callable[[object], dict],
+                 cache_dir: Optional[str]) -> dict:
+    with open(path, 'rb') as manifest_f:
+        data = manifest_f.read()
+    if cache_dir is None:
+        return make_view(load_yaml_bytes(data))
+
+    digest = hashlib.sha256(data).hexdigest()
+    cache_p = os.path.join(cache_dir, '{}-{}.json'.format(kind, digest))
+    try:
+        with open(cache_p) as cache_f:
+            cached = json.load(cache_f)
+        if cached.get('format') == CACHE_FORMAT:
+            return cached['view']
+    except (OSError, ValueError):
+        pass
+
+    view = make_view(load_yaml_bytes(data))
+    tmp_p = None
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile('w', dir=cache_dir,
+                                         delete=False) as cache_f:
+            tmp_p = cache_f.name
+            json.dump({'format': CACHE_FORMAT, 'view': view}, cache_f)
+        os.replace(tmp_p, cache_p)
+    except OSError:
+        # The cache is an optimization only
+        if tmp_p is not None:
+            try:
+                os.unlink(tmp_p)
+            except OSError:
+                pass
+    return view
+
+
+def _manifest_view(manifest_y) -> dict:
+    parts = {}
+    for part, part_y in manifest_y['parts'].items():
+        parts[part] = package_versions(part_y['stage-packages'])
+    primed = None
+    if 'primed-stage-packages' in manifest_y:
+        primed = package_versions(manifest_y['primed-stage-packages'])
+    return {'parts': parts, 'primed-stage-packages': primed}
+
+
+def load_manifest(path: str, cache_dir: Optional[str] = None) -> Manifest:
+    """Load the package versions from a snapcraft manifest.
+    :param path: path to manifest.yaml
+    :param cache_dir: cache directory, MANIFEST_CACHE_DIR if not provided
+    """
+    if cache_dir is None:
+        cache_dir = _cache_dir()
+    view = _load_cached(path, 'manifest', _manifest_view, cache_dir)
+    return Manifest(view['parts'], view['primed-stage-packages'])
+
+
+def _dpkg_view(dpkg_y) -> dict:
+    return {'packages': package_versions(dpkg_y['packages'])}
+
+
+def load_dpkg_packages(path: str,
+                       cache_dir: Optional[str] = None) -> Dict[str, str]:
+    """Load the package versions from the dpkg.yaml file of a base.
+    Package names can have an architecture suffix, like foo:i386.
+    :param path: path to dpkg.yaml
+    :param cache_dir: cache directory, MANIFEST_CACHE_DIR if not provided
+    """
+    if cache_dir is None:
+        cache_dir = _cache_dir()
+    return _load_cached(path, 'dpkg', _dpkg_view, cache_dir)['packages']
@@ -0,0 +1,150 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Diff of package versions, as found in manifests or archive indexes. The
+# diff is a single merge over the packages sorted by name, and produces
+# typed records that can be rendered as text or JSON.
+
+import json
+from typing import (Callable, Dict, Iterable, Iterator, List, NamedTuple,
+                    Optional, Tuple, Union)
+
+import debian.debian_support
+
+ADDED = 'added'
+REMOVED = 'removed'
+UPGRADED = 'upgraded'
+DOWNGRADED = 'downgraded'
+
+
+class Added(NamedTuple):
+    name: str
+    new_version: str
+    kind: str = ADDED
+
+
+class Removed(NamedTuple):
+    name: str
+    old_version: str
+    kind: str = REMOVED
+
+
+class Upgraded(NamedTuple):
+    name: str
+    old_version: str
+    new_version: str
+    kind: str = UPGRADED
+
+
+class Downgraded(NamedTuple):
+    name: str
+    old_version: str
+    new_version: str
+    kind: str = DOWNGRADED
+
+
+Record = Union[Added, Removed, Upgraded, Downgraded]
+Versions = Union[Dict[str, str], Iterable[Tuple[str, str]]]
+
+
+def _sorted_items(versions: Versions) -> Iterable[Tuple[str, str]]:
+    if isinstance(versions, dict):
+        return sorted(versions.items())
+    return versions
+
+
+def diff_versions(old: Versions, new: Versions,
+                  compare: Optional[Callable[[str, str], int]] = None
+                  ) -> Iterator[Record]:
+    """Yield the differences between two sets of package versions.
+    Records are yielded sorted by package name. Versions that are different
+    strings but compare as equal are not reported.
+    :param old: map of package to version, or iterable of (package, version)
+                sorted by package. Packages can be repeated in the iterable.
+    :param new: like old, but packages cannot be repeated
+    :param compare: version comparison function, returning a negative
+                    number if its first argument is older, like
+                    debian_support.version_compare (the default)
+    """
+    if compare is None:
+        compare = debian.debian_support.version_compare
+    old_it = iter(_sorted_items(old))
+    new_it = iter(_sorted_items(new))
+    old_item = next(old_it, None)
+    new_item = next(new_it, None)
+    # Whether new_item has been matched by some old item
+    matched = False
+    while old_item is not None and new_item is not None:
+        old_name, old_v = old_item
+        new_name, new_v = new_item
+        if old_name < new_name:
+            yield Removed(old_name, old_v)
+            old_item = next(old_it, None)
+        elif old_name > new_name:
+            if not matched:
+                yield Added(new_name, new_v)
+            new_item = next(new_it, None)
+            matched = False
+        else:
+            if old_v != new_v:
+                vc = compare(old_v, new_v)
+                if vc < 0:
+                    yield Upgraded(old_name, old_v, new_v)
+                elif vc > 0:
+                    yield Downgraded(old_name, old_v, new_v)
+            old_item = next(old_it, None)
+            matched = True
+    while old_item is not None:
+        yield Removed(*old_item)
+        old_item = next(old_it, None)
+    if new_item is not None and not matched:
+        yield Added(*new_item)
+    for new_item in new_it:
+        yield Added(*new_item)
+
+
+def render_record_text(record: Record) -> str:
+    """Render a record in the format used in snap changelogs."""
+    if record.kind == ADDED:
+        return record.name + ' (' + record.new_version + \
+            '): new primed package\n\n'
+    if record.kind == REMOVED:
+        return record.name + ': not primed anymore\n\n'
+    return record.name + ' ' + record.kind + ' from ' + \
+        record.old_version + ' to ' + record.new_version + '\n\n'
+
+
+def render_text(records: Iterable[Record]) -> str:
+    """Render records in the format used in snap changelogs."""
+    return ''.join(render_record_text(r) for r in records)
+
+
+def record_to_dict(record: Record) -> dict:
+    return record._asdict()
+
+
+def render_json(records: Iterable[Record], **kwargs) -> str:
+    """Render records as a JSON list of objects."""
+    return json.dumps([record_to_dict(r) for r in records], **kwargs)
+
+
+def split_by_kind(records: Iterable[Record]) -> Dict[str, List[Record]]:
+    """Return a map from record kind to the records of that kind."""
+    by_kind = {ADDED: [], REMOVED: [], UPGRADED: [],
+               DOWNGRADED: []}  # type: Dict[str, List[Record]]
+    for r in records:
+        by_kind[r.kind].append(r)
+    return by_kind
@@ -0,0 +1,623 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Read-only access to squashfs 4.0 images, like snaps, without unsquashfs.
+# Only the metadata needed to find a path is read and decompressed, and
+# then only the data blocks of the files being read, so getting a manifest
+# out of a snap reads a few KiB of it.
+#
+# The image is accessed through a source object, which only needs a
+# read(offset, size) method and a size attribute. FileSource memory-maps a
+# local file, and HTTPSource reads a remote one with HTTP range requests.
+#
+# gzip, lzma and xz are supported with the standard library. zstd needs
+# Python 3.14 or the zstandard module, lzo the python-lzo module and lz4 the
+# lz4 module.
+
+import collections
+import lzma
+import mmap
+import os
+import re
+import stat
+import struct
+import zlib
+from typing import Dict, Iterator, List, NamedTuple, Tuple
+
+try:
+    from compression import zstd  # type: ignore
+except ImportError:
+    zstd = None
+try:
+    import zstandard  # type: ignore
+except ImportError:
+    zstandard = None
+try:
+    import lzo  # type: ignore
+except ImportError:
+    lzo = None
+try:
+    import lz4.block  # type: ignore
+except ImportError:
+    lz4 = None
+
+MAGIC = 0x73717368
+SUPERBLOCK = struct.Struct('<IIIIIHHHHHHQQQQQQQQ')
+# Size of uncompressed metadata blocks
+METADATA_SIZE = 8192
+METADATA_UNCOMPRESSED = 0x8000
+DATA_UNCOMPRESSED = 1 << 24
+NO_FRAGMENT = 0xffffffff
+FRAGMENTS_PER_BLOCK = METADATA_SIZE // 16
+# Maximum number of symlinks followed when resolving a path
+MAX_SYMLINKS = 40
+
+GZIP = 1
+LZMA = 2
+LZO = 3
+XZ = 4
+LZ4 = 5
+ZSTD = 6
+
+# Inode types
+DIR = 1
+FILE = 2
+SYMLINK = 3
+BLKDEV = 4
+CHRDEV = 5
+FIFO = 6
+SOCKET = 7
+EXT_DIR = 8
+EXT_FILE = 9
+EXT_SYMLINK = 10
+# The extended device and IPC types are 11 to 14, BLKDEV + 7 and so on
+
+_S_IFMT = {
+    DIR: stat.S_IFDIR,
+    FILE: stat.S_IFREG,
+    SYMLINK: stat.S_IFLNK,
+    BLKDEV: stat.S_IFBLK,
+    CHRDEV: stat.S_IFCHR,
+    FIFO: stat.S_IFIFO,
+    SOCKET: stat.S_IFSOCK,
+}
+
+
+class SquashFSError(Exception):
+    pass
+
+
+class Superblock(NamedTuple):
+    inode_count: int
+    mkfs_time: int
+    block_size: int
+    fragment_count: int
+    compression: int
+    block_log: int
+    flags: int
+    id_count: int
+    root_inode: int
+    bytes_used: int
+    id_table_start: int
+    xattr_id_table_start: int
+    inode_table_start: int
+    directory_table_start: int
+    fragment_table_start: int
+    export_table_start: int
+
+
+class Inode(NamedTuple):
+    """An inode, with the fields needed to read or rewrite the image."""
+
+    # One of DIR, FILE, SYMLINK, BLKDEV, CHRDEV, FIFO or SOCKET, also for
+    # extended inodes
+    type: int
+    # Permission bits
+    mode: int
+    mtime: int
+    # Directories: position of the listing in the directory table, as
+    # (block start, offset), and its size
+    # Files: position of the first data block, the fragment index, the
+    # offset of the tail in the fragment, and the size
+    # Symlinks: the target in target
+    start: int = 0
+    offset: int = 0
+    size: int = 0
+    fragment: int = NO_FRAGMENT
+    block_sizes: Tuple[int, ...] = ()
+    target: bytes = b''
+    # xattr index for extended inodes, 0xffffffff if none
+    xattr: int = 0xffffffff
+    # Owner and group, as indexes in the id table
+    uid: int = 0
+    gid: int = 0
+    number: int = 0
+    nlink: int = 1
+    # Devices: device number
+    rdev: int = 0
+
+    @property
+    def st_mode(self) -> int:
+        return _S_IFMT[self.type] | self.mode
+
+
+class DirEntry(NamedTuple):
+    name: bytes
+    inode_ref: int
+    type: int
+
+
+class FileSource():
+    """ Memory-mapped local image """
+
+    def __init__(self, path):
+        with open(path, 'rb') as image_f:
+            self.size = os.fstat(image_f.fileno()).st_size
+            if self.size == 0:
+                raise SquashFSError(path + ': empty file')
+            self._map = mmap.mmap(image_f.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+
+    def read(self, offset, size):
+        return self._map[offset:offset + size]
+
+    def close(self):
+        self._map.close()
+
+
+class HTTPSource():
+    """ Remote image read with HTTP range requests. Reads are done in
+    aligned chunks, and the most recently used ones are kept in memory, so
+    the small reads of metadata need few requests.
+    """
+
+    CONTENT_RANGE_RE = re.compile(r'bytes (\d+)-(\d+)/(\d+)')
+
+    def __init__(self, url, url_pool, chunk_size=64 * 1024, cache_chunks=64):
+        """
+        :param url: URL of the image, redirections are followed
+        :param url_pool: urllib3 pool, or se_utils.transport.Transport
+        :param chunk_size: size of the reads from the server
+        :param cache_chunks: number of chunks kept in memory
+        """
+        self.url = url
+        self.url_pool = url_pool
+        self.chunk_size = chunk_size
+        self.cache_chunks = cache_chunks
+        # Bytes received from the server
+        self.bytes_fetched = 0
+        self.requests = 0
+        self._chunks: Dict[int, bytes] = collections.OrderedDict()
+        # The first request also tells us the size of the image
+        self.size = None
+        self._fetch(0, 1)
+
+    def _fetch(self, first, last):
+        """ Get chunks first to last, both included, in a single request
+        :return: list with the chunks
+        """
+        start = first * self.chunk_size
+        end = (last + 1) * self.chunk_size - 1
+        if self.size is not None:
+            end = min(end, self.size - 1)
+        headers = {'Range': 'bytes={}-{}'.format(start, end)}
+        response = self.url_pool.request('GET', self.url, headers=headers,
+                                         preload_content=False)
+        try:
+            if response.status != 206:
+                # Do not download the full image if ranges are not supported,
+                # and do not reuse the connection with the body unread
+                response.close()
+                raise SquashFSError(
+                    'range request to {} failed with status {}'.format(
+                        self.url, response.status))
+            match = self.CONTENT_RANGE_RE.fullmatch(
+                response.headers.get('Content-Range', ''))
+            if match is None or int(match.group(1)) != start:
+                raise SquashFSError('unexpected range from ' + self.url)
+            self.size = int(match.group(3))
+            data = response.read()
+        finally:
+            response.release_conn()
+        self.requests += 1
+        self.bytes_fetched += len(data)
+        if len(data) != min(end, self.size - 1) - start + 1:
+            raise SquashFSError('short read from ' + self.url)
+        chunks = []
+        for i in range(first, last + 1):
+            offset = (i - first) * self.chunk_size
+            chunks.append(data[offset:offset + self.chunk_size])
+            self._chunks[i] = chunks[-1]
+            self._chunks.move_to_end(i)
+        while len(self._chunks) > self.cache_chunks:
+            self._chunks.popitem(last=False)
+        return chunks
+
+    def read(self, offset, size):
+        end = min(offset + size, self.size)
+        if offset >= end:
+            return b''
+        first = offset // self.chunk_size
+        last = (end - 1) // self.chunk_size
+        # Take cached chunks first, as fetching others might evict them
+        cached = {}
+        for i in range(first, last + 1):
+            if i in self._chunks:
+                self._chunks.move_to_end(i)
+                cached[i] = self._chunks[i]
+        # Fetch missing chunks, grouping consecutive ones in one request
+        chunks = []
+        missing_from = None
+        for i in range(first, last + 2):
+            if i <= last and i not in cached:
+                if missing_from is None:
+                    missing_from = i
+                continue
+            if missing_from is not None:
+                chunks += self._fetch(missing_from, i - 1)
+                missing_from = None
+            if i <= last:
+                chunks.append(cached[i])
+        data = b''.join(chunks)
+        start = offset - first * self.chunk_size
+        return data[start:start + end - offset]
+
+    def close(self):
+        self._chunks.clear()
+
+
+def _decompressor(compression):
+    # Each function gets a compressed block and returns the decompressed data,
+    # which is never larger than the max_size argument.
+    if compression == GZIP:
+        return lambda data, max_size: zlib.decompress(data)
+    if compression == XZ:
+        return lambda data, max_size: lzma.decompress(
+            data, format=lzma.FORMAT_XZ)
+    if compression == LZMA:
+        return lambda data, max_size: lzma.decompress(
+            data, format=lzma.FORMAT_ALONE)
+    if compression == ZSTD:
+        if zstd is not None:
+            return lambda data, max_size: zstd.decompress(data)
+        if zstandard is not None:
+            dctx = zstandard.ZstdDecompressor()
+            return lambda data, max_size: dctx.decompress(
+                data, max_output_size=max_size)
+        raise SquashFSError('zstd images need Python 3.14 or ' +
+                            'the zstandard module')
+    if compression == LZO:
+        if lzo is None:
+            raise SquashFSError('lzo images need the python-lzo module')
+        return lambda data, max_size: lzo.decompress(data, False, max_size)
+    if compression == LZ4:
+        if lz4 is None:
+            raise SquashFSError('lz4 images need the lz4 module')
+        return lambda data, max_size: lz4.block.decompress(
+            data, uncompressed_size=max_size)
+    raise SquashFSError('unknown compression {}'.format(compression))
+
+
+class SquashFS():
+    """ Read-only squashfs image """
+
+    def __init__(self, source):
+        self.source = source
+        data = source.read(0, SUPERBLOCK.size)
+        if len(data) < SUPERBLOCK.size:
+            raise SquashFSError('image too small')
+        fields = SUPERBLOCK.unpack(data)
+        if fields[0] != MAGIC:
+            raise SquashFSError('not a squashfs image')
+        if (fields[9], fields[10]) != (4, 0):
+            raise SquashFSError('unsupported squashfs version {}.{}'.format(
+                fields[9], fields[10]))
+        self.superblock = Superblock(*fields[1:9], *fields[11:])
+        if self.superblock.block_size != 1 << self.superblock.block_log:
+            raise SquashFSError('corrupted superblock')
+        self.block_size = self.superblock.block_size
+        self._decompress = _decompressor(self.superblock.compression)
+        # Position of metadata block to (data, position of next block)
+        self._metadata: Dict[int, Tuple[bytes, int]] = {}
+        # Last fragment block read, as (index, data)
+        self._fragment = (NO_FRAGMENT, b'')
+
+    @classmethod
+    def open(cls, path):
+        """ Open a local image file """
+        source = FileSource(path)
+        try:
+            return cls(source)
+        except BaseException:
+            source.close()
+            raise
+
+    def close(self):
+        self.source.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _read(self, offset, size):
+        data = self.source.read(offset, size)
+        if len(data) != size:
+            raise SquashFSError('truncated image')
+        return data
+
+    def _metadata_block(self, pos):
+        block = self._metadata.get(pos)
+        if block is None:
+            header, = struct.unpack('<H', self._read(pos, 2))
+            size = header & ~METADATA_UNCOMPRESSED
+            data = self._read(pos + 2, size)
+            if not header & METADATA_UNCOMPRESSED:
+                data = self._decompress(data, METADATA_SIZE)
+            block = (data, pos + 2 + size)
+            self._metadata[pos] = block
+        return block
+
+    def _read_metadata(self, pos, offset, size):
+        """ Read size bytes of metadata starting at offset of the block at
+        pos. Returns the data and the position after it, as (pos, offset).
+        """
+        chunks = []
+        while size > 0:
+            data, next_pos = self._metadata_block(pos)
+            chunk = data[offset:offset + size]
+            chunks.append(chunk)
+            size -= len(chunk)
+            offset += len(chunk)
+            if offset >= len(data):
+                if size > 0 and next_pos >= self.superblock.bytes_used:
+                    raise SquashFSError('metadata out of bounds')
+                pos, offset = next_pos, 0
+        return b''.join(chunks), pos, offset
+
+    def read_inode(self, inode_ref: int) -> Inode:
+        """ Read the inode with a given reference """
+        pos = self.superblock.inode_table_start + (inode_ref >> 16)
+        offset = inode_ref & 0xffff
+
+        def read(fmt):
+            nonlocal pos, offset
+            data, pos, offset = self._read_metadata(pos, offset,
+                                                    struct.calcsize(fmt))
+            return struct.unpack(fmt, data)
+
+        itype, mode, uid, gid, mtime, number = read('<HHHHII')
+        common = {'uid': uid, 'gid': gid, 'number': number}
+        if itype == DIR:
+            start, nlink, size, offset_in_block, _ = read('<IIHHI')
+            return Inode(DIR, mode, mtime, start, offset_in_block, size,
+                         nlink=nlink, **common)
+        if itype == EXT_DIR:
+            nlink, size, start, _, _, offset_in_block, xattr = \
+                read('<IIIIHHI')
+            return Inode(DIR, mode, mtime, start, offset_in_block, size,
+                         xattr=xattr, nlink=nlink, **common)
+        if itype == FILE:
+            start, fragment, frag_offset, size = read('<IIII')
+            nlink = 1
+            xattr = 0xffffffff
+        elif itype == EXT_FILE:
+            start, size, _, nlink, fragment, frag_offset, xattr = \
+                read('<QQQIIII')
+        elif itype in (SYMLINK, EXT_SYMLINK):
+            nlink, target_size = read('<II')
+            target, = read('<{}s'.format(target_size))
+            xattr = 0xffffffff
+            if itype == EXT_SYMLINK:
+                xattr, = read('<I')
+            return Inode(SYMLINK, mode, mtime, size=target_size,
+                         target=target, xattr=xattr, nlink=nlink, **common)
+        elif itype in (BLKDEV, CHRDEV):
+            nlink, rdev = read('<II')
+            return Inode(itype, mode, mtime, nlink=nlink, rdev=rdev,
+                         **common)
+        elif itype in (FIFO, SOCKET):
+            nlink, = read('<I')
+            return Inode(itype, mode, mtime, nlink=nlink, **common)
+        elif itype in (BLKDEV + 7, CHRDEV + 7):
+            nlink, rdev, xattr = read('<III')
+            return Inode(itype - 7, mode, mtime, xattr=xattr, nlink=nlink,
+                         rdev=rdev, **common)
+        elif itype in (FIFO + 7, SOCKET + 7):
+            nlink, xattr = read('<II')
+            return Inode(itype - 7, mode, mtime, xattr=xattr, nlink=nlink,
+                         **common)
+        else:
+            raise SquashFSError('unknown inode type {}'.format(itype))
+
+        # Files: the sizes of the blocks follow
+        n_blocks = size // self.block_size
+        if fragment == NO_FRAGMENT and size % self.block_size != 0:
+            n_blocks += 1
+        block_sizes = read('<{}I'.format(n_blocks)) if n_blocks > 0 else ()
+        return Inode(FILE, mode, mtime, start, frag_offset, size, fragment,
+                     block_sizes, xattr=xattr, nlink=nlink, **common)
+
+    def root_inode(self) -> Inode:
+        return self.read_inode(self.superblock.root_inode)
+
+    def iter_dir(self, inode: Inode) -> Iterator[DirEntry]:
+        """ Iterate over the entries of a directory inode """
+        if inode.type != DIR:
+            raise SquashFSError('not a directory')
+        pos = self.superblock.directory_table_start + inode.start
+        offset = inode.offset
+        # The size includes 3 bytes for the implicit . and .. entries
+        remaining = inode.size - 3
+        while remaining > 0:
+            data, pos, offset = self._read_metadata(pos, offset, 12)
+            count, start, _ = struct.unpack('<III', data)
+            remaining -= 12
+            for _ in range(count + 1):
+                data, pos, offset = self._read_metadata(pos, offset, 8)
+                entry_offset, _, etype, name_size = \
+                    struct.unpack('<HhHH', data)
+                name, pos, offset = self._read_metadata(pos, offset,
+                                                        name_size + 1)
+                remaining -= 8 + name_size + 1
+                yield DirEntry(name, (start << 16) | entry_offset, etype)
+
+    def lookup(self, path: str, follow_symlinks: bool = True) -> Inode:
+        """ Return the inode of a path, relative to the root of the image.
+        Raises FileNotFoundError if not found.
+        """
+        names = [os.fsencode(n) for n in path.split('/') if n not in ('', '.')]
+        # Inodes of the directories leading to the current one
+        parents: List[Inode] = []
+        inode = self.root_inode()
+        links = 0
+        while len(names) > 0:
+            name = names.pop(0)
+            if name == b'..':
+                if len(parents) > 0:
+                    inode = parents.pop()
+                continue
+            if inode.type != DIR:
+                raise NotADirectoryError(path)
+            for entry in self.iter_dir(inode):
+                if entry.name == name:
+                    break
+            else:
+                raise FileNotFoundError(path)
+            child = self.read_inode(entry.inode_ref)
+            if child.type == SYMLINK and (follow_symlinks or len(names) > 0):
+                links += 1
+                if links > MAX_SYMLINKS:
+                    raise SquashFSError(path + ': too many symlinks')
+                target = child.target.split(b'/')
+                if child.target.startswith(b'/'):
+                    parents = []
+                    inode = self.root_inode()
+                names = [n for n in target if n not in (b'', b'.')] + names
+                continue
+            parents.append(inode)
+            inode = child
+        return inode
+
+    def listdir(self, path: str) -> List[str]:
+        """ Return the names of the entries of a directory """
+        return [os.fsdecode(e.name) for e in self.iter_dir(self.lookup(path))]
+
+    def fragment_entry(self, index: int) -> Tuple[int, int]:
+        """ Return the position and the on-disk size of a fragment block """
+        if index >= self.superblock.fragment_count:
+            raise SquashFSError('fragment {} out of bounds'.format(index))
+        table_pos = self.superblock.fragment_table_start + \
+            8 * (index // FRAGMENTS_PER_BLOCK)
+        block_pos, = struct.unpack('<Q', self._read(table_pos, 8))
+        entry, _, _ = self._read_metadata(
+            block_pos, 16 * (index % FRAGMENTS_PER_BLOCK), 16)
+        start, size, _ = struct.unpack('<QII', entry)
+        return start, size
+
+    def _fragment_block(self, index):
+        if self._fragment[0] == index:
+            return self._fragment[1]
+        start, size = self.fragment_entry(index)
+        data = self._read(start, size & ~DATA_UNCOMPRESSED)
+        if not size & DATA_UNCOMPRESSED:
+            data = self._decompress(data, self.block_size)
+        self._fragment = (index, data)
+        return data
+
+    def read_ids(self) -> List[int]:
+        """ Return the id table, with the uids and gids used by inodes """
+        count = self.superblock.id_count
+        if count == 0:
+            return []
+        block_pos, = struct.unpack(
+            '<Q', self._read(self.superblock.id_table_start, 8))
+        data, _, _ = self._read_metadata(block_pos, 0, 4 * count)
+        return list(struct.unpack('<{}I'.format(count), data))
+
+    def iter_inode_data(self, inode: Inode) -> Iterator[bytes]:
+        """ Iterate over the data of a file inode, one block at a time """
+        if inode.type != FILE:
+            raise SquashFSError('not a regular file')
+        pos = inode.start
+        remaining = inode.size
+        for block_size in inode.block_sizes:
+            out_size = min(remaining, self.block_size)
+            size = block_size & ~DATA_UNCOMPRESSED
+            if size == 0:
+                # Sparse block
+                data = bytes(out_size)
+            else:
+                data = self._read(pos, size)
+                pos += size
+                if not block_size & DATA_UNCOMPRESSED:
+                    data = self._decompress(data, self.block_size)
+            if len(data) != out_size:
+                raise SquashFSError('unexpected data block size')
+            remaining -= out_size
+            yield data
+        if inode.fragment != NO_FRAGMENT:
+            data = self._fragment_block(inode.fragment)
+            data = data[inode.offset:inode.offset + remaining]
+            if len(data) != remaining:
+                raise SquashFSError('fragment too small')
+            yield data
+
+    def iter_file(self, path: str) -> Iterator[bytes]:
+        """ Iterate over the data of a file, one block at a time """
+        return self.iter_inode_data(self.lookup(path))
+
+    def read_file(self, path: str) -> bytes:
+        """ Return the content of a file """
+        return b''.join(self.iter_file(path))
+
+    def _extract_inode(self, inode, dest):
+        if inode.type == FILE:
+            with open(dest, 'wb') as dest_f:
+                for data in self.iter_inode_data(inode):
+                    dest_f.write(data)
+            os.chmod(dest, inode.mode)
+        elif inode.type == SYMLINK:
+            os.symlink(inode.target, os.fsencode(dest))
+        elif inode.type == DIR:
+            os.makedirs(dest, exist_ok=True)
+            for entry in self.iter_dir(inode):
+                self._extract_inode(self.read_inode(entry.inode_ref),
+                                    os.path.join(os.fsencode(dest),
+                                                 entry.name))
+            os.chmod(dest, inode.mode)
+        # Devices, fifos and sockets are not extracted
+
+    def extract(self, path: str, dest: str,
+                follow_symlinks: bool = False) -> None:
+        """ Extract a file, a symlink or a directory tree to dest.
+        Devices, fifos and sockets are skipped. Owners and mtimes are not
+        restored.
+        """
+        self._extract_inode(self.lookup(path, follow_symlinks), dest)
+
+
+def read_file(image_path: str, path: str) -> bytes:
+    """ Return the content of a file in a local image """
+    with SquashFS.open(image_path) as image:
+        return image.read_file(path)
+
+
+def extract_file(image_path: str, path: str, dest: str) -> None:
+    """ Extract a path from a local image to dest """
+    with SquashFS.open(image_path) as image:
+        image.extract(path, dest)
@@ -0,0 +1,582 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Rewrite of squashfs images, like snaps, with some files replaced, added or
+# removed, without extracting and packing the full tree again. The
+# compressed data blocks and fragments of the files that are kept are copied
+# as they are, and only the new files are compressed. The inode, directory,
+# fragment, export and id tables are then written again, in the order
+# mksquashfs uses.
+#
+# Images with extended attributes are not supported, and neither are legacy
+# lzma images. Other compressions need the same modules as reading them, see
+# tools/squashfs.
+
+import bisect
+import lzma
+import os
+import stat
+import struct
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from tools import squashfs
+
+# Superblock flags
+UNCOMPRESSED_INODES = 0x0001
+UNCOMPRESSED_DATA = 0x0002
+UNCOMPRESSED_FRAGMENTS = 0x0008
+EXPORTABLE = 0x0080
+COMPRESSOR_OPTIONS = 0x0400
+UNCOMPRESSED_IDS = 0x0800
+
+INVALID_TABLE = 0xffffffffffffffff
+NO_XATTR = 0xffffffff
+# Maximum number of entries after a directory header
+DIR_HEADER_ENTRIES = 256
+# Images are padded to a multiple of this size, as mksquashfs does
+PAD_SIZE = 4096
+COPY_SIZE = 1024 * 1024
+# Maximum length of names in directories
+NAME_MAX = 256
+
+SquashFSError = squashfs.SquashFSError
+
+
+def _compressor(compression, block_size, options):
+    """ Return a function that compresses a block like the one used to
+    create an image.
+    :param options: compressor options stored in the image, or None
+    """
+    if compression == squashfs.GZIP:
+        level, window = 9, 15
+        if options:
+            level, window = struct.unpack('<IH', options[:6])
+
+        def compress_gzip(data):
+            compressor = zlib.compressobj(level, zlib.DEFLATED, window)
+            return compressor.compress(data) + compressor.flush()
+        return compress_gzip
+    if compression == squashfs.XZ:
+        # The kernel allocates the dictionary for the block size
+        dict_size = max(block_size, squashfs.METADATA_SIZE)
+        if options:
+            dict_size, = struct.unpack('<I', options[:4])
+        filters = [{'id': lzma.FILTER_LZMA2, 'preset': 6,
+                    'dict_size': dict_size}]
+        return lambda data: lzma.compress(data, format=lzma.FORMAT_XZ,
+                                          check=lzma.CHECK_CRC32,
+                                          filters=filters)
+    if compression == squashfs.ZSTD:
+        level = 15
+        if options:
+            level, = struct.unpack('<I', options[:4])
+        if squashfs.zstd is not None:
+            return lambda data: squashfs.zstd.compress(data, level=level)
+        if squashfs.zstandard is not None:
+            cctx = squashfs.zstandard.ZstdCompressor(level=level)
+            return cctx.compress
+        raise SquashFSError('zstd images need Python 3.14 or ' +
+                            'the zstandard module')
+    if compression == squashfs.LZO:
+        if squashfs.lzo is None:
+            raise SquashFSError('lzo images need the python-lzo module')
+        # lzo1x_999 unless the image says otherwise
+        level = 9
+        if options:
+            algorithm, _ = struct.unpack('<II', options[:8])
+            level = 9 if algorithm == 4 else 1
+        return lambda data: squashfs.lzo.compress(data, level, False)
+    if compression == squashfs.LZ4:
+        if squashfs.lz4 is None:
+            raise SquashFSError('lz4 images need the lz4 module')
+        mode = 'default'
+        if options:
+            _, flags = struct.unpack('<II', options[:8])
+            if flags & 1:
+                mode = 'high_compression'
+        return lambda data: squashfs.lz4.block.compress(
+            data, mode=mode, store_size=False)
+    raise SquashFSError('cannot write images with compression {}'.format(
+        compression))
+
+
+class _MetadataWriter():
+    """ Table made of metadata blocks """
+
+    def __init__(self, compress, uncompressed):
+        self.compress = compress
+        self.uncompressed = uncompressed
+        self.data = bytearray()
+        self.pending = bytearray()
+        # Position of each block in data
+        self.block_starts: List[int] = []
+
+    def reference(self):
+        """ Position of the next byte, as (block start << 16) | offset """
+        return (len(self.data) << 16) | len(self.pending)
+
+    def write(self, data):
+        self.pending += data
+        while len(self.pending) >= squashfs.METADATA_SIZE:
+            self._flush(bytes(self.pending[:squashfs.METADATA_SIZE]))
+            del self.pending[:squashfs.METADATA_SIZE]
+
+    def _flush(self, block):
+        self.block_starts.append(len(self.data))
+        compressed = None if self.uncompressed else self.compress(block)
+        if compressed is None or len(compressed) >= len(block):
+            header = len(block) | squashfs.METADATA_UNCOMPRESSED
+            compressed = block
+        else:
+            header = len(compressed)
+        self.data += struct.pack('<H', header) + compressed
+
+    def finish(self):
+        if len(self.pending) > 0:
+            self._flush(bytes(self.pending))
+            self.pending = bytearray()
+        return bytes(self.data)
+
+
+class _Node():
+    """ Entry in the tree of the new image. Files that are not replaced
+    keep the inode of the original image, new ones have a source path.
+    """
+
+    def __init__(self, inode, source=None):
+        self.inode = inode
+        self.source = source
+        # Names to nodes, for directories
+        self.children: Optional[Dict[bytes, '_Node']] = None
+        if inode.type == squashfs.DIR:
+            self.children = {}
+        # Set by each write(): the inode as written, with the position of
+        # the data in the new image, its number, links and reference
+        self.written = inode
+        self.number = 0
+        self.nlink = 0
+        self.ref: Optional[int] = None
+
+
+def _umask():
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+class Repack():
+    """ Rewrite of an image with some files changed. Usage:
+
+        with squashfs.SquashFS.open(path) as image:
+            repack = Repack(image)
+            repack.replace('snap/manifest.yaml', 'manifest.yaml')
+            repack.remove('snap/unstage.txt')
+            with open(new_path, 'wb') as out_f:
+                repack.write(out_f)
+    """
+
+    def __init__(self, image: squashfs.SquashFS):
+        self.image = image
+        sb = image.superblock
+        if sb.xattr_id_table_start != INVALID_TABLE:
+            raise SquashFSError('images with extended attributes are ' +
+                                'not supported')
+        self.options = None
+        if sb.flags & COMPRESSOR_OPTIONS:
+            header, = struct.unpack('<H', image.source.read(
+                squashfs.SUPERBLOCK.size, 2))
+            if not header & squashfs.METADATA_UNCOMPRESSED:
+                raise SquashFSError('compressed compressor options')
+            size = header & ~squashfs.METADATA_UNCOMPRESSED
+            self.options = image.source.read(squashfs.SUPERBLOCK.size,
+                                             2 + size)
+        self.compress = _compressor(sb.compression, sb.block_size,
+                                    self.options and self.options[2:])
+        self.time = int(time.time())
+        self.umask = _umask()
+        # Nodes of the original image with more than one link, by reference
+        self._links: Dict[int, _Node] = {}
+        self.root = self._load(image.root_inode())
+
+    def _load(self, inode):
+        node = _Node(inode)
+        for entry in self.image.iter_dir(inode):
+            child_inode = self.image.read_inode(entry.inode_ref)
+            if child_inode.type == squashfs.DIR:
+                child = self._load(child_inode)
+            elif child_inode.nlink > 1:
+                child = self._links.get(entry.inode_ref)
+                if child is None:
+                    child = _Node(child_inode)
+                    self._links[entry.inode_ref] = child
+            else:
+                child = _Node(child_inode)
+            node.children[entry.name] = child
+        return node
+
+    def _touch(self, node):
+        node.inode = node.inode._replace(mtime=self.time)
+
+    def _lookup_parent(self, path, create):
+        """ Return the directory node for the parent of path, and the name
+        in it. The node is None if it does not exist and create is False.
+        """
+        names = [os.fsencode(n) for n in path.split('/') if n not in ('', '.')]
+        if len(names) == 0 or b'..' in names or \
+                any(len(n) > NAME_MAX for n in names):
+            raise SquashFSError('invalid path ' + path)
+        node = self.root
+        for name in names[:-1]:
+            child = node.children.get(name)
+            if child is None:
+                if not create:
+                    return None, names[-1]
+                # Like 'mkdir -p'
+                child = _Node(squashfs.Inode(
+                    squashfs.DIR, 0o777 & ~self.umask, self.time,
+                    uid=node.inode.uid, gid=node.inode.gid))
+                node.children[name] = child
+                self._touch(node)
+            elif child.inode.type != squashfs.DIR:
+                raise SquashFSError(path + ': parent is not a directory')
+            node = child
+        return node, names[-1]
+
+    def replace(self, path: str, source: str) -> None:
+        """ Set the content of path in the image to the one of the source
+        file, like 'cp <source> <path>'. The file is created if it does not
+        exist, together with its parent directories.
+        """
+        st = os.stat(source)
+        if not stat.S_ISREG(st.st_mode):
+            raise SquashFSError(source + ': not a regular file')
+        parent, name = self._lookup_parent(path, create=True)
+        old = parent.children.get(name)
+        if old is None:
+            inode = squashfs.Inode(
+                squashfs.FILE, stat.S_IMODE(st.st_mode) & 0o777 & ~self.umask,
+                self.time, uid=parent.inode.uid, gid=parent.inode.gid)
+            self._touch(parent)
+        elif old.inode.type != squashfs.FILE:
+            raise SquashFSError(path + ': not a regular file in the image')
+        elif old.inode.nlink > 1:
+            raise SquashFSError(path + ': hard links are not supported')
+        else:
+            inode = squashfs.Inode(squashfs.FILE, old.inode.mode, self.time,
+                                   uid=old.inode.uid, gid=old.inode.gid)
+        parent.children[name] = _Node(inode, source)
+
+    def remove(self, path: str) -> None:
+        """ Remove a file from the image, like 'rm -f <path>' """
+        parent, name = self._lookup_parent(path, create=False)
+        if parent is None or name not in parent.children:
+            return
+        if parent.children[name].inode.type == squashfs.DIR:
+            raise SquashFSError(path + ': is a directory')
+        del parent.children[name]
+        self._touch(parent)
+
+    def _nodes(self):
+        """ Return all nodes, once each, in the order inodes are written:
+        the children of a directory before it, subdirectories first. The
+        state left in them by a previous write() is reset.
+        """
+        nodes = []
+        seen = set()
+
+        def reset(node):
+            node.written = node.inode
+            node.nlink = 0
+            node.ref = None
+
+        def visit(node):
+            reset(node)
+            for name in sorted(node.children):
+                child = node.children[name]
+                if child.inode.type == squashfs.DIR:
+                    visit(child)
+                    continue
+                if id(child) not in seen:
+                    seen.add(id(child))
+                    reset(child)
+                    nodes.append(child)
+                child.nlink += 1
+            node.nlink = 2 + sum(1 for c in node.children.values()
+                                 if c.inode.type == squashfs.DIR)
+            nodes.append(node)
+        visit(self.root)
+        return nodes
+
+    def _copy(self, out_f, start, size):
+        while size > 0:
+            data = self.image.source.read(start, min(size, COPY_SIZE))
+            if len(data) == 0:
+                raise SquashFSError('truncated image')
+            out_f.write(data)
+            start += len(data)
+            size -= len(data)
+
+    def _write_data(self, out_f, nodes):
+        """ Write the data of the files, and set their written inodes.
+        Returns the fragment table.
+        """
+        # Old data of kept files and fragments, as (start, size), which is
+        # copied in runs of contiguous blocks
+        extents = []
+        fragments = {}
+        for node in nodes:
+            inode = node.inode
+            if inode.type != squashfs.FILE or node.source is not None:
+                continue
+            size = sum(s & ~squashfs.DATA_UNCOMPRESSED
+                       for s in inode.block_sizes)
+            if size > 0:
+                extents.append((inode.start, size))
+            if inode.fragment != squashfs.NO_FRAGMENT and \
+                    inode.fragment not in fragments:
+                fragments[inode.fragment] = self.image.fragment_entry(
+                    inode.fragment)
+                start, size = fragments[inode.fragment]
+                extents.append((start, size & ~squashfs.DATA_UNCOMPRESSED))
+        extents.sort()
+        # Runs as (old start, old end, new start)
+        runs: List[Tuple[int, int, int]] = []
+        for start, size in extents:
+            if len(runs) > 0 and start <= runs[-1][1]:
+                last = runs[-1]
+                runs[-1] = (last[0], max(last[1], start + size), last[2])
+            else:
+                runs.append((start, start + size, 0))
+        starts = []
+        for i, (start, end, _) in enumerate(runs):
+            runs[i] = (start, end, out_f.tell())
+            starts.append(start)
+            self._copy(out_f, start, end - start)
+
+        def new_position(old):
+            run = runs[bisect.bisect_right(starts, old) - 1]
+            return run[2] + old - run[0]
+
+        fragment_index = {}
+        fragment_table = []
+        for old_index in sorted(fragments):
+            start, size = fragments[old_index]
+            fragment_index[old_index] = len(fragment_table)
+            fragment_table.append((new_position(start), size))
+
+        for node in nodes:
+            inode = node.inode
+            if inode.type != squashfs.FILE:
+                continue
+            if node.source is not None:
+                node.written = self._write_file(out_f, node)
+                continue
+            start = out_f.tell()
+            if any(s & ~squashfs.DATA_UNCOMPRESSED for s in inode.block_sizes):
+                start = new_position(inode.start)
+            fragment = inode.fragment
+            if fragment != squashfs.NO_FRAGMENT:
+                fragment = fragment_index[fragment]
+            node.written = inode._replace(start=start, fragment=fragment)
+        return fragment_table
+
+    def _write_file(self, out_f, node):
+        """ Compress and write a new file, without fragments """
+        sb = self.image.superblock
+        start = out_f.tell()
+        size = 0
+        block_sizes = []
+        with open(node.source, 'rb') as in_f:
+            for data in iter(lambda: in_f.read(sb.block_size), b''):
+                size += len(data)
+                compressed = None
+                if not sb.flags & UNCOMPRESSED_DATA:
+                    compressed = self.compress(data)
+                if compressed is None or len(compressed) >= len(data):
+                    block_sizes.append(
+                        len(data) | squashfs.DATA_UNCOMPRESSED)
+                    out_f.write(data)
+                else:
+                    block_sizes.append(len(compressed))
+                    out_f.write(compressed)
+        return node.inode._replace(start=start, size=size,
+                                   block_sizes=tuple(block_sizes))
+
+    def _write_inode(self, inodes, node, parent_number=0, listing=None):
+        """ Write the inode of a node, and return its reference
+        :param listing: position and size of the listing, for directories
+        """
+        inode = node.written
+        ref = inodes.reference()
+        itype = inode.type
+        if itype == squashfs.DIR:
+            (start, offset), size = listing
+            if size > 0xffff:
+                itype = squashfs.EXT_DIR
+                body = struct.pack('<IIIIHHI', node.nlink, size, start,
+                                   parent_number, 0, offset, NO_XATTR)
+            else:
+                body = struct.pack('<IIHHI', start, node.nlink, size, offset,
+                                   parent_number)
+        elif itype == squashfs.FILE:
+            if inode.start > 0xffffffff or inode.size > 0xffffffff or \
+                    node.nlink > 1:
+                itype = squashfs.EXT_FILE
+                body = struct.pack('<QQQIIII', inode.start, inode.size, 0,
+                                   node.nlink, inode.fragment, inode.offset,
+                                   NO_XATTR)
+            else:
+                body = struct.pack('<IIII', inode.start, inode.fragment,
+                                   inode.offset, inode.size)
+            body += struct.pack('<{}I'.format(len(inode.block_sizes)),
+                                *inode.block_sizes)
+        elif itype == squashfs.SYMLINK:
+            body = struct.pack('<II', node.nlink, len(inode.target)) + \
+                inode.target
+        elif itype in (squashfs.BLKDEV, squashfs.CHRDEV):
+            body = struct.pack('<II', node.nlink, inode.rdev)
+        else:
+            body = struct.pack('<I', node.nlink)
+        inodes.write(struct.pack('<HHHHII', itype, inode.mode, inode.uid,
+                                 inode.gid, inode.mtime, node.number) + body)
+        node.ref = ref
+        return ref
+
+    def _write_dir(self, inodes, dirs, node, parent_number):
+        """ Write the inodes of the tree under a directory node, then the
+        listing and the inode of the directory. Returns its reference.
+        """
+        entries = []
+        for name in sorted(node.children):
+            child = node.children[name]
+            if child.inode.type == squashfs.DIR:
+                self._write_dir(inodes, dirs, child, node.number)
+            elif child.ref is None:
+                self._write_inode(inodes, child)
+            entries.append((name, child))
+
+        ref = dirs.reference()
+        listing = bytearray()
+        i = 0
+        while i < len(entries):
+            # Entries after a header share the inode block and have inode
+            # numbers close to the one in the header
+            block = entries[i][1].ref >> 16
+            base = entries[i][1].number
+            group = []
+            while i < len(entries) and len(group) < DIR_HEADER_ENTRIES:
+                child = entries[i][1]
+                if child.ref >> 16 != block or \
+                        not -0x8000 <= child.number - base <= 0x7fff:
+                    break
+                group.append(entries[i])
+                i += 1
+            listing += struct.pack('<III', len(group) - 1, block, base)
+            for name, child in group:
+                listing += struct.pack('<HhHH', child.ref & 0xffff,
+                                       child.number - base, child.inode.type,
+                                       len(name) - 1) + name
+        dirs.write(bytes(listing))
+        # The size includes 3 bytes for the implicit . and .. entries
+        return self._write_inode(
+            inodes, node, parent_number,
+            ((ref >> 16, ref & 0xffff), len(listing) + 3))
+
+    def _write_table(self, out_f, table):
+        """ Write a table of metadata blocks followed by the index with
+        their positions. Returns the position of the index.
+        """
+        start = out_f.tell()
+        out_f.write(table.finish())
+        index = out_f.tell()
+        out_f.write(struct.pack('<{}Q'.format(len(table.block_starts)),
+                                *(start + s for s in table.block_starts)))
+        return index
+
+    def write(self, out_f) -> None:
+        """ Write the new image to a file opened for writing in binary mode,
+        from its start.
+        """
+        sb = self.image.superblock
+        nodes = self._nodes()
+        for number, node in enumerate(nodes, 1):
+            node.number = number
+
+        out_f.write(bytes(squashfs.SUPERBLOCK.size))
+        if self.options is not None:
+            out_f.write(self.options)
+        fragment_table = self._write_data(out_f, nodes)
+
+        uncompressed_inodes = bool(sb.flags & UNCOMPRESSED_INODES)
+        inodes = _MetadataWriter(self.compress, uncompressed_inodes)
+        dirs = _MetadataWriter(self.compress, uncompressed_inodes)
+        # The parent of the root is one past the last inode, like mksquashfs
+        root_ref = self._write_dir(inodes, dirs, self.root, len(nodes) + 1)
+        inode_table_start = out_f.tell()
+        out_f.write(inodes.finish())
+        directory_table_start = out_f.tell()
+        out_f.write(dirs.finish())
+
+        fragment_table_start = INVALID_TABLE
+        if len(fragment_table) > 0:
+            fragments = _MetadataWriter(
+                self.compress, bool(sb.flags & UNCOMPRESSED_FRAGMENTS))
+            for start, size in fragment_table:
+                fragments.write(struct.pack('<QII', start, size, 0))
+            fragment_table_start = self._write_table(out_f, fragments)
+
+        export_table_start = INVALID_TABLE
+        if sb.flags & EXPORTABLE:
+            exports = _MetadataWriter(self.compress, uncompressed_inodes)
+            for node in nodes:
+                exports.write(struct.pack('<Q', node.ref))
+            export_table_start = self._write_table(out_f, exports)
+
+        ids = _MetadataWriter(self.compress,
+                              bool(sb.flags & UNCOMPRESSED_IDS))
+        id_list = self.image.read_ids()
+        ids.write(struct.pack('<{}I'.format(len(id_list)), *id_list))
+        id_table_start = self._write_table(out_f, ids)
+
+        bytes_used = out_f.tell()
+        out_f.write(bytes(-bytes_used % PAD_SIZE))
+        out_f.seek(0)
+        out_f.write(squashfs.SUPERBLOCK.pack(
+            squashfs.MAGIC, len(nodes), self.time, sb.block_size,
+            len(fragment_table), sb.compression, sb.block_log, sb.flags,
+            len(id_list), 4, 0, root_ref, bytes_used, id_table_start,
+            INVALID_TABLE, inode_table_start, directory_table_start,
+            fragment_table_start, export_table_start))
+        out_f.seek(0, os.SEEK_END)
+
+
+def repack_file(image_path: str, dest_path: str,
+                changes: List[Tuple[Optional[str], str]]) -> None:
+    """ Write to dest_path a copy of a local image with some changes
+    :param changes: list of (source, path) pairs, source is the file to
+                    copy to path in the image, or None to remove path
+    """
+    with squashfs.SquashFS.open(image_path) as image:
+        repack = Repack(image)
+        for source, path in changes:
+            if source is None:
+                repack.remove(path)
+            else:
+                repack.replace(path, source)
+        with open(dest_path, 'wb') as out_f:
+            repack.write(out_f)
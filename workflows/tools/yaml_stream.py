@@ -0,0 +1,260 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Streaming rewrite of snapcraft manifests at the YAML event level. Events
+# from the libyaml parser go to the libyaml emitter, except for the items
+# of parts.*.stage-packages that are filtered out. Scalars are normalized on
+# the way so the output is byte-identical to loading the file with
+# yaml_utils.load_yaml_file() and writing it with yaml_utils.dump():
+#   - str scalars get the style chosen by yaml_utils' str presenter
+#   - other scalars are constructed and represented again, so 'yes' becomes
+#     'true', '0x10' becomes '16' and so on
+#   - tags and implicit flags are set as the serializer would
+# Memory use depends on the nesting depth and on the keys of the mappings
+# being read, not on the size of the document.
+#
+# Documents using features that would need the full object graph, like
+# anchors, aliases, merge keys, repeated or complex keys and unknown tags,
+# raise StreamingNotSupported, and so do manifests the full path would fail
+# on. The caller must then discard the output and use the full load and
+# dump path instead.
+
+from typing import Callable, TextIO
+
+import yaml
+
+from tools import yaml_utils
+
+STR_TAG = 'tag:yaml.org,2002:str'
+SEQ_TAG = 'tag:yaml.org,2002:seq'
+MAP_TAG = 'tag:yaml.org,2002:map'
+VALUE_TAG = 'tag:yaml.org,2002:value'
+# Scalar tags that are constructed and represented again
+SAFE_SCALAR_TAGS = {
+    'tag:yaml.org,2002:null',
+    'tag:yaml.org,2002:bool',
+    'tag:yaml.org,2002:int',
+    'tag:yaml.org,2002:float',
+    'tag:yaml.org,2002:binary',
+    'tag:yaml.org,2002:timestamp',
+}
+
+
+class StreamingNotSupported(Exception):
+    """The document needs the full load and dump path."""
+
+
+class _Normalizer():
+    """Produces the scalar events that yaml_utils.dump would emit."""
+
+    def __init__(self):
+        self.resolver = yaml.resolver.Resolver()
+        self.constructor = yaml.constructor.SafeConstructor()
+        self.representer = yaml.representer.SafeRepresenter(
+            default_flow_style=False)
+
+    def _resolve_plain(self, value):
+        return self.resolver.resolve(yaml.ScalarNode, value, (True, False))
+
+    def _scalar_event(self, tag, value, style, plain_implicit=None):
+        # As in Serializer.serialize_node. Resolving a non-plain scalar
+        # always gives str.
+        if plain_implicit is None:
+            plain_implicit = tag == self._resolve_plain(value)
+        implicit = (plain_implicit, tag == STR_TAG)
+        return yaml.ScalarEvent(None, tag, implicit, value, style=style)
+
+    def scalar(self, event, is_key=False):
+        """Return the loaded value and the event to emit for a scalar."""
+        tag = event.tag
+        # Whether the scalar is plain and resolves to tag
+        plain_implicit = None
+        if tag is None or tag == '!':
+            tag = self.resolver.resolve(yaml.ScalarNode, event.value,
+                                        event.implicit)
+            if event.implicit[0]:
+                plain_implicit = True
+        # '=' keys are loaded as strings, see SafeConstructor.flatten_mapping
+        if tag == VALUE_TAG and is_key:
+            tag = STR_TAG
+            plain_implicit = None
+        if tag == STR_TAG:
+            value = event.value
+            # As in yaml_utils._str_presenter
+            style = '|' if len(value.splitlines()) > 1 else None
+            return value, self._scalar_event(STR_TAG, value, style,
+                                             plain_implicit)
+        if tag not in SAFE_SCALAR_TAGS:
+            raise StreamingNotSupported('tag ' + tag)
+
+        self.constructor.constructed_objects = {}
+        self.representer.represented_objects = {}
+        try:
+            value = self.constructor.construct_object(
+                yaml.ScalarNode(tag, event.value, style=event.style))
+            node = self.representer.represent_data(value)
+        except yaml.YAMLError as ex:
+            raise StreamingNotSupported(str(ex))
+        return value, self._scalar_event(node.tag, node.value, node.style)
+
+
+# Kinds of collections with respect to the manifest structure
+_OTHER = 0
+_PARTS = 1
+_PART = 2
+_STAGE_PACKAGES = 3
+_PACKAGE = 4
+
+
+class _Frame():
+    __slots__ = ['is_map', 'kind', 'expect_key', 'key', 'keys']
+
+    def __init__(self, is_map, kind):
+        self.is_map = is_map
+        self.kind = kind
+        self.expect_key = True
+        self.key = None
+        self.keys = set()
+
+
+def _check_collection_tag(event, default_tag):
+    if event.anchor is not None:
+        raise StreamingNotSupported('anchor ' + event.anchor)
+    if event.tag not in (None, '!', default_tag):
+        raise StreamingNotSupported('tag ' + event.tag)
+
+
+def _child_kind(stack):
+    """Return the kind of the value that comes next in the top frame."""
+    if len(stack) == 0:
+        return _OTHER
+    frame = stack[-1]
+    if not frame.is_map:
+        if frame.kind == _STAGE_PACKAGES:
+            return _PACKAGE
+        return _OTHER
+    if frame.expect_key:
+        raise StreamingNotSupported('complex key')
+    if frame.kind == _PARTS:
+        return _PART
+    if frame.kind == _PART and frame.key == 'stage-packages':
+        return _STAGE_PACKAGES
+    if len(stack) == 1 and frame.key == 'parts':
+        return _PARTS
+    return _OTHER
+
+
+def filter_stage_packages(events, remove: Callable[[str], bool]):
+    """Rewrite the events of a manifest, dropping stage-packages items.
+    :param events: iterable of parser events
+    :param remove: called with package names, returns whether to remove it
+    :return: generator of events for the emitter
+    """
+    norm = _Normalizer()
+    stack = []
+    documents = 0
+
+    for event in events:
+        if isinstance(event, yaml.ScalarEvent):
+            if event.anchor is not None:
+                raise StreamingNotSupported('anchor ' + event.anchor)
+            if len(stack) == 0:
+                raise StreamingNotSupported('document is a scalar')
+            frame = stack[-1]
+            if frame.is_map and frame.expect_key:
+                value, out_event = norm.scalar(event, True)
+                try:
+                    if value in frame.keys:
+                        raise StreamingNotSupported('repeated key')
+                    frame.keys.add(value)
+                except TypeError:
+                    raise StreamingNotSupported('unhashable key')
+                frame.key = value
+                frame.expect_key = False
+                yield out_event
+                continue
+
+            kind = _child_kind(stack)
+            if kind in (_PARTS, _PART, _STAGE_PACKAGES):
+                # The full path fails if these are not collections
+                raise StreamingNotSupported('unexpected scalar')
+            value, out_event = norm.scalar(event)
+            if kind == _PACKAGE:
+                if not isinstance(value, str):
+                    raise StreamingNotSupported('stage package not a str')
+                # package_name=version
+                if remove(value.split('=')[0]):
+                    continue
+            frame.expect_key = True
+            yield out_event
+        elif isinstance(event, (yaml.SequenceEndEvent,
+                                yaml.MappingEndEvent)):
+            frame = stack.pop()
+            if frame.kind == _PART and 'stage-packages' not in frame.keys:
+                raise StreamingNotSupported('part without stage-packages')
+            if len(stack) > 0:
+                stack[-1].expect_key = True
+            elif 'parts' not in frame.keys:
+                raise StreamingNotSupported('no parts')
+            yield event.__class__()
+        elif isinstance(event, yaml.SequenceStartEvent):
+            _check_collection_tag(event, SEQ_TAG)
+            if len(stack) == 0:
+                raise StreamingNotSupported('document is a sequence')
+            kind = _child_kind(stack)
+            if kind in (_PARTS, _PART, _PACKAGE):
+                raise StreamingNotSupported('unexpected sequence')
+            stack.append(_Frame(False, kind))
+            yield yaml.SequenceStartEvent(None, SEQ_TAG, True,
+                                          flow_style=False)
+        elif isinstance(event, yaml.MappingStartEvent):
+            _check_collection_tag(event, MAP_TAG)
+            kind = _child_kind(stack)
+            if kind in (_STAGE_PACKAGES, _PACKAGE):
+                raise StreamingNotSupported('unexpected mapping')
+            stack.append(_Frame(True, kind))
+            yield yaml.MappingStartEvent(None, MAP_TAG, True,
+                                         flow_style=False)
+        elif isinstance(event, yaml.AliasEvent):
+            raise StreamingNotSupported('alias ' + event.anchor)
+        elif isinstance(event, yaml.DocumentStartEvent):
+            documents += 1
+            if documents > 1:
+                raise StreamingNotSupported('more than one document')
+            yield yaml.DocumentStartEvent(explicit=None, version=None,
+                                          tags=None)
+        elif isinstance(event, yaml.DocumentEndEvent):
+            yield yaml.DocumentEndEvent(explicit=None)
+        elif isinstance(event, yaml.StreamStartEvent):
+            yield yaml.StreamStartEvent(encoding=None)
+        elif isinstance(event, yaml.StreamEndEvent):
+            if documents != 1:
+                raise StreamingNotSupported('{} documents'.format(documents))
+            yield yaml.StreamEndEvent()
+        else:
+            raise StreamingNotSupported('unknown event ' + str(event))
+
+
+def rewrite_manifest(manifest_path: str, out_stream: TextIO,
+                     remove: Callable[[str], bool]) -> None:
+    """Write manifest_path to out_stream removing stage-packages.
+    Raises StreamingNotSupported if the full load and dump path is needed,
+    in which case out_stream can have partial output.
+    """
+    with open(manifest_path, 'rb') as manifest_f:
+        events = yaml.parse(manifest_f, Loader=yaml_utils.CSafeLoader)
+        yaml.emit(filter_stage_packages(events, remove), out_stream,
+                  Dumper=yaml_utils._SafeOrderedDumper, allow_unicode=True)
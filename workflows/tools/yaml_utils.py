@@ -29,8 +29,11 @@ except ImportError:
     raise RuntimeError("Snapcraft requires PyYAML to be built with libyaml bindings")
 
 
-def load_yaml_file(yaml_file_path: str) -> collections.OrderedDict:
-    """Load YAML."""
+def load_yaml_file(yaml_file_path: str, *, fast: bool = False) -> Dict[str, Any]:
+    """Load YAML.
+
+    :param fast: build plain dicts instead of OrderedDicts
+    """
     with open(yaml_file_path, "rb") as fp:
         bs = fp.read(2)
 
@@ -40,25 +43,40 @@ def load_yaml_file(yaml_file_path: str) -> collections.OrderedDict:
         encoding = "utf-8"
 
     with open(yaml_file_path, encoding=encoding) as fp:  # type: ignore
-        yaml_contents = load(fp)  # type: ignore
+        yaml_contents = load(fp, fast=fast)  # type: ignore
 
     if yaml_contents is None:
-        yaml_contents = collections.OrderedDict()
+        yaml_contents = {} if fast else collections.OrderedDict()
 
     return yaml_contents
 
 
-def load(stream: TextIO) -> Any:
-    """Safely load YAML in ordered manner."""
-    return yaml.load(stream, Loader=_SafeOrderedLoader)
+def load(stream: TextIO, *, fast: bool = False) -> Any:
+    """Safely load YAML in ordered manner.
+
+    :param fast: build plain dicts, which keep insertion order too, instead of
+                 OrderedDicts. This is faster and uses less memory.
+    """
+    return yaml.load(stream, Loader=_FastSafeLoader if fast else _SafeOrderedLoader)
 
 
 def dump(
-    data: Union[Dict[str, Any], yaml.YAMLObject], *, stream: Optional[TextIO] = None
+    data: Union[Dict[str, Any], yaml.YAMLObject],
+    *,
+    stream: Optional[TextIO] = None,
+    fast: bool = False
 ) -> Optional[str]:
-    """Safely dump YAML in ordered manner."""
+    """Safely dump YAML in ordered manner.
+
+    :param fast: use a dumper that keeps the order of plain dicts too and has
+                 cheaper representers. The output is the same.
+    """
     return yaml.dump(
-        data, stream, _SafeOrderedDumper, default_flow_style=False, allow_unicode=True
+        data,
+        stream,
+        _FastSafeDumper if fast else _SafeOrderedDumper,
+        default_flow_style=False,
+        allow_unicode=True,
     )
 
 
@@ -77,8 +95,51 @@ class _SafeOrderedDumper(CSafeDumper):
         self.add_representer(collections.OrderedDict, _dict_representer)
 
 
+class _FastResolver:
+    def resolve(self, kind, value, implicit):
+        # Same as BaseResolver.resolve() for scalars, without building the
+        # list of candidate resolvers on each call. Scalars that are not
+        # plain are always str.
+        if kind is yaml.ScalarNode and not self.yaml_path_resolvers:
+            if implicit[0]:
+                resolvers = self.yaml_implicit_resolvers
+                for tag, regexp in resolvers.get(value[:1], ()):
+                    if regexp.match(value):
+                        return tag
+                for tag, regexp in resolvers.get(None, ()):
+                    if regexp.match(value):
+                        return tag
+            return self.DEFAULT_SCALAR_TAG
+        return super().resolve(kind, value, implicit)
+
+
+# SafeConstructor already builds dicts, with merge tags support
+class _FastSafeLoader(_FastResolver, CSafeLoader):
+    def construct_object(self, node, deep=False):
+        # Strings are immutable, so there is no need to keep track of them
+        if type(node) is yaml.ScalarNode and node.tag == "tag:yaml.org,2002:str":
+            return node.value
+        return super().construct_object(node, deep)
+
+
+# Subclassed to get the representers of the SnapcraftYAMLObjects too
+class _FastSafeDumper(_FastResolver, _SafeOrderedDumper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.add_representer(str, _fast_str_presenter)
+        self.add_representer(dict, _dict_representer)
+        self.add_representer(collections.OrderedDict, _dict_representer)
+
+    def represent_data(self, data):
+        # Most of the data are strings, which are never aliased, so skip the
+        # generic lookup of representers for them.
+        if type(data) is str:
+            return _fast_str_presenter(self, data)
+        return super().represent_data(data)
+
+
 class SnapcraftYAMLObject(yaml.YAMLObject):
-    yaml_loader = _SafeOrderedLoader
+    yaml_loader = [_SafeOrderedLoader, _FastSafeLoader]
     yaml_dumper = _SafeOrderedDumper
 
     # We could implement a from_yaml class method here which would force loading to
@@ -112,6 +173,15 @@ def _str_presenter(dumper, data):
     return dumper.represent_scalar("tag:yaml.org,2002:str", data)
 
 
+def _fast_str_presenter(dumper, data):
+    # Same as _str_presenter. Strings without line breaks, which are most of
+    # them, are printable, so we avoid splitlines() for them. Strings are
+    # never aliased, so we can build the node directly.
+    if not data.isprintable() and len(data.splitlines()) > 1:
+        return yaml.ScalarNode("tag:yaml.org,2002:str", data, style="|")
+    return yaml.ScalarNode("tag:yaml.org,2002:str", data)
+
+
 class OctInt(SnapcraftYAMLObject):
     """An int represented in octal form."""
 
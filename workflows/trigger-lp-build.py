@@ -15,27 +15,55 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import asyncio
+import json
 import os
 import re
 import sys
 import time
 import random
 import string
-import tempfile
-import urllib3
-import zlib
 
-from datetime import datetime
+from datetime import datetime, timezone
 
 from argparse import ArgumentParser
 
 import se_utils
+from se_utils import build_log
+from se_utils import lp_client
+from se_utils import transport
+
+
+# Keys accepted in --spec arguments
+SPEC_KEYS = ['snap', 'git-repo', 'git-repo-branch', 'base', 'architectures']
+
+# File in the results directory with the timeline of the builds
+TIMINGS_FILE = 'build-timings.json'
+# Build phases in the timings report, with the events that delimit them
+BUILD_PHASES = [
+    ('request', 'request_start', 'requested'),
+    ('queue', 'requested', 'started'),
+    ('build', 'started', 'built'),
+    ('upload', 'built', 'finished'),
+    ('download', 'download_start', 'download_end'),
+    ('total', 'request_start', 'download_end'),
+]
+# Statuses reported by getBuildSummaries, mapped to the event they mark. The
+# build might finish between two polls, so final states mark the end of the
+# build too if no upload was seen.
+STATUS_EVENTS = {
+    'BUILDING': 'started',
+    'UPLOADING': 'built',
+    'GATHERING': 'built',
+    'FULLYBUILT': 'built',
+    'FAILEDTOBUILD': 'built',
+}
 
 
 def parseargs(argv):
     parser = ArgumentParser(prog='trigger-lp-build.py',
                             description="Build a specific snap on launchpad")
-    parser.add_argument('-s', '--snap', required=True,
+    parser.add_argument('-s', '--snap',
                         help="Name of the snap to build")
     parser.add_argument('-p', '--publish', action='store_true',
                         help="Trigger a publish build instead of a daily "
@@ -54,11 +82,30 @@ def parseargs(argv):
                         help="Specify where results should be saved")
     parser.add_argument('--base',
                         help="Set base for the build")
+    parser.add_argument('--spec', action='append', default=[],
+                        help="Build several snaps in one go. Each spec is a "
+                        "';' separated list of key=value pairs, with keys " +
+                        ', '.join(SPEC_KEYS) + ". Missing keys are taken "
+                        "from the other options. Results are downloaded to "
+                        "<results-dir>/<snap>. Can be used more than once")
     parser.add_argument('--snapcraft-channel',
                         help="Snapcraft channel to install from",
                         default="")
+    parser.add_argument('--build-log', choices=build_log.LOG_MODES,
+                        default=build_log.DEFAULT_LOG_MODE,
+                        help="How to show logs of ephemeral builds: "
+                        "'errors' prints context around failures and the "
+                        "end of the log, 'tail' prints the last lines and "
+                        "'full' saves the whole log in the results directory "
+                        "and prints the last lines (default: %(default)s)")
+    parser.add_argument('--build-log-lines', type=int,
+                        default=build_log.DEFAULT_LOG_LINES,
+                        help="Number of lines printed by the 'tail' and "
+                        "'full' build log modes (default: %(default)s)")
 
     args = vars(parser.parse_args(argv))
+    if args['snap'] is None and len(args['spec']) == 0:
+        parser.error("either --snap or --spec must be specified")
     return args
 
 
@@ -77,108 +124,531 @@ def get_series(base):
         return "xenial"
 
 
-def main(argv):
-    args = parseargs(argv)
-
-    results_dir = os.path.join(os.getcwd(), "results")
-    url_pool = urllib3.PoolManager()
-
-    if 'results_dir' in args:
-        results_dir = args['results_dir']
-
-    base = 'core'
-    if 'base' in args:
-        base = args['base']
-
-    series = get_series(base)
-
-    lp_app = "launchpad-trigger"
-    lp_env = "production"
-    creds = os.environ["LP_CREDENTIALS"]
-    if creds == "":
-        print("ERROR: LP_CREDENTIALS is empty")
-        sys.exit(1)
-    with tempfile.NamedTemporaryFile() as credential_store_path:
-        credential_store_path.write(creds.encode("utf-8"))
-        credential_store_path.flush()
-        launchpad = se_utils.get_launchpad(None, credential_store_path.name,
-                                           lp_app, lp_env)
-
-    team = launchpad.people['snappy-hwe-team']
-    ubuntu = launchpad.distributions['ubuntu']
-    release = ubuntu.getSeries(name_or_version=series)
-    primary_archive = ubuntu.getArchive(name='primary')
-
+def get_snapcraft_channel(series):
+    if series == "xenial":
+        return "4.x/stable"
+    elif series == "bionic":
+        # 6.0 onwards does not support i386, that we publish for core18
+        return "5.x/stable"
+    elif series == "resolute":
+        # XXX temporary workaround!! remove as soon as a snapcraft with
+        # full support for core26 is released.
+        return "latest/edge/early-core26"
+    else:
+        return "latest/stable"
+
+
+def parse_spec(spec, args):
+    """ Return the build options for a --spec argument.
+    Options not present in the spec are taken from the command line ones.
+    :param spec: string with ';' separated key=value pairs
+    :param args: parsed command line arguments
+    """
+    opts = {}
+    for key in SPEC_KEYS:
+        opts[key] = args[key.replace('-', '_')]
+    for item in spec.split(';'):
+        if item.strip() == '':
+            continue
+        key, sep, value = item.partition('=')
+        key = key.strip()
+        if sep == '' or key not in SPEC_KEYS:
+            raise ValueError("invalid item '{}' in spec '{}'".format(
+                item, spec))
+        opts[key] = value.strip()
+    if not opts['snap']:
+        raise ValueError("no snap name in spec '{}'".format(spec))
+    return opts
+
+
+def _timestamp(when):
+    return datetime.fromtimestamp(when, timezone.utc).isoformat()
+
+
+class BuildTimeline():
+    """ Timestamps of the events in the life of a build.
+    Events come from local timestamps around our own calls, from the status
+    changes seen while polling (so they are as precise as the polling
+    interval) and, when available, from the dates stored by Launchpad.
+    """
+
+    def __init__(self, arch):
+        self.arch = arch
+        self.events = {}
+        self.statuses = {}
+
+    def mark(self, event, when=None):
+        if when is None:
+            when = time.time()
+        self.events.setdefault(event, when)
+
+    def saw_status(self, status, when=None):
+        if when is None:
+            when = time.time()
+        if status in self.statuses:
+            return
+        self.statuses[status] = when
+        if status in STATUS_EVENTS:
+            self.mark(STATUS_EVENTS[status], when)
+
+    def set_lp_dates(self, build):
+        """ Use the dates recorded by Launchpad, which are more precise than
+        the polled ones.
+        """
+        for event, attr in (('started', 'date_started'),
+                            ('built', 'datebuilt')):
+            date = build.get(attr)
+            if date is not None:
+                self.events[event] = datetime.fromisoformat(date).timestamp()
+
+    def phases(self):
+        durations = {}
+        for phase, start, end in BUILD_PHASES:
+            if start in self.events and end in self.events:
+                durations[phase] = round(
+                    self.events[end] - self.events[start], 3)
+        return durations
+
+    def to_dict(self):
+        return {
+            'arch': self.arch,
+            'events': {e: _timestamp(w) for e, w in
+                       sorted(self.events.items(), key=lambda i: i[1])},
+            'statuses': {s: _timestamp(w) for s, w in
+                         sorted(self.statuses.items(), key=lambda i: i[1])},
+            'phases': self.phases(),
+        }
+
+
+def phase_stats(timelines):
+    """ Return count, min, mean and max of each phase for the timelines """
+    values = {}
+    for timeline in timelines:
+        for phase, duration in timeline.phases().items():
+            values.setdefault(phase, []).append(duration)
+    stats = {}
+    for phase, _, _ in BUILD_PHASES:
+        if phase not in values:
+            continue
+        durations = values[phase]
+        stats[phase] = {
+            'count': len(durations),
+            'min': min(durations),
+            'mean': round(sum(durations)/len(durations), 3),
+            'max': max(durations),
+        }
+    return stats
+
+
+class SnapBuildJob():
+    """ Builds of one snap recipe and their state while polling """
+
+    def __init__(self, snap_name, git_repo, git_repo_branch, base,
+                 architectures, results_dir):
+        self.snap_name = snap_name
+        self.git_repo = git_repo
+        self.git_repo_branch = git_repo_branch
+        self.base = base
+        self.architectures = architectures
+        self.results_dir = results_dir
+        self.series = get_series(base)
+        self.snap = None
+        self.ephemeral_build = False
+        self.arches = []
+        # build id -> architecture and self link
+        self.build_arches = {}
+        self.build_urls = {}
+        self.pending = []
+        self.successful = []
+        self.failures = []
+        self.cancelled = []
+        self.not_downloaded = []
+        self.timelines = {}
+        self.setup_time = None
+
+    @classmethod
+    def from_options(cls, opts, results_dir):
+        return cls(opts['snap'], opts['git-repo'], opts['git-repo-branch'],
+                   opts['base'], opts['architectures'], results_dir)
+
+    def status(self):
+        if self.snap is None or len(self.failures):
+            return 'failed'
+        if len(self.successful) == 0:
+            return 'cancelled'
+        return 'success'
+
+
+async def setup_recipe(launchpad, team, release, job):
+    """ Get the static snap recipe for the job or create an ephemeral one.
+    Returns False if the builds cannot be requested.
+    """
     snap = None
-    ephemeral_build = False
-    repo_branch = args['git_repo_branch']
+    repo_branch = job.git_repo_branch
     if repo_branch is not None and \
        (repo_branch.startswith('snap-') or repo_branch.startswith('latest')):
         # We remove the temporal branch suffix
         rec_suffix = re.sub('_.*', '', repo_branch)
-        build_name = "%s-%s" % (args['snap'], rec_suffix)
-        print('Getting snap recipe {} from {} team'.format(build_name, team))
-        snap = launchpad.snaps.getByName(name=build_name, owner=team)
+        build_name = "%s-%s" % (job.snap_name, rec_suffix)
+        print('Getting snap recipe {} from {} team'.format(
+            build_name, team['name']))
+        snap = await launchpad.named_get('+snaps', 'getByName',
+                                         name=build_name,
+                                         owner=team['self_link'])
         # The name of the branch varies in each call
-        snap.git_path = 'refs/heads/' + repo_branch
         # Note that snap.git_repository_url is read-only, so we need to make
         # sure that the snap recipe already points to the right repo, we cannot
         # set it here.
-        snap.lp_save()
+        await launchpad.patch(snap['self_link'],
+                              {'git_path': 'refs/heads/' + repo_branch})
     else:
-        ephemeral_build = True
-        if args['git_repo'] is None or repo_branch is None:
+        if job.git_repo is None or repo_branch is None:
             print("ERROR: No git repository or a branch supplied")
-            sys.exit(1)
+            return False
         snap_arches = []
-        if 'architectures' in args and args['architectures'] is not None:
-            snap_arches = args["architectures"].split(",")
+        if job.architectures is not None:
+            snap_arches = job.architectures.split(",")
 
         if len(snap_arches) == 0:
             print("WARNING: No architectures to build specified. "
                   "Will only build for amd64.")
             snap_arches = ["amd64"]
 
-        processors = []
-        for arch in snap_arches:
-            try:
-                p = launchpad.processors.getByName(name=arch)
-                processors.append(p.self_link)
-            except Exception as ex:
+        processors = await asyncio.gather(
+            *[launchpad.named_get('+processors', 'getByName', name=arch)
+              for arch in snap_arches], return_exceptions=True)
+        for arch, p in zip(snap_arches, processors):
+            if isinstance(p, Exception):
                 print("ERROR: Failed to find processor for '{}' "
-                      "architecture: {}".format(arch, ex))
-                sys.exit(1)
+                      "architecture: {}".format(arch, p))
+                return False
 
-        build_name = 'ci-%s-%s' % (args["snap"],
+        build_name = 'ci-%s-%s' % (job.snap_name,
                                    ''.join(random.choice(
                                        string.ascii_lowercase +
                                        string.digits) for _ in range(16)))
-        print('Creating ephemeral snap recipe for "%s" series' % release)
-        snap = launchpad.snaps.new(name=build_name,
-                                   processors=processors,
-                                   auto_build=False, distro_series=release,
-                                   git_repository_url=args['git_repo'],
-                                   git_path='%s' % repo_branch,
-                                   owner=team)
+        print('Creating ephemeral snap recipe for "%s" series' %
+              release['name'])
+        snap = await launchpad.create_snap(
+            name=build_name,
+            processors=[p['self_link'] for p in processors],
+            auto_build=False, distro_series=release['self_link'],
+            git_repository_url=job.git_repo,
+            git_path='%s' % repo_branch,
+            owner=team['self_link'])
+        job.ephemeral_build = True
 
     if snap is None:
         print("ERROR: Failed to create snap build on launchpad")
+        return False
+    job.snap = snap
 
     # Not every snap is build against all arches.
-    arches = [processor.name for processor in snap.processors]
-    if not ephemeral_build and args['architectures'] is not None:
-        wanted_arches = args["architectures"].split(",")
+    arches = [processor['name'] for processor in
+              await launchpad.collection(snap['processors_collection_link'])]
+    if not job.ephemeral_build and job.architectures is not None:
+        wanted_arches = job.architectures.split(",")
         possible_arches = []
         for arch in wanted_arches:
             if arch not in arches:
                 print("WARNING: Can't build snap for architecture {} as it is"
-                      "not enabled in the build job".format(args["snap"]))
+                      "not enabled in the build job".format(job.snap_name))
                 continue
             possible_arches.append(arch)
         arches = possible_arches
 
     if len(arches) == 0:
         print("ERROR: No architectures available to build for")
+        return False
+    job.arches = arches
+    return True
+
+
+async def request_build(launchpad, job, release, primary_archive,
+                        snapcraft_channel, build_arch):
+    arch = await launchpad.named_get(release['self_link'],
+                                     'getDistroArchSeries',
+                                     archtag=build_arch)
+    timeline = BuildTimeline(build_arch)
+    timeline.mark('request_start')
+    request = await launchpad.request_build(
+        job.snap, archive=primary_archive['self_link'],
+        channels={"snapcraft": snapcraft_channel},
+        distro_arch_series=arch['self_link'],
+        pocket='Updates',
+        snap_base='/+snap-bases/'+job.base)
+    build_id = request['self_link'].rsplit('/', 1)[-1]
+    timeline.mark('requested')
+    job.timelines[build_id] = timeline
+    job.pending.append(build_id)
+    job.build_arches[build_id] = build_arch
+    job.build_urls[build_id] = request['self_link']
+    print("Arch: {} is building under: {}".format(build_arch,
+                                                  request['self_link']))
+
+
+async def request_builds(launchpad, job, release, primary_archive,
+                         snapcraft_channel):
+    # sometimes we see error such as "u'Unknown architecture lpia for ubuntu
+    # xenial'" and in order to workaround let's validate the arches agains set
+    # of valid architectures that the snap can choose from
+    valid_arches = ['armhf', 'i386', 'amd64', 'arm64',
+                    's390x', 'powerpc', 'ppc64el', 'riscv64']
+    requests = []
+    for build_arch in job.arches:
+        if build_arch not in valid_arches:
+            print("WARNING: Can't build snap for architecture {} as it is "
+                  "not enabled in the build job".format(job.snap_name))
+            continue
+        requests.append(request_build(launchpad, job, release,
+                                      primary_archive, snapcraft_channel,
+                                      build_arch))
+    await asyncio.gather(*requests)
+
+
+async def poll_job(launchpad, job):
+    try:
+        response = await launchpad.get_build_summaries(job.snap, job.pending)
+    except Exception as ex:
+        print("Could not get response for {} "
+              "(was there an LP timeout?): {}".format(
+                  ', '.join(job.pending), ex))
+        return
+    for build in job.pending[:]:
+        if build not in response["builds"]:
+            continue
+        status = response["builds"][build]["status"]
+        job.timelines[build].saw_status(status)
+        if status in ["FULLYBUILT", "FAILEDTOBUILD", "CANCELLED"]:
+            job.timelines[build].mark('finished')
+        if status == "FULLYBUILT":
+            job.successful.append(build)
+            job.pending.remove(build)
+        elif status == "FAILEDTOBUILD":
+            job.failures.append(build)
+            job.pending.remove(build)
+        elif status == "CANCELLED":
+            print("INFO: {} snap build was canceled for id: {}".format(
+                job.snap_name, build))
+            job.cancelled.append(build)
+            job.pending.remove(build)
+
+
+async def poll_builds(launchpad, jobs):
+    """ Wait until all builds of all jobs have finished """
+    while any(len(job.pending) for job in jobs):
+        await asyncio.gather(*[poll_job(launchpad, job) for job in jobs
+                               if len(job.pending)])
+        if any(len(job.pending) for job in jobs):
+            await asyncio.sleep(60)
+
+
+async def get_build_summaries(launchpad, job, builds):
+    """ Return summaries of the builds, printing an error if we fail """
+    try:
+        response = await launchpad.get_build_summaries(job.snap, builds)
+    except Exception as ex:
+        print("Could not get build summaries for {} "
+              "(was there an LP timeout?): {}".format(', '.join(builds), ex))
+        return {}
+    return response["builds"]
+
+
+async def report_failures(launchpad, job, url_pool, args, stamp):
+    if len(job.failures) == 0:
+        return
+    summaries = await get_build_summaries(launchpad, job, job.failures)
+    for failure in job.failures:
+        if failure not in summaries:
+            print("Launchpad didn't returned us the snap build "
+                  "summary we ask it for!?")
+            continue
+
+        build_summary = summaries[failure]
+        arch = job.build_arches.get(failure, 'unknown')
+        buildlog = None
+        if 'build_log_url' in build_summary:
+            buildlog = build_summary['build_log_url']
+
+        if buildlog is None:
+            buildlog = 'not available'
+
+        print("INFO: {} snap {} build at {} failed for id: {} log: {}".
+              format(job.snap_name, arch, stamp, failure, buildlog))
+
+        # For ephermal builds we need to print out the log file as it will
+        # be gone after the launchpad build is removed.
+        if job.ephemeral_build and buildlog.startswith('http'):
+            build_log.show_build_log(url_pool, buildlog,
+                                     args['build_log'],
+                                     args['build_log_lines'],
+                                     job.results_dir)
+
+
+async def report_successes(launchpad, job, url_pool, args, stamp):
+    # Print build logs only if there were no failures, to avoid too much
+    # noise.
+    if len(job.failures) or len(job.successful) == 0:
+        return
+    summaries = await get_build_summaries(launchpad, job, job.successful)
+    for success in job.successful:
+        if success not in summaries:
+            continue
+        build_summary = summaries[success]
+        if 'build_log_url' in build_summary:
+            buildlog = build_summary['build_log_url']
+            print("INFO: {} snap build at {} successful "
+                  "for id: {} log: {}".
+                  format(job.snap_name, stamp, success, buildlog))
+            # Successful logs have no failures to look for, show just the
+            # end of them.
+            if job.ephemeral_build and buildlog is not None:
+                log_mode = args['build_log']
+                if log_mode == 'errors':
+                    log_mode = 'tail'
+                build_log.show_build_log(url_pool, buildlog, log_mode,
+                                         args['build_log_lines'],
+                                         job.results_dir)
+
+
+async def download_build(launchpad, job, build):
+    # attempt to download the file
+    job.timelines[build].mark('download_start')
+    downloaded = await se_utils.download_snap_build(
+        launchpad, job.build_urls[build], job.results_dir)
+    job.timelines[build].mark('download_end')
+    if not downloaded:
+        print("WARNING: Could not download snap build for id: {}".
+              format(build))
+        job.not_downloaded.append(build)
+
+
+async def load_build_dates(launchpad, job, build):
+    try:
+        job.timelines[build].set_lp_dates(
+            await launchpad.load(job.build_urls[build]))
+    except Exception as ex:
+        print("Could not get build dates for {} "
+              "(was there an LP timeout?): {}".format(build, ex))
+
+
+async def write_timings(launchpad, jobs, results_dir):
+    """ Write a JSON report with the timeline of all builds and statistics
+    per architecture and for all builds.
+    """
+    await asyncio.gather(*[load_build_dates(launchpad, job, build)
+                           for job in jobs for build in job.timelines])
+    report = {'snaps': {}}
+    per_arch = {}
+    for job in jobs:
+        builds = {}
+        for build, timeline in job.timelines.items():
+            builds[build] = timeline.to_dict()
+            per_arch.setdefault(timeline.arch, []).append(timeline)
+        report['snaps'][job.snap_name] = {
+            'recipe_setup': job.setup_time,
+            'builds': builds,
+            'per_arch': {arch: phase_stats(
+                [t for t in job.timelines.values() if t.arch == arch])
+                for arch in sorted(set(
+                    t.arch for t in job.timelines.values()))},
+        }
+    report['per_arch'] = {arch: phase_stats(timelines)
+                          for arch, timelines in sorted(per_arch.items())}
+    report['aggregate'] = phase_stats(
+        [t for job in jobs for t in job.timelines.values()])
+
+    os.makedirs(results_dir, exist_ok=True)
+    timings_path = os.path.join(results_dir, TIMINGS_FILE)
+    with open(timings_path, 'w') as timings_f:
+        json.dump(report, timings_f, indent=2)
+    print("Build timings written to {}".format(timings_path))
+
+
+async def setup_job(launchpad, team, release, job):
+    setup_start = time.time()
+    ok = await setup_recipe(launchpad, team, release, job)
+    job.setup_time = round(time.time() - setup_start, 3)
+    return ok
+
+
+def print_summary(jobs):
+    print("Build summary:")
+    for job in jobs:
+        details = []
+        for kind, builds in (('built', job.successful),
+                             ('failed', job.failures),
+                             ('cancelled', job.cancelled),
+                             ('not downloaded', job.not_downloaded)):
+            if len(builds):
+                details.append('{}: {}'.format(kind, ', '.join(
+                    job.build_arches[b] for b in builds)))
+        print("  {}: {}{}".format(job.snap_name, job.status(),
+                                  ' (' + '; '.join(details) + ')'
+                                  if len(details) else ''))
+
+
+def main(argv):
+    args = parseargs(argv)
+
+    results_dir = os.path.join(os.getcwd(), "results")
+    url_pool = transport.get_transport()
+
+    if args['results_dir']:
+        results_dir = args['results_dir']
+
+    jobs = []
+    if len(args['spec']):
+        for spec in args['spec']:
+            try:
+                opts = parse_spec(spec, args)
+            except ValueError as ex:
+                print("ERROR: {}".format(ex))
+                sys.exit(1)
+            if opts['snap'] in [job.snap_name for job in jobs]:
+                print("ERROR: {} snap specified more than once".format(
+                    opts['snap']))
+                sys.exit(1)
+            jobs.append(SnapBuildJob.from_options(
+                opts, os.path.join(results_dir, opts['snap'])))
+    else:
+        base = 'core'
+        if 'base' in args:
+            base = args['base']
+        jobs.append(SnapBuildJob(args['snap'], args['git_repo'],
+                                 args['git_repo_branch'], base,
+                                 args['architectures'], results_dir))
+
+    creds = os.environ["LP_CREDENTIALS"]
+    if creds == "":
+        print("ERROR: LP_CREDENTIALS is empty")
+        sys.exit(1)
+    launchpad = lp_client.AsyncLaunchpad(
+        lp_client.Credentials.from_string(creds))
+
+    return asyncio.run(run_jobs(launchpad, jobs, url_pool, args, results_dir))
+
+
+async def run_jobs(launchpad, jobs, url_pool, args, results_dir):
+    team, primary_archive = await asyncio.gather(
+        launchpad.load('~snappy-hwe-team'),
+        launchpad.named_get('ubuntu', 'getArchive', name='primary'))
+    series = sorted(set(job.series for job in jobs))
+    releases = dict(zip(series, await asyncio.gather(
+        *[launchpad.named_get('ubuntu', 'getSeries', name_or_version=s)
+          for s in series])))
+
+    setups = await asyncio.gather(
+        *[setup_job(launchpad, team, releases[job.series], job)
+          for job in jobs], return_exceptions=True)
+    if not all(ok is True for ok in setups):
+        for ok in setups:
+            if isinstance(ok, Exception):
+                print("ERROR: {}".format(ok))
+        await asyncio.gather(*[launchpad.delete_snap(job.snap)
+                               for job in jobs
+                               if job.ephemeral_build and
+                               job.snap is not None])
         sys.exit(1)
 
     # Add a big fat warning that we don't really care about fixing things when
@@ -190,157 +660,40 @@ def main(argv):
     stamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     print("Trying to trigger builds at: {}".format(stamp))
 
-    # sometimes we see error such as "u'Unknown architecture lpia for ubuntu
-    # xenial'" and in order to workaround let's validate the arches agains set
-    # of valid architectures that the snap can choose from
+    # We will now trigger a build for each whitelisted architecture of each
+    # snap, collect the build job url and the wait for all builds to finish
+    # and collect their results to vote for a successful or failed build.
+    requests = []
+    for job in jobs:
+        snapcraft_channel = args.get('snapcraft_channel', '')
+        if not snapcraft_channel:
+            snapcraft_channel = get_snapcraft_channel(job.series)
+        print("Will build {} using snapcraft from channel: {}".format(
+            job.snap_name, snapcraft_channel))
+        requests.append(request_builds(launchpad, job, releases[job.series],
+                                       primary_archive, snapcraft_channel))
+    await asyncio.gather(*requests)
 
-    # We will now trigger a build for each whitelisted architecture, collect
-    # the build job url and the wait for all builds to finish and collect their
-    # results to vote for a successful or failed build.
-    triggered_builds = []
-    triggered_build_urls = {}
-    valid_arches = ['armhf', 'i386', 'amd64', 'arm64',
-                    's390x', 'powerpc', 'ppc64el', 'riscv64']
-    snapcraft_channel = args.get('snapcraft_channel', '')
-    if not snapcraft_channel:
-        if series == "xenial":
-            snapcraft_channel = "4.x/stable"
-        elif series == "bionic":
-            # 6.0 onwards does not support i386, that we publish for core18
-            snapcraft_channel = "5.x/stable"
-        elif series == "resolute":
-            # XXX temporary workaround!! remove as soon as a snapcraft with
-            # full support for core26 is released.
-            snapcraft_channel = "latest/edge/early-core26"
-        else:
-            snapcraft_channel = "latest/stable"
-    print("Will build using snapcraft from channel: {}".format(
-        snapcraft_channel))
-
-    for build_arch in arches:
-        # sometimes we see error such as "u'Unknown architecture lpia for
-        # ubuntu xenial'" and in order to workaround let's validate the arches
-        # agains set of valid architectures that the snap can choose from
-        if build_arch not in valid_arches:
-            print("WARNING: Can't build snap for architecture {} as it is "
-                  "not enabled in the build job".format(args["snap"]))
-            continue
+    await poll_builds(launchpad, jobs)
 
-        arch = release.getDistroArchSeries(archtag=build_arch)
-        request = snap.requestBuild(archive=primary_archive,
-                                    channels={"snapcraft":
-                                              snapcraft_channel},
-                                    distro_arch_series=arch,
-                                    pocket='Updates',
-                                    snap_base='/+snap-bases/'+base)
-        build_id = str(request).rsplit('/', 1)[-1]
-        triggered_builds.append(build_id)
-        triggered_build_urls[build_id] = request.self_link
-        print("Arch: {} is building under: {}".format(build_arch,
-                                                      request.self_link))
-
-    failures = []
-    successful = []
-    while len(triggered_builds):
-        tmp_builds = triggered_builds[:]
-        for build in tmp_builds:
-            try:
-                response = snap.getBuildSummaries(build_ids=[build])
-            except Exception as ex:
-                print("Could not get response for {} "
-                      "(was there an LP timeout?): {}".format(build, ex))
-                continue
-            status = response["builds"][build]["status"]
-            if status == "FULLYBUILT":
-                successful.append(build)
-                triggered_builds.remove(build)
-                continue
-            elif status == "FAILEDTOBUILD":
-                failures.append(build)
-                triggered_builds.remove(build)
-                continue
-            elif status == "CANCELLED":
-                print("INFO: {} snap build was canceled for id: {}".format(
-                    args["snap"], build))
-                triggered_builds.remove(build)
-                continue
+    for job in jobs:
+        await report_failures(launchpad, job, url_pool, args, stamp)
+        await report_successes(launchpad, job, url_pool, args, stamp)
 
-        if len(triggered_builds) > 0:
-            time.sleep(60)
+    # Fetch build results for successful builds and store those in the
+    # output directory so that the caller can reuse them.
+    await asyncio.gather(*[download_build(launchpad, job, build)
+                           for job in jobs for build in job.successful])
 
-    if len(failures):
-        for failure in failures:
-            try:
-                response = snap.getBuildSummaries(build_ids=[failure])
-            except Exception as ex:
-                print("Could not get failure data for {} "
-                      "(was there an LP timeout?): {}".format(failure, ex))
-                continue
+    await write_timings(launchpad, jobs, results_dir)
 
-            if failure not in response["builds"]:
-                print("Launchpad didn't returned us the snap build "
-                      "summary we ask it for!?")
-                continue
+    await asyncio.gather(*[launchpad.delete_snap(job.snap) for job in jobs
+                           if job.ephemeral_build])
+
+    if len(jobs) > 1:
+        print_summary(jobs)
 
-            build_summary = response["builds"][failure]
-            arch = 'unknown'
-            buildlog = None
-            if 'build_log_url' in build_summary:
-                buildlog = build_summary['build_log_url']
-
-            if buildlog is not None and len(buildlog) > 0:
-                parts = arch = str(buildlog).split('_')
-                if len(parts) >= 4:
-                    arch = parts[4]
-            elif buildlog is None:
-                buildlog = 'not available'
-
-            print("INFO: {} snap {} build at {} failed for id: {} log: {}".
-                  format(args["snap"], arch, stamp, failure, buildlog))
-
-            # For ephermal builds we need to print out the log file as it will
-            # be gone after the launchpad build is removed.
-            if ephemeral_build and buildlog is not None:
-                response = url_pool.request('GET', buildlog)
-                log_data = zlib.decompress(response.data, 16+zlib.MAX_WBITS)
-                print(log_data.decode("utf-8"))
-
-    # Fetch build results for successful builds and store those in the output
-    # directory so that the caller can reuse them.
-    if len(successful):
-        for success in successful:
-            # Print build logs only if there were no failures, to avoid
-            # too much noise.
-            if len(failures) == 0:
-                try:
-                    response = snap.getBuildSummaries(build_ids=[success])
-                    build_summary = response["builds"][success]
-                    if 'build_log_url' in build_summary:
-                        buildlog = build_summary['build_log_url']
-                        print("INFO: {} snap build at {} successful "
-                              "for id: {} log: {}".
-                              format(args["snap"], stamp, success, buildlog))
-                        if ephemeral_build and buildlog is not None:
-                            log_gz = url_pool.request('GET', buildlog)
-                            log_data = zlib.decompress(log_gz.data,
-                                                       16+zlib.MAX_WBITS)
-                            print(log_data.decode("utf-8"))
-                except Exception as ex:
-                    print("Could not get build summary for {} "
-                          "(was there an LP timeout?): {}".format(success, ex))
-
-            # attempt to download the file
-            downloaded = se_utils.download_snap_build(
-                launchpad, triggered_build_urls[success],
-                results_dir)
-            if not downloaded:
-                print("WARNING: Could not download snap build for id: {}".
-                      format(success))
-
-    if ephemeral_build:
-        snap.lp_delete()
-
-    if len(failures):
+    if any(job.status() == 'failed' for job in jobs):
         # Let the build fail as at least a single snap has failed to build
         sys.exit(1)
 
@@ -21,7 +21,13 @@
 # the manifest so we do not get unneeded CVE notifications from the
 # store.
 
+import fnmatch
+import os
+import re
 import sys
+import tempfile
+import yaml
+from tools import yaml_stream
 from tools import yaml_utils
 
 
@@ -29,47 +35,140 @@ def eprint(*args, **kwargs):
     print(*args, file=sys.stderr, **kwargs)
 
 
-def remove_from_staged(pkg_list_path, manifest_path, out_manifest_path):
+# Matches package names against the entries of a package list file. Each
+# line of the file can be:
+#   - a package name
+#   - a glob pattern, like libfoo*
+#   - a regular expression prefixed by 're:', like re:lib(foo|bar)[0-9]+
+# Empty lines and lines starting with '#' are ignored. Names are looked up in
+# a set, and all patterns are compiled into a single regular expression.
+class PackageMatcher():
+    def __init__(self, entries):
+        self.names = set()
+        patterns = []
+        for entry in entries:
+            entry = entry.strip()
+            if entry == '' or entry.startswith('#'):
+                continue
+            if entry.startswith('re:'):
+                patterns.append('(?:' + entry[len('re:'):] + ')')
+            elif any(c in entry for c in '*?['):
+                patterns.append(fnmatch.translate(entry))
+            else:
+                self.names.add(entry)
+        self.regex = None
+        if len(patterns) > 0:
+            self.regex = re.compile('|'.join(patterns))
+
+    def __call__(self, pkg_name):
+        if pkg_name in self.names:
+            return True
+        return self.regex is not None and \
+            self.regex.fullmatch(pkg_name) is not None
+
+
+def load_pkg_list(pkg_list_path):
     try:
         with open(pkg_list_path) as pkg_list_f:
             pkg_list = pkg_list_f.read().splitlines()
     except FileNotFoundError:
         print(pkg_list_path, 'not found, just copying manifest')
         pkg_list = []
-
+    return PackageMatcher(pkg_list)
+
+
+# Calls write() with a temporary file in the directory of out_path, which
+# then replaces out_path. If write() fails the temporary file is removed and
+# out_path is not touched, so it can be the path of the input.
+def write_replacing(out_path, write):
+    # Same permissions as files created with open()
+    umask = os.umask(0)
+    os.umask(umask)
+    out_d = os.path.dirname(out_path) or '.'
+    with tempfile.NamedTemporaryFile(
+            'w', dir=out_d, prefix=os.path.basename(out_path) + '.',
+            delete=False) as out_f:
+        try:
+            write(out_f)
+        except BaseException:
+            out_f.close()
+            os.unlink(out_f.name)
+            raise
+    os.chmod(out_f.name, 0o666 & ~umask)
+    os.replace(out_f.name, out_path)
+
+
+def remove_from_staged_full(manifest_path, out_manifest_path, matcher):
     # We use snapcraft's yaml_utils so output looks the same as snapcraft's
     # and we can easily compare files.
-    manifest_y = yaml_utils.load_yaml_file(manifest_path)
+    manifest_y = yaml_utils.load_yaml_file(manifest_path, fast=True)
 
     # Loop looking for staged-packages per part, and removing packages
     # as requested.
     for part, part_y in manifest_y['parts'].items():
-        aux_pkg = part_y['stage-packages'][:]
-        for pkg in aux_pkg:
-            # package_name=version
-            pkg_data = pkg.split('=')
-            if pkg_data[0] in pkg_list:
-                part_y['stage-packages'].remove(pkg)
+        # package_name=version
+        part_y['stage-packages'] = [
+            pkg for pkg in part_y['stage-packages']
+            if not matcher(pkg.split('=')[0])]
+
+    def write(out_manifest_f):
+        yaml_utils.dump(manifest_y, stream=out_manifest_f, fast=True)
+
+    write_replacing(out_manifest_path, write)
+
 
-    with open(out_manifest_path, 'w') as out_manifest_f:
-        yaml_utils.dump(manifest_y, stream=out_manifest_f)
+# The manifest is rewritten while it is parsed, without building the
+# document, which produces the same output as remove_from_staged_full().
+# Manifests that cannot be streamed, or that have errors, go through
+# remove_from_staged_full(). The output is written to a temporary file that
+# replaces out_manifest_path only when complete, so the partial output of
+# the streaming rewrite is discarded, and out_manifest_path can be the same
+# as manifest_path.
+def remove_from_staged(pkg_list_path, manifest_path, out_manifest_path,
+                       matcher=None):
+    if matcher is None:
+        matcher = load_pkg_list(pkg_list_path)
+
+    def write(out_manifest_f):
+        yaml_stream.rewrite_manifest(manifest_path, out_manifest_f, matcher)
+
+    try:
+        write_replacing(out_manifest_path, write)
+        return
+    except (yaml_stream.StreamingNotSupported, yaml.YAMLError) as ex:
+        eprint(manifest_path + ':', 'cannot stream manifest (' + str(ex) +
+               '), loading it')
+    remove_from_staged_full(manifest_path, out_manifest_path, matcher)
+
+
+# Process many manifests in one run, usually the manifests of all the
+# architectures of a snap. Package lists are loaded once per path.
+# jobs: list of (pkg_list_path, manifest_path, out_manifest_path)
+def remove_from_staged_bulk(jobs):
+    matchers = {}
+    for pkg_list_path, manifest_path, out_manifest_path in jobs:
+        if pkg_list_path not in matchers:
+            matchers[pkg_list_path] = load_pkg_list(pkg_list_path)
+        remove_from_staged(pkg_list_path, manifest_path, out_manifest_path,
+                           matchers[pkg_list_path])
 
 
 def main(argv=None):
     if argv is None:
         argv = sys.argv[1:]
 
-    if len(argv) != 3:
+    if len(argv) == 0 or len(argv) % 3 != 0:
         eprint('Usage:', sys.argv[0], '<pkg_list_file> ' +
-               '<manifest> <output_manifest>\n' +
+               '<manifest> <output_manifest> ' +
+               '[<pkg_list_file> <manifest> <output_manifest>...]\n' +
                'where <pkg_list_file> is a file with a list of the packages ' +
-               'to remove from stage-packages, one per line.')
+               'to remove from stage-packages, one per line. Lines can be ' +
+               'package names, glob patterns, or regular expressions ' +
+               'prefixed by "re:".')
         return 1
-    pkg_list_path = argv[0]
-    manifest_path = argv[1]
-    out_manifest_path = argv[2]
 
-    remove_from_staged(pkg_list_path, manifest_path, out_manifest_path)
+    remove_from_staged_bulk([tuple(argv[i:i + 3])
+                             for i in range(0, len(argv), 3)])
 
     return 0
 
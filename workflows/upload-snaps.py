@@ -0,0 +1,141 @@
+#!/usr/bin/python3
+#
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Script that uploads snaps to the store, and optionally releases them, with
+# 'snapcraft upload' for all of them at the same time. The number of uploads
+# running at once can be set with the SNAP_UPLOAD_WORKERS environment
+# variable. The output of each upload is printed prefixed with the file
+# name. All snaps are uploaded even if some fail, as failures usually come
+# from the store review and we want all arches there to ask for approval.
+# A summary with the result, upload speed and review time of each file is
+# printed at the end, and the script returns 1 if any upload failed.
+
+import argparse
+import concurrent.futures
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import namedtuple
+
+DEFAULT_UPLOAD_WORKERS = 4
+
+# snapcraft messages once the file has been sent and the store is processing
+# and reviewing it
+REVIEW_RE = re.compile(r'checking status|processing|waiting for',
+                       re.IGNORECASE)
+REVISION_RE = re.compile(r'\bRevision (\d+)')
+
+# upload_s is the time spent sending the file and review_s the time waiting
+# for the store after that, None if snapcraft did not tell us when the
+# review started.
+UploadResult = namedtuple('UploadResult',
+                          'snap_p size returncode revision upload_s review_s')
+
+print_lock = threading.Lock()
+
+
+def get_upload_workers():
+    return int(os.environ.get('SNAP_UPLOAD_WORKERS', DEFAULT_UPLOAD_WORKERS))
+
+
+def log(snap_p, text):
+    with print_lock:
+        print('[{}] {}'.format(os.path.basename(snap_p), text), flush=True)
+
+
+def upload(snap_p, channels):
+    cmd = ['snapcraft', 'upload', snap_p]
+    if channels:
+        cmd += ['--release', channels]
+    size = os.path.getsize(snap_p)
+    revision = None
+    review_start = None
+    start = time.monotonic()
+    log(snap_p, 'Running ' + ' '.join(cmd))
+    try:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT, text=True,
+                                errors='replace')
+    except OSError as ex:
+        log(snap_p, 'ERROR: cannot run snapcraft: {}'.format(ex))
+        return UploadResult(snap_p, size, None, None, 0, None)
+    with proc:
+        for line in proc.stdout:
+            if review_start is None and REVIEW_RE.search(line):
+                review_start = time.monotonic()
+            match = REVISION_RE.search(line)
+            if match:
+                revision = int(match.group(1))
+            # Print only the final state of progress bars
+            text = line.rstrip('\n').split('\r')[-1]
+            if text.strip():
+                log(snap_p, text)
+    end = time.monotonic()
+    if review_start is None:
+        return UploadResult(snap_p, size, proc.returncode, revision,
+                            end - start, None)
+    return UploadResult(snap_p, size, proc.returncode, revision,
+                        review_start - start, end - review_start)
+
+
+def print_summary(results):
+    print('{:<40} {:<11} {:>8} {:>10} {:>9} {:>8} {:>9}'.format(
+        'snap', 'result', 'revision', 'size (MiB)', 'upload', 'MiB/s',
+        'review'))
+    for r in results:
+        if r.returncode == 0:
+            result = 'ok'
+        elif r.returncode is None:
+            result = 'error'
+        else:
+            result = 'failed ({})'.format(r.returncode)
+        size_mib = r.size / (1024 * 1024)
+        speed = size_mib / r.upload_s if r.upload_s > 0 else 0
+        print('{:<40} {:<11} {:>8} {:>10.1f} {:>8.1f}s {:>8.2f} {:>9}'.format(
+            os.path.basename(r.snap_p), result,
+            r.revision if r.revision is not None else '-', size_mib,
+            r.upload_s, speed,
+            '{:.1f}s'.format(r.review_s) if r.review_s is not None else '-'))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Upload snaps to the store concurrently')
+    parser.add_argument('--release', metavar='CHANNELS',
+                        help='comma separated channels to release to')
+    parser.add_argument('snaps', nargs='+')
+    args = parser.parse_args()
+
+    with concurrent.futures.ThreadPoolExecutor(
+            get_upload_workers()) as executor:
+        # Results are in the order of the arguments
+        results = list(executor.map(lambda p: upload(p, args.release),
+                                    args.snaps))
+
+    print_summary(results)
+    failed = [r for r in results if r.returncode != 0]
+    if len(failed) > 0:
+        print('ERROR: {} of {} uploads failed'.format(
+            len(failed), len(results)), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())